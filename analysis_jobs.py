@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Background Analysis Jobs
+Bounded worker pool that runs analyses off the Flask request threads
+"""
+
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its configured depth"""
+
+
+class AnalysisJob:
+    """A single queued analysis request and its outcome"""
+
+    def __init__(self, query: str, key: Optional[str] = None, deadline: Optional[float] = None):
+        self.job_id = uuid.uuid4().hex
+        self.query = query
+        self.key = key
+        self.deadline = deadline  # time.time() by which the result is needed, counted from submission
+        self.status = 'queued'
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        
+        # Progress events for streaming clients; closed once the job has finished
+        self.events = []
+        self._events_closed = False
+        self._events_changed = threading.Condition()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        """
+        Serialize the job for the API
+
+        Args:
+            include_result (bool): Include the analysis result once the job has finished
+
+        Returns:
+            Dict: JSON-serializable job description
+        """
+        job = {
+            'job_id': self.job_id,
+            'query': self.query,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'status_url': f'/api/jobs/{self.job_id}'
+        }
+        if self.error:
+            job['error'] = self.error
+        if include_result and self.is_finished:
+            job['result'] = self.result
+        return job
+
+    def add_event(self, event: str, data: Optional[Dict] = None):
+        """
+        Record a progress event and wake up any streaming clients
+
+        Args:
+            event (str): Event name (e.g. "tool_started")
+            data (Dict): JSON-serializable event payload
+        """
+        with self._events_changed:
+            self.events.append({'event': event, 'data': data or {}})
+            self._events_changed.notify_all()
+
+    def finish(self, status: str):
+        """Mark the job finished and publish the final event with the full job payload"""
+        self.finished_at = datetime.now()
+        self.status = status
+        with self._events_changed:
+            self.events.append({'event': status, 'data': self.to_dict()})
+            self._events_closed = True
+            self._events_changed.notify_all()
+
+    def iter_events(self, heartbeat: float = 15.0) -> Iterator[Optional[Dict]]:
+        """
+        Yield progress events from the start of the job until it finishes
+
+        Args:
+            heartbeat (float): Seconds to wait for a new event before yielding None
+                so the caller can send a keep-alive
+
+        Yields:
+            Optional[Dict]: {"event": ..., "data": ...} or None on heartbeat
+        """
+        index = 0
+        while True:
+            with self._events_changed:
+                if index >= len(self.events) and not self._events_closed:
+                    self._events_changed.wait(timeout=heartbeat)
+                pending = self.events[index:]
+                closed = self._events_closed
+
+            index += len(pending)
+            if not pending and not closed:
+                yield None
+            for event in pending:
+                yield event
+            if closed and index >= len(self.events):
+                return
+
+
+class AnalysisJobManager:
+    def __init__(self, runner: Callable[[str, Callable, Optional[float]], Optional[Dict]], max_workers: int = 4,
+                 max_queue_depth: int = 20, job_ttl: int = 3600, job_deadline: Optional[float] = None,
+                 on_complete: Optional[Callable[[AnalysisJob], None]] = None,
+                 on_failure: Optional[Callable[[AnalysisJob], Optional[Dict]]] = None):
+        """
+        Initialize the job manager
+
+        Args:
+            runner (Callable): Function that runs an analysis for a query and returns
+                the result dict, or None if the analysis failed. It is called with the
+                query, a progress callback taking (event, data) and the job deadline
+            max_workers (int): Number of analyses that may run concurrently
+            max_queue_depth (int): Maximum number of jobs waiting for a free worker
+            job_ttl (int): Seconds to keep finished jobs available for polling
+            job_deadline (float): Seconds from submission by which a job should produce its
+                answer (time spent queued counts); None for no deadline
+            on_complete (Callable): Called with the job after a successful run
+            on_failure (Callable): Called with the job after a failed run; its return
+                value (if any) is stored as the job result
+        """
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.job_ttl = job_ttl
+        self.job_deadline = job_deadline
+        self.on_complete = on_complete
+        self.on_failure = on_failure
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-worker')
+        self.jobs: Dict[str, AnalysisJob] = {}
+        self.lock = threading.Lock()
+        
+        # Unfinished jobs by coalescing key, so identical concurrent queries share a run
+        self.in_flight: Dict[str, AnalysisJob] = {}
+        self.coalesced = 0
+
+    def submit(self, query: str, key: Optional[str] = None) -> AnalysisJob:
+        """
+        Queue an analysis job, or attach to the unfinished job with the same key
+
+        Args:
+            query (str): User query to analyze
+            key (str): Coalescing key (e.g. the normalized query); None never coalesces
+
+        Returns:
+            AnalysisJob: The queued job, or the in-flight job it was coalesced with
+
+        Raises:
+            QueueFullError: If max_queue_depth jobs are already waiting
+        """
+        with self.lock:
+            self._prune_finished_jobs()
+
+            existing = self.in_flight.get(key) if key is not None else None
+            if existing and not existing.is_finished:
+                self.coalesced += 1
+                logger.info(f"Coalesced query with in-flight job {existing.job_id}: {query}")
+                return existing
+
+            queued = sum(1 for job in self.jobs.values() if job.status == 'queued')
+            if queued >= self.max_queue_depth:
+                raise QueueFullError(f"Analysis queue is full ({queued} jobs waiting)")
+
+            deadline = time.time() + self.job_deadline if self.job_deadline else None
+            job = AnalysisJob(query, key, deadline)
+            self.jobs[job.job_id] = job
+            if key is not None:
+                self.in_flight[key] = job
+
+        self.executor.submit(self._run_job, job)
+        logger.info(f"Queued analysis job {job.job_id}: {query}")
+        return job
+
+    def add_completed(self, query: str, result: Dict) -> AnalysisJob:
+        """
+        Register an already-available result (e.g. a cache hit) as a finished job
+
+        Args:
+            query (str): User query
+            result (Dict): Analysis result
+
+        Returns:
+            AnalysisJob: The completed job
+        """
+        job = AnalysisJob(query)
+        job.started_at = datetime.now()
+        job.result = result
+        job.finish('completed')
+
+        with self.lock:
+            self._prune_finished_jobs()
+            self.jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        """Return the job with the given id, if it is still known"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        """Return worker pool and queue statistics"""
+        with self.lock:
+            counts = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0}
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            coalesced = self.coalesced
+        return {
+            'max_workers': self.max_workers,
+            'max_queue_depth': self.max_queue_depth,
+            'jobs': counts,
+            'coalesced': coalesced
+        }
+
+    def _run_job(self, job: AnalysisJob):
+        """Worker entry point"""
+        job.status = 'running'
+        job.started_at = datetime.now()
+        job.add_event('started', {'job_id': job.job_id})
+        start_time = time.perf_counter()
+
+        try:
+            try:
+                result = self.runner(job.query, job.add_event, job.deadline)
+            except Exception as e:
+                logger.error(f"Analysis job {job.job_id} raised: {e}")
+                job.error = str(e)
+                result = None
+
+            if result:
+                job.result = result
+                if self.on_complete:
+                    try:
+                        self.on_complete(job)
+                    except Exception as e:
+                        logger.error(f"Completion callback failed for job {job.job_id}: {e}")
+                job.finish('completed')
+            else:
+                job.error = job.error or 'Analysis failed'
+                if self.on_failure:
+                    try:
+                        job.result = self.on_failure(job)
+                    except Exception as e:
+                        logger.error(f"Failure callback failed for job {job.job_id}: {e}")
+                job.finish('failed')
+        finally:
+            # Never leave a job unfinished or attachable, or pollers and identical queries wait on it forever
+            if not job.is_finished:
+                job.error = job.error or 'Analysis failed'
+                job.finish('failed')
+            with self.lock:
+                if job.key is not None and self.in_flight.get(job.key) is job:
+                    del self.in_flight[job.key]
+
+        logger.info(f"Analysis job {job.job_id} {job.status} in {time.perf_counter() - start_time:.1f}s")
+
+    def _prune_finished_jobs(self):
+        """Drop finished jobs older than job_ttl (caller must hold the lock)"""
+        now = datetime.now()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.is_finished and (now - job.finished_at).total_seconds() > self.job_ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def shutdown(self, wait: bool = False):
+        """Stop accepting work and shut down the worker pool"""
+        self.executor.shutdown(wait=wait)
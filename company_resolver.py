@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Company Resolver
+Index of every company name, ticker, file name and CIK the tools know about, built
+once per process so resolving a company is a dictionary or trie lookup instead of a
+glob and fuzzy match per query
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+
+# File name suffixes of the per-company JSON files, by folder
+FILE_SUFFIXES = {'10k': '_10k', '8k': '_8k', 'form4': '_form4'}
+
+CORPORATE_SUFFIXES = {'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'ltd', 'limited',
+                      'llc', 'plc', 'the'}
+FILING_NAME_PATTERN = re.compile(r'^output_(\d{10})_\d{2}_\d+')
+MIN_PREFIX_LENGTH = 3
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a company name for lookup
+
+    "JPMorgan Chase & Co.", "JPMORGAN_CHASE_&_CO" and "jpmorgan chase and co" all
+    become "jpmorgan chase and".
+    """
+    text = re.sub(r'[^a-z0-9]+', ' ', name.lower().replace('&', ' and '))
+    words = [word for word in text.split() if word not in CORPORATE_SUFFIXES]
+    return ' '.join(words)
+
+
+@dataclass
+class Company:
+    """One issuer and the identifiers it is known by"""
+    key: str                      # directory/Form 4 name, e.g. "Apple_Inc"
+    name: str                     # 10-K/8-K name, e.g. "Apple Inc"
+    tickers: Set[str] = field(default_factory=set)
+    ciks: Set[str] = field(default_factory=set)
+    cik: Optional[str] = None     # most likely issuer CIK (the prefix its own 10-Ks are filed under)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'companies', 'terminal')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.companies: Set[str] = set()   # companies with an alias passing through this node
+        self.terminal: Set[str] = set()    # companies with an alias ending here
+
+
+class CompanyResolver:
+    """Resolves free-form company names, tickers and CIKs to a Company"""
+
+    def __init__(self, mappings_file: Optional[str] = None, data_dirs: Optional[Dict[str, str]] = None,
+                 companies_dir: Optional[str] = None):
+        """
+        Build the index
+
+        Args:
+            mappings_file (str): Path to company_mappings.json
+            data_dirs (Dict[str, str]): Folders of per-company JSON files by kind ("10k", "8k",
+                "form4"); defaults to gemini_10k, gemini_8k and gemini_form4
+            companies_dir (str): Raw filings folder (default proto-3/companies) whose
+                output_<CIK>_<yy>_<seq>.txt names supply CIKs
+        """
+        self.mappings_file = Path(mappings_file) if mappings_file else BASE_DIR / 'company_mappings.json'
+        self.data_dirs = {kind: Path(folder) for kind, folder in (data_dirs or {
+            '10k': BASE_DIR / 'gemini_10k', '8k': BASE_DIR / 'gemini_8k', 'form4': BASE_DIR / 'gemini_form4'
+        }).items()}
+        self.companies_dir = Path(companies_dir) if companies_dir else BASE_DIR / 'proto-3' / 'companies'
+
+        self.companies: Dict[str, Company] = {}
+        self._aliases: Dict[str, Optional[str]] = {}  # normalized alias -> company key (None if ambiguous)
+        self._keyword_forms: Set[str] = set()           # aliases that come only from keywords
+        self._tickers: Dict[str, str] = {}
+        self._ciks: Dict[str, str] = {}
+        self._trie = _TrieNode()
+        self._folder_index: Dict[Path, Tuple[float, Dict[str, Path]]] = {}
+        self._lock = threading.Lock()
+
+        self._load_mappings()
+        for kind, folder in self.data_dirs.items():
+            self._load_data_files(kind, folder)
+        self._load_ciks()
+        for company in self.companies.values():
+            self._add_alias(company.key, company.key)
+            self._add_alias(company.name, company.key)
+
+    def resolve(self, name: str) -> Optional[Company]:
+        """
+        Resolve a company name, ticker or CIK
+
+        Tries, in order: exact alias, ticker, CIK, a unique alias starting with the
+        name ("Micro" -> Microsoft) and the longest alias the name starts with
+        ("Apple Inc. annual report" -> Apple).
+
+        Args:
+            name (str): Company name, ticker or CIK
+
+        Returns:
+            Optional[Company]: The company, or None if unknown or ambiguous
+        """
+        if not name:
+            return None
+        stripped = name.strip()
+
+        key = self._tickers.get(stripped.upper())
+        if key is None and stripped.isdigit():
+            key = self._ciks.get(stripped.lstrip('0'))
+        if key is None:
+            normalized = normalize_name(stripped)
+            key = self._aliases.get(normalized)
+            if key is None and normalized not in self._aliases:
+                key = self._aliases.get(normalized.replace(' ', ''))
+            if key is None and normalized not in self._aliases:
+                key = self._match_prefix(normalized) or self._match_longest_alias(normalized)
+        return self.companies.get(key) if key else None
+
+    def complete(self, prefix: str) -> List[Company]:
+        """Return every company with an alias starting with prefix"""
+        node = self._walk(normalize_name(prefix))
+        if node is None:
+            return []
+        return [self.companies[key] for key in sorted(node.companies)]
+
+    def find_file(self, name: str, folder, kind: str) -> Optional[Path]:
+        """
+        Find a company's JSON file in a data folder
+
+        Args:
+            name (str): Company name, ticker or CIK
+            folder: Folder of per-company JSON files
+            kind (str): "10k", "8k" or "form4"
+
+        Returns:
+            Optional[Path]: Path to the company's file, if the folder has one
+        """
+        company = self.resolve(name)
+        if company is None:
+            return None
+        return self._files_in(Path(folder), kind).get(company.key)
+
+    def key_for_file(self, path, kind: str) -> str:
+        """Company key for a data file, or its stem if the company is unknown"""
+        stem = self._key_from_file(Path(path).stem, kind)
+        company = self.resolve(stem)
+        return company.key if company else stem
+
+    def _files_in(self, folder: Path, kind: str) -> Dict[str, Path]:
+        """Company key -> file for a folder, re-read only when the folder changes"""
+        try:
+            mtime = folder.stat().st_mtime
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._folder_index.get(folder)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        files = {}
+        suffix = FILE_SUFFIXES.get(kind, '')
+        for path in folder.glob('*.json'):
+            stem = path.stem[:-len(suffix)] if suffix and path.stem.endswith(suffix) else path.stem
+            company = self.resolve(stem)
+            if company:
+                files.setdefault(company.key, path)
+        with self._lock:
+            self._folder_index[folder] = (mtime, files)
+        return files
+
+    def _company(self, key: str, name: Optional[str] = None) -> Company:
+        company = self.companies.get(key)
+        if company is None:
+            company = self.companies[key] = Company(key=key, name=name or key.replace('_', ' '))
+        elif name:
+            company.name = name
+        return company
+
+    def _load_mappings(self):
+        try:
+            with open(self.mappings_file, 'r', encoding='utf-8') as f:
+                mappings = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Company mappings unavailable ({self.mappings_file}): {e}")
+            return
+
+        keyword_aliases = []
+        for short_name, info in mappings.get('keyword_detection', {}).items():
+            key = info.get('form4_name', short_name)
+            company = self._company(key, info.get('10k_name'))
+            self._add_alias(short_name, key)
+            names = {short_name.lower(), company.name.lower()}
+            ticker = info.get('ticker', '').upper()
+            if ticker:
+                company.tickers.add(ticker)
+                self._tickers[ticker] = key
+            for keyword in info.get('keywords', []):
+                # Only the listed ticker resolves as one; other keywords, capitalized or not
+                # ("Facebook", "J&J", "GPU", "Tim Cook"), resolve too, but only in full
+                if keyword.upper() == ticker:
+                    continue
+                if keyword.lower() in names:
+                    self._add_alias(keyword, key)
+                else:
+                    keyword_aliases.append((keyword, key))
+
+        file_mappings = mappings.get('company_name_mappings', {})
+        for kind, section in (('10k', '10k_files'), ('8k', '8k_files'), ('form4', 'form4_files')):
+            for name, file_name in file_mappings.get(section, {}).items():
+                key = self._key_from_file(Path(file_name).stem, kind)
+                self._company(key, None if kind == 'form4' else name)
+                self._add_alias(name, key)
+
+        # Added last so a keyword never makes another company's name ambiguous
+        for keyword, key in keyword_aliases:
+            self._add_alias(keyword, key, keyword=True)
+
+    def _load_data_files(self, kind: str, folder: Path):
+        if not folder.exists():
+            return
+        for path in folder.glob('*.json'):
+            key = self._key_from_file(path.stem, kind)
+            known = self.resolve(key)
+            self._company(known.key if known else key)
+
+    def _load_ciks(self):
+        """
+        Collect CIKs from raw filing names
+
+        Filing names carry the accession prefix, which is the issuer's CIK for self-filed
+        documents but a filing agent's for the rest; prefixes seen under more than one
+        company are agents and are skipped.
+        """
+        if not self.companies_dir.exists():
+            return
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        annual: Dict[str, Counter] = defaultdict(Counter)
+        owners: Dict[str, Set[str]] = defaultdict(set)
+        for company_dir in self.companies_dir.iterdir():
+            if not company_dir.is_dir():
+                continue
+            known = self.resolve(company_dir.name)
+            key = known.key if known else self._company(company_dir.name).key
+            for root, _, files in os.walk(company_dir):
+                form = os.path.basename(root)
+                for file_name in files:
+                    match = FILING_NAME_PATTERN.match(file_name)
+                    if not match:
+                        continue
+                    cik = match.group(1).lstrip('0')
+                    counts[key][cik] += 1
+                    owners[cik].add(key)
+                    if form == '10-K':
+                        annual[key][cik] += 1
+
+        for key, prefixes in counts.items():
+            company = self.companies[key]
+            company.ciks = {cik for cik in prefixes if len(owners[cik]) == 1}
+            for cik in company.ciks:
+                self._ciks[cik] = key
+            ranked = [cik for cik, _ in (annual[key] or prefixes).most_common() if cik in company.ciks]
+            company.cik = ranked[0] if ranked else None
+
+    @staticmethod
+    def _key_from_file(stem: str, kind: str) -> str:
+        suffix = FILE_SUFFIXES.get(kind, '')
+        return stem[:-len(suffix)] if suffix and stem.endswith(suffix) else stem
+
+    def _add_alias(self, alias: str, key: str, keyword: bool = False):
+        """
+        Index an alias of a company
+
+        Keyword aliases (products, people, former names) match only as whole words: they
+        are left out of prefix completion, and a name of another company takes precedence.
+        A keyword shared by two companies ("healthcare") is ambiguous.
+        """
+        normalized = normalize_name(alias)
+        if not normalized:
+            return
+        for form in {normalized, normalized.replace(' ', '')}:
+            existing = self._aliases.get(form, key)
+            if keyword:
+                if existing != key and form not in self._keyword_forms:
+                    continue
+                self._keyword_forms.add(form)
+            self._aliases[form] = key if existing == key else None
+            self._insert(form, key, prefix=not keyword)
+
+    def _insert(self, alias: str, key: str, prefix: bool = True):
+        node = self._trie
+        for char in alias:
+            node = node.children.setdefault(char, _TrieNode())
+            if prefix:
+                node.companies.add(key)
+        node.terminal.add(key)
+
+    def _walk(self, text: str) -> Optional[_TrieNode]:
+        node = self._trie
+        for char in text:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def _match_prefix(self, normalized: str) -> Optional[str]:
+        """The company whose aliases are the only ones starting with the name"""
+        if len(normalized) < MIN_PREFIX_LENGTH:
+            return None
+        node = self._walk(normalized)
+        if node is not None and len(node.companies) == 1:
+            return next(iter(node.companies))
+        return None
+
+    def _match_longest_alias(self, normalized: str) -> Optional[str]:
+        """The company of the longest whole-word alias the name starts with"""
+        node = self._trie
+        match = None
+        for index, char in enumerate(normalized):
+            node = node.children.get(char)
+            if node is None:
+                break
+            at_boundary = index + 1 == len(normalized) or normalized[index + 1] == ' '
+            if at_boundary and len(node.terminal) == 1 and index + 1 >= MIN_PREFIX_LENGTH:
+                match = next(iter(node.terminal))
+        return match
+
+
+_resolver: Optional[CompanyResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> CompanyResolver:
+    """Return the process-wide resolver, building it on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = CompanyResolver()
+    return _resolver
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Context Packer
+Fits prompt content into token budgets: 10-K sections are split into paragraph chunks and
+the chunks most relevant to the query are kept in document order, and the tool analyses
+given to the synthesis step share one budget, each compressed to its top sentences
+"""
+
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from filing_corpus import SENTENCE_END, chunk_section
+from search_index import B, K1, tokenize
+from token_counter import count_tokens
+
+DEFAULT_TOKEN_BUDGET = 8000
+RELEVANCE_FLOOR = 0.2     # chunks scoring below this fraction of the best chunk are left out
+GAP_MARKER = '[...]'
+OMITTED_MARKER = '[Omitted: not relevant to the query]'
+
+DEFAULT_SYNTHESIS_BUDGET = 6000
+MIN_SOURCE_TOKENS = 400   # every source keeps at least this much (or all of itself)
+FIGURE_WEIGHT = 0.25      # sentence score bonus for carrying a number
+LEAD_WEIGHT = 0.25        # bonus for coming early (summaries lead the tool reports)
+
+MARKDOWN_HEADING = re.compile(r'^(#{1,6})\s+\S|^\*\*[^*]+\*\*:?$')
+RULE_LINE = re.compile(r'^\s*(?:[=\-_*]\s*){3,}$')
+LIST_PREFIX = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+')
+FIGURE = re.compile(r'\d')
+
+# year -> part -> item -> content, the shape SECFormsTools.collect_sections returns
+Sections = Dict[str, Dict[str, Dict[str, object]]]
+
+
+@dataclass
+class _PackChunk:
+    year: str
+    part: str
+    item: str
+    rank: int             # position within its item
+    heading: str
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+@dataclass
+class PackingStats:
+    """What packing kept"""
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    chunks: int = 0
+    chunks_kept: int = 0
+    packed: bool = False
+    items_omitted: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            'budget': self.budget,
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+            'chunks': self.chunks,
+            'chunks_kept': self.chunks_kept,
+            'packed': self.packed,
+            'items_omitted': self.items_omitted
+        }
+
+
+def token_budget() -> int:
+    """Prompt token budget for 10-K section content (CONTEXT_TOKEN_BUDGET; 0 disables packing)"""
+    return int(os.getenv('CONTEXT_TOKEN_BUDGET', str(DEFAULT_TOKEN_BUDGET)))
+
+
+def _bm25(texts: Sequence[str], query: str) -> List[float]:
+    """BM25 of each text against the query, with idf taken from the texts themselves"""
+    query_terms = set(tokenize(query))
+    if not query_terms or not texts:
+        return [0.0] * len(texts)
+    documents = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(terms.values()) for terms in documents]
+    average_length = sum(lengths) / len(lengths) or 1
+    frequencies = Counter(term for terms in documents for term in query_terms & terms.keys())
+    idf = {term: math.log(1 + (len(texts) - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()}
+    scores = []
+    for terms, length in zip(documents, lengths):
+        norm = K1 * (1 - B + B * length / average_length)
+        scores.append(sum(idf[term] * terms[term] * (K1 + 1) / (terms[term] + norm)
+                          for term in query_terms & terms.keys()))
+    return scores
+
+
+def _score(chunks: List[_PackChunk], query: str):
+    """Score each chunk against the query"""
+    # Heading words count twice: a chunk under "Supply Chain Risks" is about the supply chain
+    texts = [f"{chunk.heading} {chunk.heading} {chunk.text}" for chunk in chunks]
+    for chunk, score in zip(chunks, _bm25(texts, query)):
+        chunk.score = score
+
+
+def _render(chunks: List[_PackChunk], indices: List[int], kept: set) -> str:
+    """Text of one item from its kept chunks, with headings and gap markers"""
+    lines, heading, previous = [], None, -1
+    for position, index in enumerate(indices):
+        if index not in kept:
+            continue
+        chunk = chunks[index]
+        if position != previous + 1:
+            lines.append(GAP_MARKER)
+        if chunk.heading and chunk.heading != heading:
+            lines.append(chunk.heading)
+            heading = chunk.heading
+        lines.append(chunk.text)
+        previous = position
+    if lines and previous != len(indices) - 1:
+        lines.append(GAP_MARKER)
+    return '\n'.join(lines)
+
+
+def pack_sections(sections: Sections, query: str, budget: Optional[int] = None) -> Tuple[Sections, PackingStats]:
+    """
+    Keep the chunks of the sections most relevant to a query, within a token budget
+
+    Sections that already fit are returned unchanged. Otherwise each text item is split
+    into paragraph chunks (filing_corpus.chunk_section) and ranked with BM25. Chunks are
+    kept best first until the budget is spent, skipping any below RELEVANCE_FLOOR of the
+    best score. If nothing matches the query, chunks are kept from the start of every
+    item in turn. Kept chunks stay in document order, each under its heading, with
+    GAP_MARKER where text was left out. Items with no chunk kept are replaced by
+    OMITTED_MARKER so the model still sees that the item exists.
+
+    Args:
+        sections (Sections): Year -> part -> item -> content
+        query (str): Enhanced user query to rank against
+        budget (int): Token budget for the content (default token_budget())
+
+    Returns:
+        Tuple[Sections, PackingStats]: Packed sections (same shape) and what was kept
+    """
+    budget = token_budget() if budget is None else budget
+    chunks: List[_PackChunk] = []
+    fixed_tokens = 0  # non-text values are passed through whole
+    for year, parts in sections.items():
+        for part, items in parts.items():
+            for item, content in items.items():
+                fixed_tokens += count_tokens(item)
+                if not isinstance(content, str):
+                    fixed_tokens += count_tokens(str(content))
+                    continue
+                for rank, chunk in enumerate(chunk_section(content)):
+                    chunks.append(_PackChunk(year, part, item, rank, chunk.heading, chunk.text,
+                                             count_tokens(chunk.text)))
+
+    tokens_before = fixed_tokens + sum(chunk.tokens for chunk in chunks)
+    stats = PackingStats(budget=budget, tokens_before=tokens_before, tokens_after=tokens_before, chunks=len(chunks))
+    if budget <= 0 or tokens_before <= budget or not chunks:
+        stats.chunks_kept = len(chunks)
+        return sections, stats
+
+    _score(chunks, query)
+    best = max(chunk.score for chunk in chunks)
+    floor = best * RELEVANCE_FLOOR if best > 0 else 0.0
+    ranked = sorted(range(len(chunks)), key=lambda index: (-chunks[index].score, chunks[index].rank, index))
+
+    kept = set()
+    used = fixed_tokens
+    shown_headings = set()
+    for index in ranked:
+        chunk = chunks[index]
+        if best > 0 and chunk.score < floor:
+            break
+        heading_key = (chunk.year, chunk.part, chunk.item, chunk.heading)
+        cost = chunk.tokens + (count_tokens(chunk.heading) if heading_key not in shown_headings else 0)
+        if used + cost > budget:
+            continue
+        kept.add(index)
+        shown_headings.add(heading_key)
+        used += cost
+
+    chunk_indices: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+    for index, chunk in enumerate(chunks):
+        chunk_indices[(chunk.year, chunk.part, chunk.item)].append(index)
+
+    packed: Sections = {}
+    for year, parts in sections.items():
+        for part, items in parts.items():
+            for item, content in items.items():
+                indices = chunk_indices.get((year, part, item))
+                if isinstance(content, str) and indices:
+                    content = _render(chunks, indices, kept)
+                    if not content:
+                        content = OMITTED_MARKER
+                        stats.items_omitted.append(f"{year} {item}")
+                packed.setdefault(year, {}).setdefault(part, {})[item] = content
+
+    stats.packed = True
+    stats.chunks_kept = len(kept)
+    stats.tokens_after = used
+    return packed, stats
+
+
+@dataclass
+class _Sentence:
+    line: int
+    text: str
+    headings: Tuple[int, ...]   # lines of the headings the sentence falls under
+    tokens: int
+    score: float = 0.0
+
+
+@dataclass
+class SourceAllocation:
+    """How much of one synthesis source was kept"""
+    relevance: float
+    tokens_before: int
+    budget: int
+    tokens_after: int
+
+    @property
+    def compressed(self) -> bool:
+        return self.tokens_after < self.tokens_before
+
+    def to_dict(self) -> Dict:
+        return {
+            'relevance': round(self.relevance, 3),
+            'tokens_before': self.tokens_before,
+            'budget': self.budget,
+            'tokens_after': self.tokens_after,
+            'compressed': self.compressed
+        }
+
+
+def synthesis_budget() -> int:
+    """Token budget shared by the synthesis sources (SYNTHESIS_TOKEN_BUDGET; 0 disables packing)"""
+    return int(os.getenv('SYNTHESIS_TOKEN_BUDGET', str(DEFAULT_SYNTHESIS_BUDGET)))
+
+
+def allocate_budget(lengths: Sequence[int], relevances: Sequence[float], budget: int,
+                    floor: int = MIN_SOURCE_TOKENS) -> List[int]:
+    """
+    Split a token budget across sources in proportion to relevance times length
+
+    Every source first gets the floor (or its whole length if shorter). The rest is shared
+    by relevance * length, and a source offered more than it needs passes the surplus on to
+    the others, so a short source is kept whole while long ones are compressed by about the
+    same ratio, less so the more relevant they are.
+
+    Args:
+        lengths (Sequence[int]): Tokens of each source
+        relevances (Sequence[float]): Relevance weight of each source (> 0)
+        budget (int): Total tokens
+        floor (int): Minimum tokens per source
+
+    Returns:
+        List[int]: Tokens allowed per source, never more than its length
+    """
+    if sum(lengths) <= budget:
+        return list(lengths)
+    floor = min(floor, budget // max(1, len(lengths)))
+    allocation = [min(length, floor) for length in lengths]
+    remaining = budget - sum(allocation)
+    active = {index for index, length in enumerate(lengths) if length > allocation[index]}
+    while active and remaining > 0:
+        weights = {index: relevances[index] * lengths[index] for index in active}
+        total = sum(weights.values()) or 1.0
+        capped = {index for index in active
+                  if remaining * weights[index] / total >= lengths[index] - allocation[index]}
+        if not capped:
+            for index in active:
+                allocation[index] += int(remaining * weights[index] / total)
+            break
+        for index in capped:
+            remaining -= lengths[index] - allocation[index]
+            allocation[index] = lengths[index]
+        active -= capped
+    return allocation
+
+
+def _sentences(text: str) -> Tuple[List[str], List[_Sentence]]:
+    """Lines of a markdown report and its sentences, each with the headings it falls under"""
+    lines = text.splitlines()
+    sentences: List[_Sentence] = []
+    stack: List[Tuple[int, int]] = []   # (heading level, line)
+    for number, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or RULE_LINE.match(stripped):
+            continue
+        heading = MARKDOWN_HEADING.match(stripped)
+        if heading:
+            level = len(heading.group(1)) if heading.group(1) else 7
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, number))
+            continue
+        under = tuple(line_number for _, line_number in stack)
+        prefix = LIST_PREFIX.match(line)
+        body = line[prefix.end():] if prefix else line
+        pieces = [body] if stripped.startswith('|') else SENTENCE_END.split(body.strip())
+        for piece in pieces:
+            if piece.strip():
+                sentences.append(_Sentence(number, piece.strip(), under, count_tokens(piece)))
+    return lines, sentences
+
+
+def compress_text(text: str, query: str, budget: int) -> str:
+    """
+    Extractive summary of a report within a token budget
+
+    The report is split into sentences (table rows and list items stay whole per sentence),
+    scored by BM25 against the query plus bonuses for carrying figures and for coming early,
+    and the best sentences are kept until the budget is spent. They are re-emitted in their
+    original lines, under the markdown headings they belong to, with GAP_MARKER where lines
+    were left out.
+
+    Args:
+        text (str): Report text (markdown)
+        query (str): Query to rank sentences against
+        budget (int): Token budget
+
+    Returns:
+        str: The text itself if it fits, else the kept sentences
+    """
+    if count_tokens(text) <= budget:
+        return text
+    # Sentences are counted one by one without list markers and gap markers, so the joined
+    # excerpt can come out a little over; lower the target by the overshoot and select again
+    target = budget
+    for attempt in range(6):
+        compressed = _extract(text, query, target)
+        overshoot = count_tokens(compressed) - budget
+        if overshoot <= 0:
+            break
+        target -= max(overshoot, 8 << attempt)
+    return compressed
+
+
+def _extract(text: str, query: str, budget: int) -> str:
+    """Best sentences of a text whose own token counts (plus headings) fit the budget"""
+    lines, sentences = _sentences(text)
+    if not sentences:
+        return text[:budget * 4]
+
+    relevance = _bm25([f"{' '.join(lines[h] for h in s.headings)} {s.text}" for s in sentences], query)
+    best = max(relevance) or 1.0
+    for position, (sentence, score) in enumerate(zip(sentences, relevance)):
+        sentence.score = (score / best + FIGURE_WEIGHT * bool(FIGURE.search(sentence.text))
+                          + LEAD_WEIGHT * (1 - position / len(sentences)))
+
+    kept, kept_headings, used = set(), set(), 0
+    for index in sorted(range(len(sentences)), key=lambda index: -sentences[index].score):
+        sentence = sentences[index]
+        new_headings = [line for line in sentence.headings if line not in kept_headings]
+        # + 1 per sentence and heading for the space or line break joining it to the rest
+        cost = sentence.tokens + 1 + sum(count_tokens(lines[line]) + 1 for line in new_headings)
+        if used + cost > budget:
+            continue
+        kept.add(index)
+        kept_headings.update(new_headings)
+        used += cost
+
+    by_line: Dict[int, List[str]] = defaultdict(list)
+    for index in sorted(kept):
+        by_line[sentences[index].line].append(sentences[index].text)
+    output, gap, blank = [], False, False
+    for number, line in enumerate(lines):
+        if number in kept_headings or number in by_line:
+            if blank and output:
+                output.append('')
+            if number in kept_headings:
+                output.append(line)
+            else:
+                prefix = LIST_PREFIX.match(line)
+                output.append((prefix.group(0) if prefix else '') + ' '.join(by_line[number]))
+            gap = blank = False
+        elif not line.strip():
+            blank = True
+        elif not RULE_LINE.match(line.strip()) and not gap and output:
+            output.append(GAP_MARKER)
+            gap = True
+    return '\n'.join(output)
+
+
+def pack_sources(texts: Sequence[str], query: str, budget: Optional[int] = None
+                 ) -> Tuple[List[str], List[SourceAllocation]]:
+    """
+    Fit several reports into one token budget
+
+    The budget is split with allocate_budget, weighting each report by its length and its
+    relevance: 0.5 plus half its BM25 score against the query relative to the best report.
+    Reports over their share are compressed with compress_text.
+
+    Args:
+        texts (Sequence[str]): Report texts
+        query (str): Query the reports answer
+        budget (int): Total token budget (default synthesis_budget(); 0 keeps everything)
+
+    Returns:
+        Tuple[List[str], List[SourceAllocation]]: Packed texts and what each one kept
+    """
+    budget = synthesis_budget() if budget is None else budget
+    lengths = [count_tokens(text) for text in texts]
+    scores = _bm25(texts, query)
+    best = max(scores, default=0.0) or 1.0
+    relevances = [0.5 + 0.5 * score / best for score in scores]
+    allocation = list(lengths) if budget <= 0 else allocate_budget(lengths, relevances, budget)
+
+    packed, report = [], []
+    for text, length, relevance, share in zip(texts, lengths, relevances, allocation):
+        compressed = text if share >= length else compress_text(text, query, share)
+        packed.append(compressed)
+        report.append(SourceAllocation(relevance, length, share,
+                                       length if compressed is text else count_tokens(compressed)))
+    return packed, report
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Corpus Cache
+Process-wide in-memory cache of decoded company data shared by the analyzers, bounded by
+a memory ceiling with LRU eviction by company and invalidated when a source file changes
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value) -> int:
+    """Approximate size of decoded JSON data, counted as the length of its text"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(key)) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    return 8
+
+
+class _CompanyEntry:
+    __slots__ = ('versions', 'values', 'bytes')
+
+    def __init__(self):
+        self.versions: Dict[str, Tuple[int, int]] = {}       # source path -> (mtime_ns, size)
+        self.values: Dict[Tuple[str, Hashable], Tuple[object, int]] = {}
+        self.bytes = 0
+
+
+class CorpusCache:
+    """Thread-safe cache of decoded slices of the company data files"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes (int): Memory ceiling, in bytes of source text (default
+                CORPUS_CACHE_MAX_BYTES or 256 MiB); 0 disables caching
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv('CORPUS_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+        # company -> entry; ordered from least to most recently used
+        self._companies: "OrderedDict[str, _CompanyEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get(self, company: str, source, key: Hashable, loader: Callable[[], object]):
+        """
+        Return a cached value, loading it on a miss
+
+        Values are shared between callers and must be treated as read-only.
+
+        Args:
+            company (str): Company key the value belongs to (the unit of eviction)
+            source: Data file the value is read from; a change in its mtime or size
+                drops every value read from it
+            key (Hashable): Identifies the value within the source
+            loader (Callable): Reads the value on a miss
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        source = str(source)
+        stat = os.stat(source)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._companies.get(company)
+            if entry is not None:
+                if entry.versions.get(source, version) != version:
+                    self._drop_source(entry, source)
+                    self._counters['invalidations'] += 1
+                cached = entry.values.get((source, key))
+                if cached is not None:
+                    self._companies.move_to_end(company)
+                    self._counters['hits'] += 1
+                    return cached[0]
+            self._counters['misses'] += 1
+
+        value = loader()
+        if self.max_bytes <= 0:
+            return value
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return value
+
+        with self._lock:
+            entry = self._companies.setdefault(company, _CompanyEntry())
+            self._companies.move_to_end(company)
+            if entry.versions.get(source, version) != version:
+                self._drop_source(entry, source)
+            entry.versions[source] = version
+            previous = entry.values.get((source, key))
+            if previous is not None:
+                entry.bytes -= previous[1]
+                self._bytes -= previous[1]
+            entry.values[(source, key)] = (value, size)
+            entry.bytes += size
+            self._bytes += size
+            self._evict(keep=company)
+        return value
+
+    def invalidate(self, company: Optional[str] = None):
+        """Drop one company's values, or everything"""
+        with self._lock:
+            companies = [company] if company else list(self._companies)
+            for name in companies:
+                entry = self._companies.pop(name, None)
+                if entry:
+                    self._bytes -= entry.bytes
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and current usage"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': round(self._counters['hits'] / lookups, 3) if lookups else 0.0,
+                'companies': list(self._companies),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _drop_source(self, entry: _CompanyEntry, source: str):
+        """Forget every value read from a changed source (caller holds the lock)"""
+        for value_key in [value_key for value_key in entry.values if value_key[0] == source]:
+            size = entry.values.pop(value_key)[1]
+            entry.bytes -= size
+            self._bytes -= size
+        entry.versions.pop(source, None)
+
+    def _evict(self, keep: str):
+        """Drop least recently used companies until under max_bytes (caller holds the lock)"""
+        while self._bytes > self.max_bytes and len(self._companies) > 1:
+            company = next(iter(self._companies))
+            if company == keep:
+                break
+            self._bytes -= self._companies.pop(company).bytes
+            self._counters['evictions'] += 1
+            logger.info(f"Corpus cache evicted {company}")
+
+
+_cache: Optional[CorpusCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_corpus_cache() -> CorpusCache:
+    """Return the process-wide corpus cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CorpusCache()
+    return _cache
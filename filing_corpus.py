@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Filing Corpus
+Walks every 10-K, 8-K and 10-Q source the tools read (gemini_10k, gemini_8k and the parsed
+python_output_10k/python_output_10q filings) and splits section text into paragraph passages
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from company_resolver import get_resolver
+from section_store import iter_sections
+
+BASE_DIR = Path(__file__).parent
+
+MIN_PASSAGE_CHARS = 300
+MAX_PASSAGE_CHARS = 1500
+
+FORMS = ('10-K', '8-K', '10-Q')
+SENTENCE_END = re.compile(r'(?<=[.!?])["”’)]?\s+(?=["“(]?[A-Z0-9])')
+PARSED_SECTION_PREFIX = re.compile(r'^(?:Section|Part)_\d+_')
+QUARTER_DIR = re.compile(r'^(Q[1-4])_(\d{4})$')
+TABLE_ROW = re.compile(r'[$%]|\S\s{3,}\S')
+PAGE_MARKER = re.compile(r'\|\s*\d+$|^(?:page\s+)?\d+$|^table of contents$', re.IGNORECASE)
+
+
+@dataclass
+class Source:
+    """One data file and how to read it"""
+    company: str   # resolver company key
+    form: str      # "10-K", "8-K" or "10-Q"
+    kind: str      # "gemini_10k", "gemini_8k" or "parsed"
+    path: Path
+
+
+@dataclass
+class Passage:
+    """A paragraph-sized piece of one section of a filing"""
+    company: str
+    form: str
+    year: str
+    period: str    # "Q1".."Q4" for 10-Q filings, else ""
+    section: str   # e.g. "Part I: Business and Risk Factors / Item 1A. Risk Factors"
+    text: str
+    source: str
+
+
+def normalize_form(form: str) -> Optional[str]:
+    """Map "10k", "10-K" or "8K" to the canonical form name, or None if unknown"""
+    compact = re.sub(r'[^0-9a-z]', '', str(form).lower())
+    return next((name for name in FORMS if name.replace('-', '').lower() == compact), None)
+
+
+def _text_blocks(text: str) -> List[str]:
+    """
+    Split text into paragraphs and headings
+
+    Blank lines separate paragraphs when the text has them. The gemini and parsed
+    filings are hard-wrapped instead, so a line noticeably shorter than the wrap width
+    ends a paragraph (or is a heading).
+    """
+    if re.search(r'\n\s*\n', text):
+        return [block.strip() for block in re.split(r'\n\s*\n', text) if block.strip()]
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < 5:
+        return lines
+    width = sorted(len(line) for line in lines)[int(len(lines) * 0.9)]
+    blocks, current = [], []
+    for line in lines:
+        current.append(line)
+        if len(line) < width * 0.7:
+            blocks.append(' '.join(current))
+            current = []
+    if current:
+        blocks.append(' '.join(current))
+    return blocks
+
+
+def _split_long(block: str, max_chars: int) -> List[str]:
+    """Split a block at sentence boundaries (or whitespace) into pieces of at most max_chars"""
+    pieces, current = [], ''
+    for sentence in SENTENCE_END.split(block):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_paragraphs(text: str, min_chars: int = MIN_PASSAGE_CHARS, max_chars: int = MAX_PASSAGE_CHARS) -> List[str]:
+    """
+    Split section text into paragraph passages
+
+    Headings and short paragraphs are joined to the paragraph that follows them and
+    paragraphs longer than max_chars are split between sentences, so passages are
+    roughly min_chars to max_chars long.
+
+    Args:
+        text (str): Section text
+        min_chars (int): Join blocks shorter than this to their neighbour
+        max_chars (int): Split blocks longer than this
+
+    Returns:
+        List[str]: Passages in document order
+    """
+    blocks = []
+    for block in _text_blocks(text or ''):
+        blocks.extend(_split_long(block, max_chars) if len(block) > max_chars else [block])
+
+    passages, current = [], ''
+    for block in blocks:
+        if current and (len(current) >= min_chars or len(current) + 1 + len(block) > max_chars):
+            passages.append(current)
+            current = block
+        else:
+            current = f"{current}\n{block}" if current else block
+    if current:
+        if passages and len(current) < min_chars and len(passages[-1]) + 1 + len(current) <= max_chars:
+            passages[-1] = f"{passages[-1]}\n{current}"
+        else:
+            passages.append(current)
+    return passages
+
+
+@dataclass
+class Chunk:
+    """A paragraph of a section and the heading it falls under"""
+    heading: str
+    text: str
+
+
+def is_heading(block: str) -> bool:
+    """Short line with no sentence punctuation at the end and no table columns, e.g. "Supply Chain Risks" """
+    block = block.strip()
+    return 0 < len(block) <= 120 and '\n' not in block and block[-1] not in '.,;:!?)”"' \
+        and not TABLE_ROW.search(block) and any(char.isalpha() for char in block)
+
+
+def chunk_section(text: str, min_chars: int = 200, max_chars: int = MAX_PASSAGE_CHARS) -> List[Chunk]:
+    """
+    Split section text into paragraph chunks, each tagged with the heading it falls under
+
+    Unlike split_paragraphs, headings are kept apart from the text so a packer can show
+    the heading of every chunk it keeps, and page footers ("Apple Inc. | 2023 Form 10-K | 8")
+    are dropped. Paragraphs shorter than min_chars are joined to the next paragraph under
+    the same heading; longer ones than max_chars are split between sentences.
+
+    Args:
+        text (str): Section text
+        min_chars (int): Join shorter paragraphs to the following one
+        max_chars (int): Split longer paragraphs
+
+    Returns:
+        List[Chunk]: Chunks in document order
+    """
+    chunks: List[Chunk] = []
+    heading, pending = '', ''
+    for block in _text_blocks(text or ''):
+        if PAGE_MARKER.search(block):
+            continue
+        if is_heading(block):
+            if pending:
+                chunks.append(Chunk(heading, pending))
+                pending = ''
+            heading = block
+            continue
+        for piece in _split_long(block, max_chars) if len(block) > max_chars else [block]:
+            if pending and len(pending) + 1 + len(piece) > max_chars:
+                chunks.append(Chunk(heading, pending))
+                pending = ''
+            pending = f"{pending}\n{piece}" if pending else piece
+            if len(pending) >= min_chars:
+                chunks.append(Chunk(heading, pending))
+                pending = ''
+    if pending:
+        chunks.append(Chunk(heading, pending))
+    return chunks
+
+
+def _flatten(value, heading: str = '') -> str:
+    """Text of a nested 8-K item value ({"content": ..., "subsections": {title: ...}})"""
+    if isinstance(value, str):
+        return f"{heading}\n{value}" if heading else value
+    if isinstance(value, dict):
+        parts = [heading] if heading else []
+        for key, item in value.items():
+            parts.append(_flatten(item, '' if key in ('content', 'subsections') else key))
+        return '\n\n'.join(part for part in parts if part)
+    if isinstance(value, list):
+        return '\n\n'.join(_flatten(item) for item in value)
+    return '' if value is None else str(value)
+
+
+def _parsed_label(name: str) -> str:
+    """"Section_2_Item_1A._Risk_Factors" -> "Item 1A. Risk Factors"; "unnamed" -> "" """
+    label = PARSED_SECTION_PREFIX.sub('', name or '').replace('_', ' ').strip()
+    return '' if label.lower() == 'unnamed' else label
+
+
+def iter_sources(base_dir: Optional[Path] = None) -> Iterator[Source]:
+    """
+    Every data file the corpus is built from
+
+    Args:
+        base_dir (Path): Repository root (default this file's folder)
+
+    Yields:
+        Source: One file per company and form (gemini files) or per filing (parsed outputs)
+    """
+    base_dir = Path(base_dir or BASE_DIR)
+    resolver = get_resolver()
+    for kind, folder, form in (('gemini_10k', 'gemini_10k', '10-K'), ('gemini_8k', 'gemini_8k', '8-K')):
+        for path in sorted((base_dir / folder).glob('*.json')):
+            yield Source(resolver.key_for_file(path, '10k' if form == '10-K' else '8k'), form, kind, path)
+
+    companies_dir = base_dir / 'proto-3' / 'companies'
+    if not companies_dir.exists():
+        return
+    for company_dir in sorted(path for path in companies_dir.iterdir() if path.is_dir()):
+        company = resolver.resolve(company_dir.name)
+        key = company.key if company else company_dir.name
+        for folder, form in (('python_output_10k', '10-K'), ('python_output_10q', '10-Q')):
+            for path in sorted((company_dir / folder).glob('*/*.json')):
+                yield Source(key, form, 'parsed', path)
+
+
+def iter_passages(source: Source, min_chars: int = MIN_PASSAGE_CHARS,
+                  max_chars: int = MAX_PASSAGE_CHARS) -> Iterator[Passage]:
+    """
+    Read a source file and split its sections into passages
+
+    Args:
+        source (Source): File from iter_sources()
+        min_chars (int): Minimum passage length (see split_paragraphs)
+        max_chars (int): Maximum passage length
+
+    Yields:
+        Passage: Passages in file order
+    """
+    with open(source.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    def passages(year, period, section, text):
+        for passage in split_paragraphs(text, min_chars, max_chars):
+            yield Passage(source.company, source.form, str(year), period, section, passage, str(source.path))
+
+    if source.kind == 'gemini_10k':
+        for year, part, item, content, _ in iter_sections(data):
+            yield from passages(year, '', f"{part} / {item}", content)
+
+    elif source.kind == 'gemini_8k':
+        for years in data.values():
+            if not isinstance(years, dict):
+                continue
+            for year, year_data in years.items():
+                if not isinstance(year_data, dict):
+                    continue
+                for category, category_data in year_data.get('CATEGORIES', {}).items():
+                    items = category_data.get('ITEMS', {}) if isinstance(category_data, dict) else {}
+                    for item, value in items.items():
+                        yield from passages(year, '', f"{category} / {item}", _flatten(value))
+
+    else:
+        match = QUARTER_DIR.match(source.path.parent.name)
+        year = data.get('year') or (match.group(2) if match else source.path.parent.name)
+        period = data.get('quarter') or (match.group(1) if match else '')
+        for part in data.get('parts', []):
+            part_label = _parsed_label(part.get('part_name', ''))
+            for section in part.get('sections', []):
+                label = _parsed_label(section.get('section_id', ''))
+                section_name = f"{part_label} / {label}" if part_label and label else (label or part_label)
+                yield from passages(year, period if source.form == '10-Q' else '', section_name,
+                                    section.get('content', ''))
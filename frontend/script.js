@@ -104,17 +104,8 @@ class SECAnalysisAI {
         this.showLoadingOverlay();
         
         try {
-            // Start the initial animation steps (1-3) quickly
-            const initialStepsPromise = this.simulateInitialSteps();
-            
-            // Start the actual API call at the same time
-            const apiCallPromise = this.callAnalysisAPI(query);
-            
-            // Wait for initial steps to complete
-            await initialStepsPromise;
-            
-            // Keep step 3 pulsing until API call is complete
-            const results = await apiCallPromise;
+            // Steps advance as the server reports real progress
+            const results = await this.callAnalysisAPI(query);
             
             // Show completion step
             await this.showCompletionStep();
@@ -127,7 +118,8 @@ class SECAnalysisAI {
             
         } catch (error) {
             console.error('Analysis error:', error);
-            this.showError('Failed to analyze query. Please try again.');
+            const reason = error.jobFailed ? ` ${error.message}.` : '';
+            this.showError(`Failed to analyze query.${reason} Please try again.`);
         } finally {
             this.isAnalyzing = false;
             this.hideLoadingOverlay();
@@ -178,50 +170,42 @@ class SECAnalysisAI {
         finalStep.classList.add('completed');
     }
 
-    async simulateInitialSteps() {
-        const steps = [
-            { id: 'step1', duration: 1500, text: 'Parsing your query and identifying key parameters...' },
-            { id: 'step2', duration: 2000, text: 'Searching SEC databases and extracting relevant data...' },
-            { id: 'step3', duration: 1500, text: 'Running AI analysis and generating insights...' }
-        ];
-        
+    setLoadingStep(index, text) {
+        const steps = ['step1', 'step2', 'step3', 'step4'];
         const loadingStepsContainer = document.querySelector('.loading-steps');
         const loadingText = document.querySelector('.loading-text');
         
-        for (let i = 0; i < steps.length; i++) {
-            const step = steps[i];
-            
-            // Update progress bar (25%, 50%, 75% for first 3 steps)
-            loadingStepsContainer.className = `loading-steps progress-${25 * (i + 1)}`;
-            
-            // Update loading text
-            if (loadingText) {
-                loadingText.textContent = step.text;
-            }
-            
-            // Deactivate previous step and mark as completed
-            if (i > 0) {
-                const prevStep = document.getElementById(steps[i - 1].id);
-                prevStep.classList.remove('active');
-                prevStep.classList.add('completed');
-            }
-            
-            // Activate current step
-            const currentStep = document.getElementById(step.id);
-            currentStep.classList.add('active');
-            
-            // Wait for step duration
-            await new Promise(resolve => setTimeout(resolve, step.duration));
-        }
+        // Update progress bar
+        loadingStepsContainer.className = `loading-steps progress-${25 * (index + 1)}`;
         
-        // Keep step 3 pulsing with waiting animation - don't mark as completed yet
-        const step3 = document.getElementById('step3');
-        step3.classList.remove('active');
-        step3.classList.add('waiting');
+        if (loadingText && text) {
+            loadingText.textContent = text;
+        }
         
-        const loadingTextElement = document.querySelector('.loading-text');
-        if (loadingTextElement) {
-            loadingTextElement.textContent = 'Processing comprehensive analysis... Please wait...';
+        // Mark earlier steps as completed and activate the current one
+        steps.forEach((stepId, i) => {
+            const step = document.getElementById(stepId);
+            if (i < index) {
+                step.classList.remove('active', 'waiting');
+                step.classList.add('completed');
+            } else if (i === index) {
+                step.classList.add('active');
+            }
+        });
+    }
+
+    setLoadingText(text) {
+        const loadingText = document.querySelector('.loading-text');
+        if (loadingText) {
+            loadingText.textContent = text;
+        }
+    }
+
+    appendLoadingStream(text) {
+        const loadingStream = document.getElementById('loadingStream');
+        if (loadingStream && text) {
+            loadingStream.textContent += text;
+            loadingStream.scrollTop = loadingStream.scrollHeight;
         }
     }
 
@@ -268,15 +252,109 @@ class SECAnalysisAI {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            return data;
+            // The server queues the analysis and returns a job to poll
+            const job = await response.json();
+            const finishedJob = await this.followJob(job);
+            return finishedJob.result;
         } catch (error) {
+            // A job the server ran and failed is reported, never replaced by demo data
+            if (error.jobFailed) {
+                throw error;
+            }
             // For demo purposes, return mock data
             console.log('Using mock data for demo');
             return this.generateMockResults(query);
         }
     }
 
+    async followJob(job) {
+        if (job.status === 'completed' || job.status === 'failed' || !window.EventSource) {
+            return this.waitForJob(job);
+        }
+        
+        try {
+            return await this.streamJobEvents(job);
+        } catch (error) {
+            if (error.jobFailed) {
+                throw error;
+            }
+            // Fall back to polling if the event stream drops
+            console.log('Progress stream unavailable, polling job status');
+            return this.waitForJob(job);
+        }
+    }
+
+    streamJobEvents(job) {
+        const toolLabels = {
+            'sec_tools': '10-K',
+            'sec_8k_analyzer': '8-K',
+            'sec_insider_analyzer': 'insider trading'
+        };
+        
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`${job.status_url}/events`);
+            const on = (name, handler) => {
+                source.addEventListener(name, event => handler(JSON.parse(event.data)));
+            };
+            const finish = (finishedJob) => {
+                source.close();
+                try {
+                    resolve(this.checkJobResult(finishedJob));
+                } catch (error) {
+                    reject(error);
+                }
+            };
+            
+            on('query_enhanced', () => {
+                this.setLoadingStep(1, 'Searching SEC databases and extracting relevant data...');
+            });
+            on('tool_started', data => {
+                this.setLoadingText(`Running ${toolLabels[data.tool] || data.tool} analysis...`);
+            });
+            on('tool_finished', data => {
+                const label = toolLabels[data.tool] || data.tool;
+                const outcome = data.success ? 'finished' : 'failed';
+                this.setLoadingText(`${label} analysis ${outcome} in ${(data.execution_time || 0).toFixed(1)}s`);
+            });
+            on('synthesis_started', () => {
+                this.setLoadingStep(2, 'Running AI analysis and generating insights...');
+            });
+            on('synthesis_token', data => this.appendLoadingStream(data.text));
+            on('completed', finish);
+            on('failed', finish);
+            
+            source.onerror = () => {
+                // The browser would reconnect and replay the stream; poll instead
+                source.close();
+                reject(new Error('Progress stream closed'));
+            };
+        });
+    }
+
+    async waitForJob(job, pollInterval = 2000) {
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, pollInterval));
+
+            const response = await fetch(job.status_url);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            job = await response.json();
+        }
+
+        return this.checkJobResult(job);
+    }
+
+    checkJobResult(job) {
+        // Failed jobs carry an error and no result
+        if (job.status === 'failed' || !job.result) {
+            const error = new Error(job.error || 'Analysis failed');
+            error.jobFailed = true;
+            throw error;
+        }
+        return job;
+    }
+
     generateMockResults(query) {
         const company = this.extractCompanyFromQuery(query);
         
@@ -569,8 +647,15 @@ All 8-K filings demonstrate:
             this.checkContentOverflow();
         }, 200);
 
-        // Show success notification
-        this.showNotification('Analysis completed successfully! Results are now available in the tabs below.', 'success');
+        // Show success notification, flagging any sources left out at the deadline
+        const omitted = results.omitted_sources || [];
+        if (omitted.length) {
+            const labels = { 'sec_tools': '10-K', 'sec_8k_analyzer': '8-K', 'sec_insider_analyzer': 'Form 4' };
+            const names = omitted.map(source => labels[source.tool] || source.tool).join(', ');
+            this.showNotification(`Analysis completed without ${names} data (not ready in time or failed).`, 'info');
+        } else {
+            this.showNotification('Analysis completed successfully! Results are now available in the tabs below.', 'success');
+        }
 
         // Populate sources
         this.displaySources(results.sources, results.analysis_files);
@@ -962,6 +1047,12 @@ All 8-K filings demonstrate:
             loadingText.textContent = 'Processing your query through our AI analysis system';
         }
         
+        // Clear streamed synthesis text
+        const loadingStream = document.getElementById('loadingStream');
+        if (loadingStream) {
+            loadingStream.textContent = '';
+        }
+        
         // Activate first step
         const firstStep = document.getElementById('step1');
         if (firstStep) {
@@ -982,7 +1073,7 @@ All 8-K filings demonstrate:
         errorElement.innerHTML = `
             <div class="error-content">
                 <i data-lucide="alert-circle"></i>
-                <span>${message}</span>
+                <span>${this.escapeHtml(message)}</span>
             </div>
         `;
         
@@ -1008,7 +1099,7 @@ All 8-K filings demonstrate:
         notification.innerHTML = `
             <div class="notification-content">
                 <i data-lucide="${icon}"></i>
-                <span>${message}</span>
+                <span>${this.escapeHtml(message)}</span>
                 <button class="notification-close" onclick="this.parentElement.parentElement.remove()">
                     <i data-lucide="x"></i>
                 </button>
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Index Refresher
+Keeps a process-wide search index current without building it on the request path: the
+index file is opened on first use, missing or stale indexes are (re)built on a background
+thread, and searches keep using the last good index until the new one is swapped in
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+Index = TypeVar('Index')
+
+
+class IndexUnavailable(RuntimeError):
+    """Raised when no index has been built yet; one is being built in the background"""
+
+
+class IndexRefresher(Generic[Index]):
+    """
+    Serves one index and refreshes it in the background
+
+    The index class must open an existing file when constructed (raising OSError or
+    ValueError if there is none) and report changed sources through is_stale().
+    """
+
+    def __init__(self, name: str, open_index: Callable[[], Index], build_index: Callable[[], Index],
+                 check_interval: float):
+        """
+        Initialize the refresher
+
+        Args:
+            name (str): Index name for log messages (e.g. "search index")
+            open_index (Callable): Opens the index file
+            build_index (Callable): Builds the index file from the sources and opens it
+            check_interval (float): Seconds between background checks of the source files
+                (0 disables them; the index is then only rebuilt when missing or from the CLI)
+        """
+        self.name = name
+        self.open_index = open_index
+        self.build_index = build_index
+        self.check_interval = check_interval
+        self._index: Optional[Index] = None
+        self._opened = False
+        self._checked_at = 0.0
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def get(self, wait: bool = False) -> Index:
+        """
+        Return the current index
+
+        Never builds on the calling thread unless wait is set: a missing index is built in
+        the background (IndexUnavailable until it is ready) and a stale one keeps being
+        served while its replacement is built.
+
+        Args:
+            wait (bool): Check the sources and build now if needed, blocking until done (CLI use)
+
+        Returns:
+            The index
+
+        Raises:
+            IndexUnavailable: If no index exists yet and wait is not set
+        """
+        with self._lock:
+            if not self._opened:
+                self._opened = True
+                try:
+                    self._index = self.open_index()
+                except (OSError, ValueError) as e:
+                    logger.info(f"{self.name.capitalize()} unavailable ({e}); building it")
+
+            if wait:
+                worker = self._worker
+            else:
+                due = self.check_interval > 0 and time.monotonic() - self._checked_at >= self.check_interval
+                if self._index is None or due:
+                    self._start_refresh()
+                index = self._index
+
+        if not wait:
+            if index is None:
+                raise IndexUnavailable(f"The {self.name} is being built; try again shortly")
+            return index
+
+        if worker is not None:
+            worker.join()
+        self._refresh(raise_errors=True)
+        return self._index
+
+    def _start_refresh(self):
+        """Start a background refresh unless one is running (caller holds the lock)"""
+        self._checked_at = time.monotonic()
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._refresh, name=f"{self.name.replace(' ', '-')}-refresh",
+                                            daemon=True)
+            self._worker.start()
+
+    def _refresh(self, raise_errors: bool = False):
+        """Rebuild the index if it is missing or its sources changed, then swap it in"""
+        try:
+            index = self._index
+            if index is not None and not index.is_stale():
+                return
+            start_time = time.perf_counter()
+            logger.info(f"{'Rebuilding' if index is not None else 'Building'} the {self.name}")
+            new_index = self.build_index()
+            with self._lock:
+                self._index = new_index
+                self._checked_at = time.monotonic()
+            logger.info(f"{self.name.capitalize()} ready in {time.perf_counter() - start_time:.1f}s")
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Refreshing the {self.name} failed: {e}")
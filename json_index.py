@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - JSON Byte-Offset Index
+Sidecar index of where each year, part, section or filing sits in a gemini_* JSON file,
+so the analyzers can mmap the file and decode only the slices a query needs
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_DIR = Path(__file__).parent / 'cache' / 'json_index'
+
+WHITESPACE = re.compile(rb'[ \t\r\n]*')
+STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+SCALAR = re.compile(rb'[^,\]}\s]+')
+STRING_OR_BRACKET = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+VALUE_TYPES = {ord('{'): 'o', ord('['): 'a', ord('"'): 's'}
+
+PathKey = Union[str, int]
+
+
+def _skip_ws(buf, pos: int) -> int:
+    return WHITESPACE.match(buf, pos).end()
+
+
+def _skip_value(buf, pos: int) -> int:
+    """Return the offset just past the JSON value starting at pos"""
+    first = buf[pos]
+    if first == ord('"'):
+        return STRING.match(buf, pos).end()
+    if first in (ord('{'), ord('[')):
+        depth = 0
+        for match in STRING_OR_BRACKET.finditer(buf, pos):
+            token = match.group()
+            if token in (b'{', b'['):
+                depth += 1
+            elif token in (b'}', b']'):
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+        raise ValueError(f"Unterminated JSON container at byte {pos}")
+    return SCALAR.match(buf, pos).end()
+
+
+def _index_value(buf, pos: int, depth: int, max_depth: int) -> Tuple[Dict, int]:
+    """
+    Index the value at pos, descending into containers up to max_depth
+
+    Returns:
+        Tuple[Dict, int]: Node {"t": type, "s": start, "e": end, "k"/"i": children} and end offset
+    """
+    pos = _skip_ws(buf, pos)
+    first = buf[pos]
+    node = {'t': VALUE_TYPES.get(first, 'v'), 's': pos}
+
+    if depth >= max_depth or node['t'] not in ('o', 'a'):
+        node['e'] = _skip_value(buf, pos)
+        return node, node['e']
+
+    closing = ord('}') if node['t'] == 'o' else ord(']')
+    children = {} if node['t'] == 'o' else []
+    pos = _skip_ws(buf, pos + 1)
+    while buf[pos] != closing:
+        if node['t'] == 'o':
+            key_end = STRING.match(buf, pos).end()
+            key = json.loads(buf[pos:key_end])
+            pos = _skip_ws(buf, key_end) + 1  # past ':'
+            children[key], pos = _index_value(buf, pos, depth + 1, max_depth)
+        else:
+            child, pos = _index_value(buf, pos, depth + 1, max_depth)
+            children.append(child)
+        pos = _skip_ws(buf, pos)
+        if buf[pos] == ord(','):
+            pos = _skip_ws(buf, pos + 1)
+
+    node['k' if node['t'] == 'o' else 'i'] = children
+    node['e'] = pos + 1
+    return node, node['e']
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JsonIndex:
+    """Byte offsets of the values in one JSON file down to a fixed depth"""
+
+    def __init__(self, path: Path, root: Dict, max_depth: int, stat: Tuple[int, int]):
+        self.path = path
+        self.root = root
+        self.max_depth = max_depth
+        self.stat = stat  # (mtime_ns, size) the offsets are valid for
+
+    def node(self, *keys: PathKey) -> Dict:
+        """Index node for a path of object keys and array positions; raises KeyError if absent"""
+        node = self.root
+        for key in keys:
+            if node['t'] == 'o' and 'k' in node and key in node['k']:
+                node = node['k'][key]
+            elif node['t'] == 'a' and 'i' in node and isinstance(key, int) and 0 <= key < len(node['i']):
+                node = node['i'][key]
+            else:
+                raise KeyError(keys)
+        return node
+
+    def has(self, *keys: PathKey) -> bool:
+        try:
+            self.node(*keys)
+            return True
+        except KeyError:
+            return False
+
+    def kind(self, *keys: PathKey) -> str:
+        """"object", "array", "string" or "value" (number, bool or null)"""
+        return {'o': 'object', 'a': 'array', 's': 'string', 'v': 'value'}[self.node(*keys)['t']]
+
+    def keys(self, *keys: PathKey) -> List[PathKey]:
+        """Object keys in file order, or array positions, of an indexed container"""
+        node = self.node(*keys)
+        if 'k' in node:
+            return list(node['k'])
+        if 'i' in node:
+            return list(range(len(node['i'])))
+        return []
+
+    def load(self, *keys: PathKey):
+        """Decode just the value at a path from a memory map of the file"""
+        with self.mapped() as view:
+            return view.load(*keys)
+
+    @contextmanager
+    def mapped(self) -> Iterator['MappedJson']:
+        """Map the file once for several loads"""
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield MappedJson(self, mapped)
+
+
+class MappedJson:
+    """Decodes indexed values from an open memory map"""
+
+    def __init__(self, index: JsonIndex, mapped: mmap.mmap):
+        self.index = index
+        self._mapped = mapped
+
+    def load(self, *keys: PathKey):
+        node = self.index.node(*keys)
+        return json.loads(self._mapped[node['s']:node['e']])
+
+
+class JsonIndexer:
+    """Builds, stores and revalidates sidecar indexes"""
+
+    def __init__(self, index_dir: Optional[str] = None):
+        """
+        Args:
+            index_dir (str): Sidecar directory (default JSON_INDEX_DIR or cache/json_index)
+        """
+        self.index_dir = Path(index_dir or os.getenv('JSON_INDEX_DIR') or DEFAULT_INDEX_DIR)
+        self._indexes: Dict[Tuple[Path, int], JsonIndex] = {}
+        self._lock = threading.Lock()
+
+    def open(self, json_file, max_depth: int) -> JsonIndex:
+        """
+        Return an up-to-date index of a JSON file
+
+        The in-memory index is reused while the file's mtime and size are unchanged.
+        Otherwise the sidecar is read, and the file is re-indexed only if its hash no
+        longer matches the one the sidecar was built from.
+
+        Args:
+            json_file: Path to the JSON file
+            max_depth (int): Nesting depth whose values get their own offsets
+                (e.g. 2 for {company: {year: ...}} years)
+
+        Returns:
+            JsonIndex: Index of the file
+        """
+        path = Path(json_file).resolve()
+        stat = path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._indexes.get((path, max_depth))
+        if cached and cached.stat == version:
+            return cached
+
+        index = self._read_sidecar(path, max_depth, version)
+        if index is None:
+            index = self._build(path, max_depth, version)
+        with self._lock:
+            self._indexes[(path, max_depth)] = index
+        return index
+
+    def _sidecar_path(self, path: Path, max_depth: int) -> Path:
+        path_hash = hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:10]
+        return self.index_dir / f"{path.stem}.{path_hash}.d{max_depth}.idx.json"
+
+    def _read_sidecar(self, path: Path, max_depth: int, version: Tuple[int, int]) -> Optional[JsonIndex]:
+        sidecar = self._sidecar_path(path, max_depth)
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if stored.get('version') != INDEX_VERSION:
+            return None
+
+        if (stored.get('mtime_ns'), stored.get('size')) != version:
+            # Touched but possibly unchanged (e.g. a fresh checkout): trust the offsets if the bytes match
+            if stored.get('size') != version[1] or stored.get('sha256') != _file_hash(path):
+                return None
+            stored['mtime_ns'] = version[0]
+            self._write_sidecar(sidecar, stored)
+        return JsonIndex(path, stored['root'], max_depth, version)
+
+    def _build(self, path: Path, max_depth: int, version: Tuple[int, int]) -> JsonIndex:
+        with open(path, 'rb') as f:
+            if version[1] == 0:
+                raise ValueError(f"Empty JSON file: {path}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                root, _ = _index_value(mapped, 0, 0, max_depth)
+        logger.info(f"Built JSON index for {path.name} (depth {max_depth})")
+
+        self._write_sidecar(self._sidecar_path(path, max_depth), {
+            'version': INDEX_VERSION,
+            'source': str(path),
+            'mtime_ns': version[0],
+            'size': version[1],
+            'sha256': _file_hash(path),
+            'max_depth': max_depth,
+            'root': root
+        })
+        return JsonIndex(path, root, max_depth, version)
+
+    def _write_sidecar(self, sidecar: Path, stored: Dict):
+        try:
+            sidecar.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=sidecar.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(stored, f, separators=(',', ':'))
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            logger.warning(f"Could not write JSON index {sidecar.name}: {e}")
+
+
+_indexer: Optional[JsonIndexer] = None
+_indexer_lock = threading.Lock()
+
+
+def open_index(json_file, max_depth: int) -> JsonIndex:
+    """Index a JSON file through the process-wide indexer"""
+    global _indexer
+    if _indexer is None:
+        with _indexer_lock:
+            if _indexer is None:
+                _indexer = JsonIndexer()
+    return _indexer.open(json_file, max_depth)
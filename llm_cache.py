@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - LLM Response Cache
+Content-addressed on-disk cache of Gemini responses keyed by model, prompt and
+generation config, with size-bounded LRU eviction and a read-only replay mode
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterator, Optional, Tuple
+
+from mock_gemini import active_backend
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ('off', 'readwrite', 'replay')
+
+
+class LLMCacheMiss(Exception):
+    """Raised in replay mode when a prompt has no cached response"""
+
+
+class CachedResponse:
+    """Stands in for an SDK response served from the cache"""
+
+    cached = True
+
+    def __init__(self, text: str, usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(**usage) if usage else None
+
+    def __iter__(self) -> Iterator['CachedResponse']:
+        # Streaming callers get the whole answer as a single chunk
+        yield self
+
+
+class RecordingStream:
+    """Passes a streaming SDK response through and caches it once fully consumed"""
+
+    def __init__(self, cache: 'LLMCache', key: str, model_name: str, response):
+        self._cache = cache
+        self._key = key
+        self._model_name = model_name
+        self._response = response
+
+    def __iter__(self):
+        parts = []
+        last_chunk = None
+        for chunk in self._response:
+            try:
+                parts.append(chunk.text or '')
+            except ValueError:
+                pass
+            last_chunk = chunk
+            yield chunk
+        # Only reached when the caller read the whole stream; cut-off streams are not cached
+        self._cache.set(self._key, self._model_name, ''.join(parts),
+                        getattr(last_chunk, 'usage_metadata', None))
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class LLMCache:
+    """Thread-safe content-addressed response cache stored as one JSON file per entry"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 mode: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            directory (str): Cache directory (default LLM_CACHE_DIR or cache/llm in the repository)
+            max_bytes (int): Size limit before least recently used entries are evicted
+                (default LLM_CACHE_MAX_BYTES or 1 GiB)
+            mode (str): "off", "readwrite" or "replay" (default LLM_CACHE_MODE or "readwrite").
+                Replay never calls the model and raises LLMCacheMiss on a miss.
+        """
+        self.mode = (mode or os.getenv('LLM_CACHE_MODE', 'readwrite')).lower()
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"LLM_CACHE_MODE must be one of {', '.join(CACHE_MODES)}, got '{self.mode}'")
+
+        self.directory = Path(directory or os.getenv('LLM_CACHE_DIR')
+                              or Path(__file__).parent / 'cache' / 'llm')
+        self.max_bytes = max_bytes or int(os.getenv('LLM_CACHE_MAX_BYTES', str(1024 ** 3)))
+
+        # key -> (size, last used); rebuilt from the directory so the limit survives restarts
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+        if self.mode != 'off':
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    def make_key(self, model_name: str, prompt, generation_config=None) -> str:
+        """
+        Hash everything that determines a response, including the backend unless it is google
+
+        Args:
+            model_name (str): Gemini model name
+            prompt: Prompt text (or SDK contents)
+            generation_config: Generation config dict (or SDK object)
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        material = {
+            'model': model_name,
+            'prompt': prompt if isinstance(prompt, str) else str(prompt),
+            'generation_config': generation_config
+        }
+        # Mock answers are keyed apart from the real model's (google keys are unchanged)
+        backend = active_backend()
+        if backend != 'google':
+            material['backend'] = backend
+        material = json.dumps(material, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Return the cached response for a key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Discarding unreadable LLM cache entry {path.name}: {e}")
+            with self._lock:
+                self._counters['misses'] += 1
+                self._discard(key)
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._counters['hits'] += 1
+            if key in self._entries:
+                self._entries[key] = (self._entries[key][0], now)
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return CachedResponse(entry.get('text', ''), entry.get('usage'))
+
+    def set(self, key: str, model_name: str, text: str, usage_metadata=None):
+        """
+        Store a response and evict least recently used entries beyond max_bytes
+
+        Args:
+            key (str): Key from make_key
+            model_name (str): Gemini model name (kept for inspection)
+            text (str): Response text
+            usage_metadata: SDK usage metadata, if reported
+        """
+        if self.mode != 'readwrite':
+            return
+
+        usage = None
+        if usage_metadata is not None:
+            usage = {attr: getattr(usage_metadata, attr, 0) or 0
+                     for attr in ('prompt_token_count', 'candidates_token_count', 'total_token_count')}
+        data = json.dumps({'model': model_name, 'text': text, 'usage': usage, 'created_at': time.time()})
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"LLM cache write failed: {e}")
+            return
+
+        with self._lock:
+            self._discard_from_index(key)
+            self._entries[key] = (size, time.time())
+            self._bytes += size
+            self._counters['writes'] += 1
+            self._evict()
+
+    def record(self, key: str, model_name: str, response, stream: bool = False):
+        """
+        Cache a fresh SDK response and return what the caller should use
+
+        Args:
+            key (str): Key from make_key
+            model_name (str): Gemini model name
+            response: SDK response
+            stream (bool): Whether response is a stream
+
+        Returns:
+            The response itself, or a pass-through stream that caches on completion
+        """
+        if self.mode != 'readwrite':
+            return response
+        if stream:
+            return RecordingStream(self, key, model_name, response)
+        try:
+            text = response.text
+        except ValueError:
+            # Blocked or empty candidates; let the caller see the SDK error, don't cache it
+            return response
+        if text:
+            self.set(key, model_name, text, getattr(response, 'usage_metadata', None))
+        return response
+
+    def clear(self):
+        """Delete every cached response"""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def stats(self) -> Dict:
+        """Return hit/miss/write/eviction counters and current usage"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': round(self._counters['hits'] / lookups, 3) if lookups else 0.0,
+                'mode': self.mode,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'directory': str(self.directory)
+            }
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _load_index(self):
+        """Scan the cache directory for existing entries and trim it to max_bytes"""
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob('*/*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            self._entries[path.stem] = (stat.st_size, stat.st_mtime)
+            self._bytes += stat.st_size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until under max_bytes (caller holds the lock)"""
+        if self._bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            self._discard(key)
+            self._counters['evictions'] += 1
+
+    def _discard_from_index(self, key: str):
+        """Forget an entry's size (caller holds the lock)"""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[0]
+
+    def _discard(self, key: str):
+        """Delete an entry's file and forget it (caller holds the lock)"""
+        self._discard_from_index(key)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
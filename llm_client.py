@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Shared Gemini Client
+Process-wide access to Gemini with rate limiting, retries, a response cache and a
+reused transport.
+Every module gets its model through get_model() instead of calling
+genai.configure / genai.GenerativeModel itself.
+"""
+
+import contextlib
+import contextvars
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import google.generativeai as genai
+
+from llm_cache import LLMCache, LLMCacheMiss
+from mock_gemini import MockBackend, MockGenerativeModel, active_backend
+from token_counter import count_tokens
+from tool_result import add_token_usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gemini-2.5-pro'
+
+# Model per tier; call sites pick a tier (or a model name) rather than hard-coding a model
+MODEL_TIERS = {
+    'fast': os.getenv('GEMINI_FAST_MODEL', 'gemini-2.5-flash'),
+    'heavy': os.getenv('GEMINI_HEAVY_MODEL', DEFAULT_MODEL)
+}
+
+# Default tier per call site, overridable with GEMINI_MODEL_<CALL_SITE>=fast|heavy|<model name>
+CALL_SITE_TIERS = {
+    'query_routing': 'fast',        # SECMasterAnalyzer.enhance_user_query
+    '10k_extraction': 'fast',       # SECFormsTools.enhance_query_and_extract_parameters
+    '8k_extraction': 'fast',        # SEC8KAnalyzer.extract_company_and_criteria
+    'insider_extraction': 'fast',   # InsiderTradingAnalyzer.extract_company_and_dates
+    '10k_analysis': 'heavy',
+    '10k_summary': 'fast',          # map step of multi-year 10-K analysis (slice_summarizer)
+    '8k_analysis': 'heavy',
+    'insider_analysis': 'heavy',
+    'date_analysis': 'heavy',       # sec-456.py
+    'synthesis': 'heavy',
+    'ingestion': 'heavy'            # proto-3 JSON builders
+}
+
+# HTTP status codes worth retrying: rate limited, or a transient server-side failure
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_EXCEPTIONS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+    )
+except ImportError:
+    RETRYABLE_EXCEPTIONS = ()
+
+
+def estimate_tokens(text: str) -> int:
+    """Token estimate used for rate limiting before a call is made (see token_counter)"""
+    return max(1, count_tokens(text))
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> float:
+        """
+        Wait until amount tokens are available and take them
+
+        Requests larger than the bucket only wait for a full bucket, so they are
+        slowed down rather than blocked forever.
+
+        Args:
+            amount (float): Tokens to take
+            timeout (float): Longest to wait in seconds (None waits as long as needed)
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            TimeoutError: If the tokens would not be available within timeout (none are taken)
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        with self.condition:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                if timeout is not None and waited + delay > timeout:
+                    raise TimeoutError(f"Rate limit needs a {delay:.1f}s wait, "
+                                       f"{max(0.0, timeout - waited):.1f}s left")
+                start = time.monotonic()
+                self.condition.wait(timeout=delay)
+                waited += time.monotonic() - start
+                self._refill()
+            self.tokens -= amount
+        return waited
+
+    def adjust(self, amount: float):
+        """Take (or return, if negative) tokens without waiting, e.g. to correct an estimate"""
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+            self.condition.notify_all()
+
+
+class MeteredStream:
+    """Passes a streaming SDK response through and corrects the token bucket once it ends"""
+
+    def __init__(self, bucket: TokenBucket, estimated: int, response):
+        self._bucket = bucket
+        self._estimated = estimated
+        self._response = response
+
+    def __iter__(self):
+        last_chunk = None
+        try:
+            for chunk in self._response:
+                last_chunk = chunk
+                yield chunk
+        finally:
+            # The final chunk carries the usage; a stream cut off earlier keeps the estimate
+            usage = getattr(last_chunk, 'usage_metadata', None)
+            if usage and getattr(usage, 'total_token_count', 0):
+                self._bucket.adjust(usage.total_token_count - self._estimated)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+# time.time() by which every call made in the current context must finish (see call_deadline)
+_call_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('gemini_call_deadline',
+                                                                                  default=None)
+
+
+class CallDeadlineExceeded(TimeoutError):
+    """Raised instead of calling (or retrying) Gemini once the call_deadline has passed"""
+
+
+@contextlib.contextmanager
+def call_deadline(deadline: Optional[float]) -> Iterator[None]:
+    """
+    Make every Gemini call in this context finish by a deadline
+
+    Calls get at most the time left as their timeout, are not retried past the deadline
+    and are not started after it, so work whose result is no longer awaited stops instead
+    of holding a thread. Nested deadlines keep the earlier one. Threads started from the
+    context need contextvars.copy_context() to inherit it.
+
+    Args:
+        deadline (float): time.time() by which calls must finish (None leaves the current one)
+    """
+    current = _call_deadline.get()
+    if deadline is not None and current is not None:
+        deadline = min(deadline, current)
+    token = _call_deadline.set(deadline if deadline is not None else current)
+    try:
+        yield
+    finally:
+        _call_deadline.reset(token)
+
+
+def call_time_left() -> Optional[float]:
+    """Seconds left before the current call_deadline (at least 0), or None if there is none"""
+    deadline = _call_deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.time())
+
+
+class GeminiClient:
+    """Process-wide Gemini access shared by every model wrapper"""
+
+    def __init__(self, api_key: str, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, max_retries: Optional[int] = None,
+                 timeout: Optional[float] = None, cache: Optional[LLMCache] = None):
+        """
+        Configure the Gemini SDK once for the process
+
+        Args:
+            api_key (str): Google Gemini API key
+            requests_per_minute (int): Request budget (default GEMINI_RPM or 60)
+            tokens_per_minute (int): Token budget (default GEMINI_TPM or 1,000,000)
+            max_retries (int): Retries on 429/5xx (default GEMINI_MAX_RETRIES or 5)
+            timeout (float): Per-call timeout in seconds (default GEMINI_TIMEOUT or 300)
+            cache (LLMCache): Response cache (default configured from LLM_CACHE_* variables)
+        """
+        # GEMINI_BACKEND=mock answers every call in-process without touching the network
+        self.backend = active_backend()
+        self.mock_backend = MockBackend() if self.backend == 'mock' else None
+
+        if not self.mock_backend:
+            transport = os.getenv('GEMINI_TRANSPORT')
+            if transport:
+                genai.configure(api_key=api_key, transport=transport)
+            else:
+                genai.configure(api_key=api_key)
+
+        self.request_bucket = TokenBucket(requests_per_minute or int(os.getenv('GEMINI_RPM', '60')))
+        self.token_bucket = TokenBucket(tokens_per_minute or int(os.getenv('GEMINI_TPM', '1000000')))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+        self.timeout = timeout or float(os.getenv('GEMINI_TIMEOUT', '300'))
+        self.backoff_base = float(os.getenv('GEMINI_BACKOFF_BASE', '1.0'))
+        self.backoff_max = float(os.getenv('GEMINI_BACKOFF_MAX', '60'))
+        self.cache = cache or LLMCache()
+
+        # One SDK model object per model name; they share the configured transport
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._models_lock = threading.Lock()
+
+        # Newer SDKs take request_options={"timeout": ...}; older ones pass timeout straight through
+        model_class = MockGenerativeModel if self.mock_backend else genai.GenerativeModel
+        parameters = inspect.signature(model_class.generate_content).parameters
+        self._supports_request_options = 'request_options' in parameters
+
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0, 'tier_fallbacks': 0, 'throttled_seconds': 0.0}
+
+    def _sdk_model(self, model_name: str) -> genai.GenerativeModel:
+        with self._models_lock:
+            if model_name not in self._models:
+                if self.mock_backend:
+                    self._models[model_name] = MockGenerativeModel(model_name, self.mock_backend)
+                else:
+                    self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def generate(self, model_name: str, prompt, generation_config: Optional[Dict] = None,
+                 stream: bool = False, timeout: Optional[float] = None):
+        """
+        Call generate_content with rate limiting, a timeout and retries
+
+        Responses are served from and written to the LLM cache first; in replay mode
+        the model is never called.
+
+        Args:
+            model_name (str): Gemini model name
+            prompt: Prompt text (or SDK contents)
+            generation_config (Dict): Optional generation config
+            stream (bool): Return a streaming response
+            timeout (float): Per-call timeout (defaults to the client timeout), shortened to
+                the time left before the call_deadline if one is set
+
+        Returns:
+            The SDK response object (or a CachedResponse on a cache hit)
+
+        Raises:
+            LLMCacheMiss: In replay mode, if the call has no cached response
+            CallDeadlineExceeded: If the call_deadline passes (or the rate limit would make
+                the call wait past it) before the call can be made
+        """
+        key = None
+        if self.cache.enabled:
+            key = self.cache.make_key(model_name, prompt, generation_config)
+            cached = self.cache.get(key)
+            if cached:
+                return cached
+            if self.cache.mode == 'replay':
+                raise LLMCacheMiss(f"No cached {model_name} response for this prompt (LLM_CACHE_MODE=replay)")
+
+        model = self._sdk_model(model_name)
+        estimated = estimate_tokens(prompt if isinstance(prompt, str) else str(prompt))
+
+        kwargs = {'stream': stream}
+        if generation_config:
+            kwargs['generation_config'] = generation_config
+        deadline = _call_deadline.get()
+
+        attempt = 0
+        while True:
+            # Don't queue behind the rate limit for longer than the deadline allows
+            try:
+                waited = self.request_bucket.acquire(1, timeout=call_time_left())
+                try:
+                    waited += self.token_bucket.acquire(estimated, timeout=call_time_left())
+                except TimeoutError:
+                    self.request_bucket.adjust(-1)
+                    raise
+            except TimeoutError as e:
+                self._count('failures')
+                raise CallDeadlineExceeded(f"{model_name} call abandoned before the deadline: {e}") from e
+            if waited > 0:
+                self._count('throttled_seconds', waited)
+
+            call_timeout = timeout or self.timeout
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._count('failures')
+                    raise CallDeadlineExceeded(f"{model_name} call abandoned: deadline passed")
+                call_timeout = min(call_timeout, remaining)
+            if self._supports_request_options:
+                kwargs['request_options'] = {'timeout': call_timeout}
+            else:
+                kwargs['timeout'] = call_timeout
+            self._count('calls')
+
+            try:
+                response = model.generate_content(prompt, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    self._count('failures')
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                if deadline is not None and time.time() + delay >= deadline:
+                    self._count('failures')
+                    raise
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"Gemini call failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            # Replace the estimate with the real count once the SDK reports it
+            # (for streams, when the last chunk has been read)
+            if stream:
+                response = MeteredStream(self.token_bucket, estimated, response)
+            else:
+                usage = getattr(response, 'usage_metadata', None)
+                if usage and getattr(usage, 'total_token_count', 0):
+                    self.token_bucket.adjust(usage.total_token_count - estimated)
+            if key:
+                return self.cache.record(key, model_name, response, stream=stream)
+            return response
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if RETRYABLE_EXCEPTIONS and isinstance(error, RETRYABLE_EXCEPTIONS):
+            return True
+        code = getattr(error, 'code', None)
+        code = getattr(code, 'value', code)
+        if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+            return True
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status in RETRYABLE_STATUS_CODES
+
+    def stats(self) -> Dict:
+        """Return call, retry, failure and throttling counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 2)
+        stats['requests_per_minute'] = self.request_bucket.capacity
+        stats['tokens_per_minute'] = self.token_bucket.capacity
+        stats['backend'] = self.backend
+        stats['cache'] = self.cache.stats()
+        return stats
+
+
+class LLMModel:
+    """Drop-in replacement for genai.GenerativeModel that routes calls through the shared client"""
+
+    def __init__(self, client: GeminiClient, model_name: str):
+        self.client = client
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config: Optional[Dict] = None,
+                         stream: bool = False, timeout: Optional[float] = None):
+        return self.client.generate(self.model_name, prompt, generation_config=generation_config,
+                                    stream=stream, timeout=timeout)
+
+    def generate_validated(self, prompt, validate: Callable[[str], Any], usage: Optional[Dict] = None) -> Any:
+        """
+        Generate and validate a response, retrying on the heavy model if validation fails
+
+        Args:
+            prompt: Prompt text
+            validate (Callable): Turns the response text into the result, raising on invalid output
+            usage (Dict): Optional token usage totals to update
+
+        Returns:
+            Any: What validate returned for the first response that passed
+
+        Raises:
+            Exception: The validation (or API) error from the last model tried
+        """
+        heavy_model = MODEL_TIERS['heavy']
+        try:
+            response = self.generate_content(prompt)
+            add_token_usage(usage, response)
+            return validate(response.text)
+        except LLMCacheMiss:
+            raise
+        except Exception as e:
+            if self.model_name == heavy_model:
+                raise
+            logger.warning(f"{self.model_name} response rejected ({e}); retrying with {heavy_model}")
+            self.client._count('tier_fallbacks')
+
+        response = self.client.generate(heavy_model, prompt)
+        add_token_usage(usage, response)
+        return validate(response.text)
+
+
+_client: Optional[GeminiClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client(api_key: Optional[str] = None) -> GeminiClient:
+    """
+    Return the process-wide client, creating it on first use
+
+    Args:
+        api_key (str): API key for the first call (defaults to GEMINI_API_KEY)
+
+    Raises:
+        ValueError: If no API key is available when the client is first created
+            (unless LLM_CACHE_MODE=replay or GEMINI_BACKEND=mock)
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = api_key or os.getenv('GEMINI_API_KEY')
+                # Replay mode and the mock backend never reach the API, so they run without a key
+                offline = (os.getenv('LLM_CACHE_MODE', '').lower() == 'replay'
+                           or os.getenv('GEMINI_BACKEND', '').lower() == 'mock')
+                if not api_key and not offline:
+                    raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
+                _client = GeminiClient(api_key)
+    return _client
+
+
+def get_model(model_name: str = DEFAULT_MODEL, api_key: Optional[str] = None) -> LLMModel:
+    """Return a model wrapper that shares the process-wide client"""
+    return LLMModel(get_client(api_key), model_name)
+
+
+def model_for(call_site: str) -> str:
+    """
+    Resolve the model name configured for a call site
+
+    Args:
+        call_site (str): Key of CALL_SITE_TIERS (e.g. "8k_extraction")
+
+    Returns:
+        str: GEMINI_MODEL_<CALL_SITE> if set (a tier name or a model name), else the site's default tier
+    """
+    choice = os.getenv(f"GEMINI_MODEL_{call_site.upper()}") or CALL_SITE_TIERS.get(call_site, 'heavy')
+    return MODEL_TIERS.get(choice, choice)
+
+
+def get_model_for(call_site: str, api_key: Optional[str] = None) -> LLMModel:
+    """Return a model wrapper for the model configured for a call site"""
+    return get_model(model_for(call_site), api_key=api_key)
+
+
+def client_stats() -> Optional[Dict]:
+    """Return the process-wide client's counters, or None if no call has created it yet"""
+    return _client.stats() if _client else None
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Mock Gemini Backend
+In-process stand-in for genai.GenerativeModel that answers without network access.
+Responses match the JSON each prompt asks for, and latency, token throughput and
+error rate follow a configurable profile so the server, orchestrator and ingestion
+pipelines can be load-tested offline with reproducible numbers.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from token_counter import count_tokens
+
+YEAR_PATTERN = re.compile(r'\b(20[12]\d)\b')
+
+# Markers that separate the instructions from the user's query in the extraction prompts
+QUERY_MARKERS = ('User Query:', 'Query:')
+
+# Prompts put their instructions first and the filing data after; only the instructions
+# are searched for the JSON shape requested, so data that happens to contain a key is ignored
+INSTRUCTION_CHARS = 12000
+
+
+def active_backend() -> str:
+    """
+    GEMINI_BACKEND in use: "google" (the default) or "mock"
+
+    Caches of model output put any backend other than google into their keys, so mock
+    answers are never served once the real API is back.
+    """
+    return os.getenv('GEMINI_BACKEND', 'google').lower()
+
+
+class MockGeminiError(Exception):
+    """Simulated API failure; code mirrors the HTTP status so the client's retry logic applies"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class LatencyProfile:
+    """
+    Time to first token plus output throughput
+
+    The distribution is given as "<kind>:<params>" in milliseconds:
+    "fixed:200", "uniform:100,600", "normal:400,100" (mean, stddev) or
+    "lognormal:400,0.5" (median, sigma).
+    """
+
+    def __init__(self, spec: str, tokens_per_second: float, rng: random.Random):
+        kind, _, params = spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()]
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal') or not self.params:
+            raise ValueError(f"Invalid MOCK_GEMINI_LATENCY '{spec}'")
+        self.tokens_per_second = tokens_per_second
+        self.rng = rng
+
+    def first_token_seconds(self) -> float:
+        p = self.params
+        if self.kind == 'fixed':
+            ms = p[0]
+        elif self.kind == 'uniform':
+            ms = self.rng.uniform(p[0], p[1] if len(p) > 1 else p[0])
+        elif self.kind == 'normal':
+            ms = self.rng.gauss(p[0], p[1] if len(p) > 1 else 0.0)
+        else:
+            ms = p[0] * self.rng.lognormvariate(0.0, p[1] if len(p) > 1 else 0.5)
+        return max(0.0, ms) / 1000.0
+
+    def output_seconds(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class MockBackend:
+    """Shared configuration and random state for every mock model in the process"""
+
+    def __init__(self, latency: Optional[str] = None, tokens_per_second: Optional[float] = None,
+                 error_rate: Optional[float] = None, output_tokens: Optional[int] = None,
+                 seed: Optional[int] = None, mappings_file: Optional[Path] = None):
+        """
+        Initialize the backend
+
+        Args:
+            latency (str): Time-to-first-token distribution (default MOCK_GEMINI_LATENCY or "lognormal:400,0.5")
+            tokens_per_second (float): Output throughput (default MOCK_GEMINI_TOKENS_PER_SECOND or 80)
+            error_rate (float): Fraction of calls failing with 429/503 (default MOCK_GEMINI_ERROR_RATE or 0)
+            output_tokens (int): Approximate length of free-text answers (default MOCK_GEMINI_OUTPUT_TOKENS or 600)
+            seed (int): Random seed for reproducible runs (default MOCK_GEMINI_SEED, unseeded if unset)
+            mappings_file (Path): company_mappings.json used to recognise companies in queries
+        """
+        seed = seed if seed is not None else os.getenv('MOCK_GEMINI_SEED')
+        self.rng = random.Random(int(seed) if seed is not None else None)
+        self.rng_lock = threading.Lock()
+
+        self.latency = LatencyProfile(
+            latency or os.getenv('MOCK_GEMINI_LATENCY', 'lognormal:400,0.5'),
+            tokens_per_second or float(os.getenv('MOCK_GEMINI_TOKENS_PER_SECOND', '80')),
+            self.rng
+        )
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv('MOCK_GEMINI_ERROR_RATE', '0'))
+        self.output_tokens = output_tokens or int(os.getenv('MOCK_GEMINI_OUTPUT_TOKENS', '600'))
+        self.companies = self._load_companies(mappings_file or Path(__file__).parent / 'company_mappings.json')
+
+    def _load_companies(self, mappings_file: Path) -> List[Tuple[re.Pattern, str, str]]:
+        """Return (keyword pattern, 10-K name, Form 4 name) per company"""
+        try:
+            with open(mappings_file, 'r', encoding='utf-8') as f:
+                detection = json.load(f).get('keyword_detection', {})
+        except (OSError, json.JSONDecodeError):
+            return []
+
+        companies = []
+        for short_name, info in detection.items():
+            keywords = [short_name] + info.get('keywords', [])
+            pattern = re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(k) for k in keywords) + r')(?!\w)', re.IGNORECASE)
+            companies.append((pattern, info.get('10k_name', short_name), info.get('form4_name', short_name)))
+        return companies
+
+    def sample(self) -> Tuple[float, Optional[MockGeminiError]]:
+        """Draw the latency and (possibly) the failure for one call"""
+        with self.rng_lock:
+            delay = self.latency.first_token_seconds()
+            error = None
+            if self.error_rate and self.rng.random() < self.error_rate:
+                code = self.rng.choice((429, 503))
+                error = MockGeminiError(code, 'Resource exhausted' if code == 429 else 'Service unavailable')
+        return delay, error
+
+    def find_company(self, text: str) -> Optional[Tuple[str, str]]:
+        for pattern, tenk_name, form4_name in self.companies:
+            if pattern.search(text):
+                return tenk_name, form4_name
+        return None
+
+    def respond(self, prompt: str) -> str:
+        """Build a response of the shape the prompt asks for"""
+        query = prompt
+        for marker in QUERY_MARKERS:
+            if marker in prompt:
+                query = prompt.rsplit(marker, 1)[1].strip()
+                break
+
+        company = self.find_company(query)
+        tenk_name, form4_name = company or ('Apple Inc', 'Apple_Inc')
+        years = YEAR_PATTERN.findall(query)
+        instructions = prompt[:INSTRUCTION_CHARS]
+
+        if "respond with just 'OK'" in instructions:
+            return 'OK'
+
+        start, end = (years[0], years[-1]) if years else ('2024', '2024')
+        confidence = 'high' if company else 'low'
+        tenk_parameters = {
+            'year': ','.join(years) if years else 'latest',
+            'company': tenk_name,
+            'form_type': '10-K',
+            'category': 'Part I: Business and Risk Factors',
+            'subcategory': 'Item 1A. Risk Factors' if 'risk' in query.lower() else 'general',
+            'items': ['Item 1A. Risk Factors'] if 'risk' in query.lower() else []
+        }
+        eightk_parameters = {
+            'company': tenk_name,
+            'analysis_focus': 'all',
+            'time_period': years[0] if years else None,
+            'confidence': confidence
+        }
+        insider_parameters = {
+            'company': form4_name,
+            'date_range': {'start_date': f"{start}-01-01", 'end_date': f"{end}-12-31"},
+            'analysis_type': 'all',
+            'confidence': confidence
+        }
+
+        if '"tools_to_use"' in instructions:
+            return json.dumps({
+                'enhanced_query': f"Comprehensive SEC analysis: {query}",
+                'analysis_scope': 'Business fundamentals, recent material events and insider activity',
+                'tools_to_use': [
+                    {'tool': 'sec_tools', 'query': f"10-K analysis: {query}",
+                     'rationale': 'Business fundamentals', 'parameters': tenk_parameters},
+                    {'tool': 'sec_8k_analyzer', 'query': f"8-K analysis: {query}",
+                     'rationale': 'Material events', 'parameters': eightk_parameters},
+                    {'tool': 'sec_insider_analyzer', 'query': f"Form 4 analysis: {query}",
+                     'rationale': 'Insider activity', 'parameters': insider_parameters}
+                ],
+                'expected_insights': 'Integrated view across filing types'
+            })
+
+        if '"subcategory"' in instructions:
+            return json.dumps({
+                'enhanced_query': f"Analyze {tenk_name}'s 10-K disclosures: {query}",
+                'parameters': tenk_parameters
+            })
+
+        if '"analysis_focus"' in instructions:
+            return json.dumps(eightk_parameters)
+
+        if '"dates_found"' in instructions:
+            return json.dumps({
+                'dates_found': [{'original_text': year, 'standardized_date': f"{year}-12-31", 'date_type': 'partial'}
+                                for year in years],
+                'date_range': insider_parameters['date_range'],
+                'company': {'original_text': tenk_name, 'standardized_name': tenk_name, 'confidence': confidence},
+                'processed_query': query
+            })
+
+        if '"date_range"' in instructions:
+            return json.dumps(insider_parameters)
+
+        if '"processing_status"' in instructions:
+            return json.dumps({
+                'chunk_id': 1,
+                'company': tenk_name,
+                'year': years[-1] if years else '2024',
+                'processing_status': 'completed',
+                'sections': {
+                    'Item 1. Business': {'content': self._filler(80), 'subsections': {}}
+                },
+                'chunk_metadata': {
+                    'sections_attempted': ['Item 1. Business'],
+                    'sections_completed': ['Item 1. Business'],
+                    'next_expected_item': None
+                }
+            })
+
+        if '"CATEGORIES"' in instructions and ('ONLY RETURN THE JSON' in instructions
+                                               or 'Return ONLY the complete JSON' in instructions):
+            form = '8-K' if '8-K' in instructions[:2000] else '10-K'
+            if form == '8-K':
+                categories = {'Section 8 - Other Events': {'Item 8.01 - Other Events': {'content': self._filler(80)}}}
+            else:
+                categories = {'Part I: Business and Risk Factors': {'Item 1. Business': {'content': self._filler(80)}}}
+            return json.dumps({tenk_name: {years[-1] if years else '2024': {'FORM': form, 'CATEGORIES': categories}}})
+
+        return (f"# Analysis\n\n## Executive Summary\n{self._filler(self.output_tokens // 3)}\n\n"
+                f"## Key Findings\n- {self._filler(self.output_tokens // 6)}\n- {self._filler(self.output_tokens // 6)}\n\n"
+                f"## Conclusions\n{self._filler(self.output_tokens // 3)}\n\n"
+                f"*Generated by the mock Gemini backend.*")
+
+    def _filler(self, tokens: int) -> str:
+        words = ('revenue', 'segment', 'risk', 'growth', 'filing', 'margin', 'operations',
+                 'market', 'disclosure', 'quarter', 'guidance', 'liquidity')
+        with self.rng_lock:
+            return ' '.join(self.rng.choice(words) for _ in range(max(1, tokens))) + '.'
+
+
+class MockResponse:
+    """Response (or streamed chunk) with the attributes callers read from the SDK"""
+
+    def __init__(self, text: str, prompt_tokens: int, output_tokens: int):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+
+
+class MockStream:
+    """Streaming response that releases chunks at the configured throughput"""
+
+    def __init__(self, chunks: List[str], prompt_tokens: int, chunk_seconds: float):
+        self._chunks = chunks
+        self._prompt_tokens = prompt_tokens
+        self._chunk_seconds = chunk_seconds
+        self.usage_metadata = None
+
+    def __iter__(self) -> Iterator[MockResponse]:
+        output_tokens = 0
+        for chunk in self._chunks:
+            time.sleep(self._chunk_seconds)
+            output_tokens += count_tokens(chunk)
+            response = MockResponse(chunk, self._prompt_tokens, output_tokens)
+            self.usage_metadata = response.usage_metadata
+            yield response
+
+
+class MockGenerativeModel:
+    """Drop-in replacement for genai.GenerativeModel backed by MockBackend"""
+
+    STREAM_CHUNK_CHARS = 200
+
+    def __init__(self, model_name: str, backend: MockBackend):
+        self.model_name = model_name
+        self.backend = backend
+
+    def generate_content(self, prompt, generation_config=None, stream: bool = False,
+                         request_options: Optional[Dict] = None, **kwargs):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        timeout = (request_options or {}).get('timeout') or kwargs.get('timeout')
+
+        delay, error = self.backend.sample()
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise MockGeminiError(504, 'Deadline exceeded')
+        time.sleep(delay)
+        if error:
+            raise error
+
+        text = self.backend.respond(prompt)
+        prompt_tokens = max(1, count_tokens(prompt))
+        output_tokens = max(1, count_tokens(text))
+
+        if stream:
+            chunks = [text[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(text), self.STREAM_CHUNK_CHARS)]
+            per_chunk = self.backend.latency.output_seconds(output_tokens) / max(1, len(chunks))
+            return MockStream(chunks, prompt_tokens, per_chunk)
+
+        time.sleep(self.backend.latency.output_seconds(output_tokens))
+        return MockResponse(text, prompt_tokens, output_tokens)
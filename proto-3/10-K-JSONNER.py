@@ -1,11 +1,14 @@
 import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 import argparse
 import sys
 from datetime import datetime
 
+# Make the repository-root modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_client import get_model_for
+
 class TenKProcessor:
     def __init__(self, api_key=None):
         """
@@ -19,8 +22,7 @@ class TenKProcessor:
             if not api_key:
                 raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('ingestion', api_key=api_key)
         
         # System prompt from the artifact we created
         self.system_prompt = """# 10-K Form Financial Data Parser System Prompt
@@ -1,12 +1,16 @@
 import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 import argparse
 import sys
 from datetime import datetime
 import re
 
+# Make the repository-root modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_client import get_model_for
+from token_counter import count_tokens
+
 class TenKProcessor:
     def __init__(self, api_key=None, max_tokens_per_chunk=800000):
         """
@@ -21,8 +25,7 @@ class TenKProcessor:
             if not api_key:
                 raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('ingestion', api_key=api_key)
         self.max_tokens_per_chunk = max_tokens_per_chunk
         
         # 10-K section patterns for extraction
@@ -295,7 +298,7 @@ NOTE : ONLY RETURN THE JSON , NO COMMENTS , NO TAG
 
     def estimate_token_count(self, text):
         """
-        Estimate token count for text (rough approximation)
+        Estimate token count for text with the shared token counter
         
         Args:
             text (str): Text to count tokens for
@@ -303,8 +306,7 @@ NOTE : ONLY RETURN THE JSON , NO COMMENTS , NO TAG
         Returns:
             int: Estimated token count
         """
-        # Rough approximation: 1 token ≈ 4 characters for English text
-        return len(text) // 4
+        return count_tokens(text)
 
     def extract_company_info(self, document_content):
         """
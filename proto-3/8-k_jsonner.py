@@ -1,4 +1,3 @@
-import google.generativeai as genai
 import json
 import os
 import sys
@@ -7,11 +6,14 @@ from pathlib import Path
 import time
 from datetime import datetime
 
+# Make the repository-root modules importable
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_client import get_model_for
+
 class FinancialDataProcessor:
     def __init__(self, api_key):
         """Initialize the processor with Google Gemini API key"""
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('ingestion', api_key=api_key)
         
         # System prompt for financial data organization
         self.system_prompt = """# System Prompt: 8-K Financial Data Organization Expert
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Local Query Parser
+Deterministic extraction of company, years, dates and topic from a query using the
+company_mappings.json keyword lists, date regexes and a category lexicon. Parses whose
+confidence reaches QUERY_PARSER_THRESHOLD are used directly instead of an LLM call.
+"""
+
+import calendar
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PARSER_THRESHOLD = float(os.getenv('QUERY_PARSER_THRESHOLD', '0.8'))
+
+YEAR_PATTERN = re.compile(r'\b(20[12]\d)\b')
+YEAR_RANGE_PATTERN = re.compile(r'\b(20[12]\d)\s*(?:-|–|to|through|until)\s*(20[12]\d)\b', re.IGNORECASE)
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTH_PATTERN = re.compile(r'\b(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\.?,?\s+(20[12]\d)\b',
+                           re.IGNORECASE)
+QUARTER_NUMBERS = {'first': 1, 'second': 2, 'third': 3, 'fourth': 4, '1st': 1, '2nd': 2, '3rd': 3, '4th': 4}
+QUARTER_PATTERN = re.compile(r'\b(?:q([1-4])|(first|second|third|fourth|1st|2nd|3rd|4th)\s+quarter)'
+                             r'\s*(?:of\s+|,\s*)?(?:fy\s*)?(20[12]\d)\b', re.IGNORECASE)
+LATEST_PATTERN = re.compile(r'\b(latest|most recent|recent|current|this year)\b', re.IGNORECASE)
+
+# 10-K items by item code: (part, exact item name as stored in gemini_10k)
+TENK_ITEMS = {
+    '1': ('Part I: Business and Risk Factors', 'Item 1. Business'),
+    '1A': ('Part I: Business and Risk Factors', 'Item 1A. Risk Factors'),
+    '1B': ('Part I: Business and Risk Factors', 'Item 1B. Unresolved Staff Comments'),
+    '2': ('Part I: Business and Risk Factors', 'Item 2. Properties'),
+    '3': ('Part I: Business and Risk Factors', 'Item 3. Legal Proceedings'),
+    '4': ('Part I: Business and Risk Factors', 'Item 4. Mine Safety Disclosures'),
+    '5': ('Part II: Financial Information', "Item 5. Market for Registrant's Common Equity, Related Stockholder "
+          "Matters and Issuer Purchases of Equity Securities"),
+    '6': ('Part II: Financial Information', 'Item 6. [Reserved]'),
+    '7': ('Part II: Financial Information', "Item 7. Management's Discussion and Analysis of Financial Condition "
+          "and Results of Operations (MD&A)"),
+    '7A': ('Part II: Financial Information', 'Item 7A. Quantitative and Qualitative Disclosures About Market Risk'),
+    '8': ('Part II: Financial Information', 'Item 8. Financial Statements and Supplementary Data'),
+    '9': ('Part II: Financial Information', 'Item 9. Changes in and Disagreements With Accountants on Accounting '
+          'and Financial Disclosure'),
+    '9A': ('Part II: Financial Information', 'Item 9A. Controls and Procedures'),
+    '9B': ('Part II: Financial Information', 'Item 9B. Other Information'),
+    '10': ('Part III: Governance', 'Item 10. Directors, Executive Officers and Corporate Governance'),
+    '11': ('Part III: Governance', 'Item 11. Executive Compensation'),
+    '12': ('Part III: Governance', 'Item 12. Security Ownership of Certain Beneficial Owners and Management and '
+           'Related Stockholder Matters'),
+    '13': ('Part III: Governance', 'Item 13. Certain Relationships and Related Transactions, and Director '
+           'Independence'),
+    '14': ('Part III: Governance', 'Item 14. Principal Accountant Fees and Services'),
+    '15': ('Part IV: Exhibits and Schedules', 'Item 15. Exhibits, Financial Statement Schedules'),
+    '16': ('Part IV: Exhibits and Schedules', 'Item 16. Form 10-K Summary'),
+}
+ITEM_PATTERN = re.compile(r'\bitems?\s+(\d{1,2}[a-c]?)\b', re.IGNORECASE)
+
+# 10-K topics, most specific first: (keywords, item code). A matched keyword is consumed,
+# so "market risk" selects Item 7A without also selecting Item 1A through "risk".
+# Keywords match whole words only, so plurals and other forms are listed explicitly.
+TENK_LEXICON = [
+    (('market risk', 'market risks', 'interest rate', 'interest rates', 'foreign exchange', 'currency risk'), '7A'),
+    (('risk', 'risks'), '1A'),
+    (('legal proceeding', 'legal proceedings', 'litigation', 'lawsuit', 'lawsuits'), '3'),
+    (('properties', 'facilities', 'real estate'), '2'),
+    (('financial statement', 'financial statements', 'balance sheet', 'cash flow statement'), '8'),
+    (('md&a', 'financial', 'financials', 'revenue', 'revenues', 'income', 'profit', 'profits', 'profitability',
+      'earnings', 'margin', 'margins', 'cash flow', 'cash flows', 'liquidity', 'sales'), '7'),
+    (('executive compensation', 'compensation', 'pay'), '11'),
+    (('governance', 'director', 'directors', 'board', 'executive officer', 'executive officers'), '10'),
+    (('controls and procedures', 'internal control', 'internal controls'), '9A'),
+    (('business', 'businesses', 'segment', 'segments', 'product', 'products', 'competition', 'competitive',
+      'competitors', 'strategy', 'employees', 'customer', 'customers'), '1'),
+]
+
+# 8-K analysis focus, as listed in the 8-K extraction prompt
+EIGHTK_LEXICON = [
+    (('acquisition', 'acquisitions', 'acquire', 'acquired', 'acquires', 'merger', 'mergers', 'purchase',
+      'purchases', 'disposition', 'dispositions'), 'acquisitions'),
+    (('departure', 'departures', 'appoint', 'appointed', 'appointment', 'appointments', 'management',
+      'executive', 'executives', 'leadership', 'director', 'directors', 'ceo', 'cfo'), 'management_changes'),
+    (('debt', 'financing', 'loan', 'loans', 'credit', 'bond', 'bonds', 'notes'), 'debt_financing'),
+    (('agreement', 'agreements', 'contract', 'contracts', 'partnership', 'partnerships'), 'material_agreements'),
+    (('legal', 'litigation', 'lawsuit', 'lawsuits', 'regulatory', 'compliance'), 'legal_matters'),
+    (('regulation fd', 'announcement', 'announcements', 'presentation', 'presentations', 'guidance'),
+     'regulation_fd'),
+    (('financial', 'financials', 'revenue', 'revenues', 'profit', 'profits', 'earnings', 'income', 'results'),
+     'financial_results'),
+]
+
+# Form 4 analysis types, as listed in the insider extraction prompt
+INSIDER_LEXICON = [
+    (('option', 'options', 'grant', 'grants', 'granted', 'exercise', 'exercises', 'exercised', 'rsu', 'rsus'),
+     'stock_options'),
+    (('director', 'directors', 'board'), 'director_activity'),
+    (('ceo', 'cfo', 'coo', 'executive', 'executives', 'officer', 'officers'), 'executive_transactions'),
+    (('large', 'largest', 'biggest', 'significant'), 'large_transactions'),
+    (('sentiment', 'buying', 'selling', 'net'), 'insider_sentiment'),
+    (('recent', 'latest'), 'recent_activity'),
+]
+
+
+@dataclass
+class CompanyAlias:
+    pattern: re.Pattern
+    tenk_name: str
+    form4_name: str
+    strong: bool  # the company's name or ticker, as opposed to a product or topic keyword
+
+
+@dataclass
+class ParsedQuery:
+    """Parameters found in a query and how much to trust them"""
+    query: str
+    company: Optional[str] = None          # 10-K/8-K name, e.g. "Apple Inc"
+    form4_company: Optional[str] = None    # Form 4 name, e.g. "Apple_Inc"
+    company_match: Optional[str] = None    # "name", "keyword" or "ambiguous"
+    years: List[str] = field(default_factory=list)
+    date_range: Optional[Tuple[str, str]] = None  # only when the query names a period
+    category: str = 'all'
+    subcategory: str = 'general'
+    items: List[str] = field(default_factory=list)  # exact 10-K item names, most relevant first
+    analysis_focus: str = 'all'
+    analysis_type: str = 'all'
+    confidence: float = 0.0
+
+    @property
+    def confident(self) -> bool:
+        return self.confidence >= PARSER_THRESHOLD
+
+    @property
+    def confidence_label(self) -> str:
+        if self.company_match == 'name':
+            return 'high'
+        return 'medium' if self.company else 'low'
+
+    def tenk_parameters(self) -> Dict:
+        """Parameters in the shape SECFormsTools expects"""
+        return {
+            'year': ','.join(self.years) if self.years else 'latest',
+            'company': self.company or 'Unknown Company',
+            'form_type': '10-K',
+            'category': self.category,
+            'subcategory': self.subcategory,
+            'items': list(self.items)
+        }
+
+    def eightk_parameters(self) -> Dict:
+        """Parameters in the shape SEC8KAnalyzer expects"""
+        return {
+            'company': self.company or 'Unknown Company',
+            'analysis_focus': self.analysis_focus,
+            'time_period': self.years[0] if len(self.years) == 1 else None,
+            'confidence': self.confidence_label
+        }
+
+    def insider_parameters(self) -> Optional[Dict]:
+        """Parameters in the shape InsiderTradingAnalyzer expects, or None if the query names no period"""
+        if not self.date_range:
+            return None
+        return {
+            'company': self.form4_company or 'Unknown Company',
+            'date_range': {'start_date': self.date_range[0], 'end_date': self.date_range[1]},
+            'analysis_type': self.analysis_type,
+            'confidence': self.confidence_label
+        }
+
+
+@lru_cache(maxsize=None)
+def load_company_aliases(mappings_file: Optional[str] = None) -> Tuple[CompanyAlias, ...]:
+    """
+    Build one matcher per company alias from company_mappings.json
+
+    Names match case-insensitively ("and" also matches "&"); all-caps tickers match
+    only in capitals so "ZM" or "DASH" do not fire on ordinary words.
+    """
+    path = Path(mappings_file) if mappings_file else Path(__file__).parent / 'company_mappings.json'
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            detection = json.load(f).get('keyword_detection', {})
+    except (OSError, json.JSONDecodeError):
+        return ()
+
+    aliases = []
+    for short_name, info in detection.items():
+        tenk_name = info.get('10k_name', short_name)
+        form4_name = info.get('form4_name', short_name)
+        names = {short_name.lower(), tenk_name.lower()}
+        for keyword in dict.fromkeys([short_name, tenk_name] + info.get('keywords', [])):
+            ticker = keyword.isupper() and keyword.lower() not in names
+            strong = ticker or keyword.lower() in names or '&' in keyword
+            text = re.escape(keyword).replace('\\&', r'\s*(?:&|and)\s*').replace('\\ ', r'\s+')
+            flags = 0 if ticker else re.IGNORECASE
+            aliases.append(CompanyAlias(re.compile(r'(?<!\w)' + text + r"(?:'s)?(?!\w)", flags),
+                                        tenk_name, form4_name, strong))
+    return tuple(aliases)
+
+
+def _match_lexicon(text: str, lexicon) -> Optional[tuple]:
+    for entry in lexicon:
+        if any(re.search(r'\b' + re.escape(keyword) + r'\b', text) for keyword in entry[0]):
+            return entry
+    return None
+
+
+def _match_items(query: str, text: str) -> List[str]:
+    """
+    10-K item codes the query names ("Item 7", "items 1A and 7A") or implies by topic
+
+    Explicit items come first; each topic keyword is consumed by the first lexicon
+    entry that matches it so broader entries don't fire on the same words.
+    """
+    codes = []
+    for match in ITEM_PATTERN.finditer(query):
+        codes.append(match.group(1).upper())
+    # "items 1A and 7A" (or "Item 7 and 7A") lists further codes after the first
+    for match in re.finditer(r'\bitems?\s+\d{1,2}[a-c]?((?:\s*(?:,|and|&)\s*\d{1,2}[a-c]?\b)+)', query, re.IGNORECASE):
+        codes.extend(code.upper() for code in re.findall(r'\d{1,2}[a-c]?', match.group(1), re.IGNORECASE))
+
+    remaining = text
+    for keywords, code in TENK_LEXICON:
+        pattern = re.compile('|'.join(r'\b' + re.escape(keyword) + r'\b' for keyword in keywords))
+        if pattern.search(remaining):
+            codes.append(code)
+            remaining = pattern.sub(' ', remaining)
+    return [code for code in dict.fromkeys(codes) if code in TENK_ITEMS]
+
+
+def _month_range(year: int, month: int) -> Tuple[str, str]:
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+def _parse_dates(query: str) -> Tuple[List[str], Optional[Tuple[str, str]]]:
+    """Return the years mentioned and the date range they (or a month/quarter) describe"""
+    ranges = []
+    for match in MONTH_PATTERN.finditer(query):
+        ranges.append(_month_range(int(match.group(2)), MONTHS[match.group(1).lower()]))
+    for match in QUARTER_PATTERN.finditer(query):
+        quarter = int(match.group(1)) if match.group(1) else QUARTER_NUMBERS[match.group(2).lower()]
+        year = int(match.group(3))
+        ranges.append((_month_range(year, quarter * 3 - 2)[0], _month_range(year, quarter * 3)[1]))
+
+    years = set(YEAR_PATTERN.findall(query))
+    for match in YEAR_RANGE_PATTERN.finditer(query):
+        start, end = sorted((int(match.group(1)), int(match.group(2))))
+        years.update(str(year) for year in range(start, end + 1))
+    years = sorted(years)
+
+    if ranges:
+        return years, (min(r[0] for r in ranges), max(r[1] for r in ranges))
+    if years:
+        return years, (f"{years[0]}-01-01", f"{years[-1]}-12-31")
+    return years, None
+
+
+def parse_query(query: str, mappings_file: Optional[str] = None) -> ParsedQuery:
+    """
+    Extract parameters from a query without calling the LLM
+
+    Confidence adds up from three signals: the company (0.6 when named or given by
+    ticker, 0.3 when only implied by a product or topic keyword, capped at 0.3 when
+    several companies match), the period (0.3 for an explicit year or date, 0.2 when
+    the query asks for the latest filing, 0.1 when it says nothing about time) and the
+    topic (0.1 when the lexicon recognises it). A named company on its own scores 0.7,
+    so it takes a topic or a period to reach the default threshold.
+
+    Args:
+        query (str): User query
+        mappings_file (str): Optional path to company_mappings.json
+
+    Returns:
+        ParsedQuery: Parameters for every tool plus a confidence between 0 and 1
+    """
+    parsed = ParsedQuery(query=query)
+    text = query.lower()
+
+    matches = {}
+    for alias in load_company_aliases(mappings_file):
+        if alias.pattern.search(query):
+            strong = matches.get(alias.tenk_name, (None, False))[1] or alias.strong
+            matches[alias.tenk_name] = (alias.form4_name, strong)
+
+    company_score = 0.0
+    if matches:
+        named = [name for name, (_, strong) in matches.items() if strong]
+        candidates = named or list(matches)
+        parsed.company = candidates[0]
+        parsed.form4_company = matches[parsed.company][0]
+        if len(candidates) > 1:
+            parsed.company_match = 'ambiguous'
+            company_score = 0.3
+        else:
+            parsed.company_match = 'name' if named else 'keyword'
+            company_score = 0.6 if named else 0.3
+
+    parsed.years, parsed.date_range = _parse_dates(query)
+    if parsed.years or parsed.date_range:
+        time_score = 0.3
+    elif LATEST_PATTERN.search(text):
+        time_score = 0.2
+    else:
+        time_score = 0.1
+
+    topic_score = 0.0
+    item_codes = _match_items(query, text)
+    if item_codes:
+        parsed.category, parsed.subcategory = TENK_ITEMS[item_codes[0]]
+        parsed.items = [TENK_ITEMS[code][1] for code in item_codes]
+        topic_score = 0.1
+    eightk_topic = _match_lexicon(text, EIGHTK_LEXICON)
+    if eightk_topic:
+        parsed.analysis_focus = eightk_topic[1]
+    insider_topic = _match_lexicon(text, INSIDER_LEXICON)
+    if insider_topic:
+        parsed.analysis_type = insider_topic[1]
+    if (eightk_topic or insider_topic) and not topic_score:
+        topic_score = 0.1
+
+    parsed.confidence = round(company_score + time_score + topic_score, 2)
+    return parsed
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Results Cache
+Bounded LRU + TTL cache for analysis results with an optional SQLite disk tier
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from mock_gemini import active_backend
+
+logger = logging.getLogger(__name__)
+
+YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')
+
+
+def load_company_aliases(mappings_file: Path) -> Tuple[Optional[re.Pattern], Dict[str, str]]:
+    """
+    Build an alias pattern that resolves company mentions to their canonical name
+
+    Only names and tickers are used as aliases; topical keywords such as
+    "streaming" or "healthcare" would make unrelated queries collide.
+
+    Args:
+        mappings_file (Path): Path to company_mappings.json
+
+    Returns:
+        Tuple[Optional[re.Pattern], Dict[str, str]]: Pattern matching any alias, and
+            lower-case alias -> canonical lower-case company name
+    """
+    try:
+        with open(mappings_file, 'r', encoding='utf-8') as f:
+            mappings = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load company aliases from {mappings_file}: {e}")
+        return None, {}
+
+    aliases = {}
+    for short_name, info in mappings.get('keyword_detection', {}).items():
+        canonical = info.get('10k_name', short_name).lower()
+        names = [short_name, info.get('10k_name', short_name)]
+        names += [kw for kw in info.get('keywords', []) if kw.isupper() or '&' in kw]
+        for name in names:
+            aliases[name.lower()] = canonical
+
+    if not aliases:
+        return None, {}
+
+    # Longest alias first so "apple inc" wins over "apple"
+    alternation = '|'.join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+    return re.compile(r"(?<!\w)(" + alternation + r")(?:'s)?(?!\w)"), aliases
+
+
+class ResultsCache:
+    """Thread-safe LRU + TTL cache with a byte limit and an optional SQLite disk tier"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: int = 24 * 3600, db_path: Optional[str] = None,
+                 mappings_file: Optional[Path] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries (int): Maximum number of results kept in memory
+            max_bytes (int): Maximum serialized size of the in-memory tier
+            ttl (int): Seconds before a cached result expires (both tiers)
+            db_path (str): SQLite file for the disk tier, or None to keep results in memory only
+            mappings_file (Path): company_mappings.json used to resolve company aliases in keys
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+
+        self.alias_pattern, self.company_aliases = load_company_aliases(
+            mappings_file or Path(__file__).parent / 'company_mappings.json'
+        )
+
+        # key -> (expires_at, size, serialized value); ordered from least to most recently used
+        self._entries: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'oversized': 0
+        }
+
+        self._db = None
+        if db_path:
+            self._open_disk_tier(db_path)
+
+    def _open_disk_tier(self, db_path: str):
+        """Open (and create if needed) the SQLite disk tier"""
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Results cache disk tier disabled ({db_path}): {e}")
+            self._db = None
+
+    def normalize_query(self, query: str) -> Dict:
+        """
+        Normalize a query so trivially different phrasings share a cache entry
+
+        Args:
+            query (str): User query
+
+        Returns:
+            Dict: Normalized text plus the resolved company and years
+        """
+        text = ' '.join(query.lower().split())
+
+        companies = []
+        if self.alias_pattern:
+            def resolve(match):
+                canonical = self.company_aliases[match.group(1)]
+                companies.append(canonical)
+                return canonical
+            text = self.alias_pattern.sub(resolve, text)
+        company = companies[0] if companies else None
+
+        text = re.sub(r"[^\w&\s]", ' ', text)
+        text = ' '.join(text.split())
+        years = sorted(set(YEAR_PATTERN.findall(text)))
+
+        return {'text': text, 'company': company, 'years': years}
+
+    def make_key(self, query: str) -> str:
+        """Build the cache key for a query"""
+        normalized = self.normalize_query(query)
+        key = f"{normalized['company'] or '-'}|{','.join(normalized['years']) or '-'}|{normalized['text']}"
+        # Results produced by the mock backend are keyed apart from real ones
+        backend = active_backend()
+        return key if backend == 'google' else f"{backend}|{key}"
+
+    def get(self, query: str) -> Optional[Dict]:
+        """
+        Look up a cached result
+
+        Args:
+            query (str): User query
+
+        Returns:
+            Optional[Dict]: The cached result, or None on a miss
+        """
+        key = self.make_key(query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return json.loads(value)
+                self._remove(key)
+                self._counters['expirations'] += 1
+
+            row = self._disk_get(key, now)
+            if row:
+                value, expires_at = row
+                self._insert(key, value, expires_at)
+                self._counters['disk_hits'] += 1
+                return json.loads(value)
+
+            self._counters['misses'] += 1
+            return None
+
+    def set(self, query: str, result: Dict):
+        """
+        Cache a result for a query
+
+        Args:
+            query (str): User query
+            result (Dict): JSON-serializable analysis result
+        """
+        key = self.make_key(query)
+        value = json.dumps(result, default=str)
+        expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._insert(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+
+    def clear(self):
+        """Drop every cached result from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Return hit/miss/eviction counters and current usage"""
+        with self._lock:
+            lookups = self._counters['memory_hits'] + self._counters['disk_hits'] + self._counters['misses']
+            hits = self._counters['memory_hits'] + self._counters['disk_hits']
+            return {
+                **self._counters,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'disk_tier': self.db_path if self._db else None
+            }
+
+    def _insert(self, key: str, value: str, expires_at: float):
+        """Add an entry to the memory tier and evict down to the limits (caller holds the lock)"""
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            # Too large for memory; it can still be served from disk
+            self._counters['oversized'] += 1
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key: str):
+        """Remove an entry from the memory tier (caller holds the lock)"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """Read an unexpired entry from the disk tier (caller holds the lock)"""
+        if not self._db:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] <= now:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+                self._counters['expirations'] += 1
+                return None
+            return row
+        except sqlite3.Error as e:
+            logger.warning(f"Results cache disk read failed: {e}")
+            return None
+
+    def _disk_set(self, key: str, value: str, expires_at: float):
+        """Write an entry to the disk tier (caller holds the lock)"""
+        if not self._db:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Results cache disk write failed: {e}")
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Full-Text Search Index
+BM25 inverted index over paragraph passages of every 10-K, 8-K and 10-Q source, stored as
+flat typed arrays in one memory-mapped file so queries only touch the postings they need
+"""
+
+import argparse
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from company_resolver import get_resolver
+from filing_corpus import FORMS, Source, iter_passages, iter_sources, normalize_form
+from index_refresher import IndexRefresher
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+MAGIC = b'SECBM25\x00'
+DEFAULT_INDEX_PATH = Path(__file__).parent / 'cache' / 'search_index.bin'
+
+K1 = 1.2
+B = 0.75
+STALE_CHECK_INTERVAL = 60  # default seconds between background checks of the source files
+
+TOKEN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or our such that the their '
+    'this to was were which will with we us any all these those other may not also'.split()
+)
+PERIODS = ('', 'Q1', 'Q2', 'Q3', 'Q4')
+
+
+def _stem(word: str) -> str:
+    """Fold simple plurals ("risks" -> "risk", "liabilities" -> "liability")"""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, stemmed index terms of a text, without stopwords"""
+    return [_stem(word) for word in TOKEN.findall(text.lower()) if word not in STOPWORDS]
+
+
+@dataclass
+class SearchHit:
+    """One ranked passage"""
+    score: float
+    company: str
+    form: str
+    year: str
+    period: str
+    section: str
+    text: str
+    source: str
+
+
+class SearchIndex:
+    """
+    Read-only BM25 index backed by a memory-mapped file
+
+    File layout: an 8-byte magic, the header length, a JSON header (corpus statistics,
+    company/section names, source versions and the offset of each array), then 8-byte
+    aligned arrays. Terms are stored sorted so a lookup is a binary search, and each
+    term's postings are ascending passage ids, so a company's passages (stored
+    contiguously) are found by bisecting the postings instead of scanning them.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open an index file
+
+        Args:
+            path (str): Index file (default SEARCH_INDEX_PATH or cache/search_index.bin)
+
+        Raises:
+            ValueError: If the file is not a search index of this version
+        """
+        self.path = Path(path or os.getenv('SEARCH_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        with open(self.path, 'rb') as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapped[:8] != MAGIC:
+            raise ValueError(f"Not a search index: {self.path}")
+        header_length = int.from_bytes(self._mapped[8:16], 'little')
+        self.header = json.loads(self._mapped[16:16 + header_length])
+        if self.header.get('version') != INDEX_VERSION or self.header.get('byteorder') != sys.byteorder:
+            raise ValueError(f"Search index {self.path} was built by another version or platform")
+
+        view = memoryview(self._mapped)
+        self._arrays = {name: view[offset:offset + count * array(typecode).itemsize].cast(typecode)
+                        for name, (offset, typecode, count) in self.header['arrays'].items()}
+        self.companies: List[str] = self.header['companies']
+        self.sections: List[str] = self.header['sections']
+        self.n_docs: int = self.header['n_docs']
+        self._term_count = len(self._arrays['term_starts']) - 1
+
+        # company -> [(form id, first passage, end passage)] from the per-source table
+        self._company_ranges: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+        starts = self._arrays['source_starts']
+        for index in range(len(starts) - 1):
+            self._company_ranges[self._arrays['source_company'][index]].append(
+                (self._arrays['source_form'][index], starts[index], starts[index + 1]))
+
+    @classmethod
+    def build(cls, path: Optional[str] = None, sources: Optional[Iterable[Source]] = None) -> 'SearchIndex':
+        """
+        Index every passage of the corpus and write the index file
+
+        Args:
+            path (str): Index file (default SEARCH_INDEX_PATH or cache/search_index.bin)
+            sources (Iterable[Source]): Files to index (default iter_sources())
+
+        Returns:
+            SearchIndex: The new index, opened
+        """
+        path = Path(path or os.getenv('SEARCH_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        start_time = time.perf_counter()
+        sources = sorted(sources if sources is not None else iter_sources(),
+                         key=lambda source: (source.company, FORMS.index(source.form), str(source.path)))
+
+        companies: Dict[str, int] = {}
+        sections: Dict[str, int] = {}
+        postings: Dict[str, Tuple[array, array]] = {}
+        columns = {'doc_length': array('I'), 'doc_company': array('I'), 'doc_form': array('B'),
+                   'doc_year': array('H'), 'doc_period': array('B'), 'doc_section': array('I'),
+                   'text_start': array('Q'), 'text_length': array('I')}
+        source_table = {'source_starts': array('I'), 'source_company': array('I'), 'source_form': array('B')}
+        text = bytearray()
+        versions = []
+
+        for source in sources:
+            stat = source.path.stat()
+            versions.append([str(source.path), stat.st_mtime_ns, stat.st_size])
+            company_id = companies.setdefault(source.company, len(companies))
+            source_table['source_starts'].append(len(columns['doc_length']))
+            source_table['source_company'].append(company_id)
+            source_table['source_form'].append(FORMS.index(source.form))
+
+            for passage in iter_passages(source):
+                doc_id = len(columns['doc_length'])
+                terms = Counter(tokenize(f"{passage.section}\n{passage.text}"))
+                for term, frequency in terms.items():
+                    entry = postings.get(term)
+                    if entry is None:
+                        entry = postings[term] = (array('I'), array('H'))
+                    entry[0].append(doc_id)
+                    entry[1].append(min(frequency, 0xFFFF))
+
+                encoded = passage.text.encode('utf-8')
+                columns['doc_length'].append(sum(terms.values()))
+                columns['doc_company'].append(company_id)
+                columns['doc_form'].append(FORMS.index(passage.form))
+                columns['doc_year'].append(int(passage.year) if passage.year.isdigit() else 0)
+                columns['doc_period'].append(PERIODS.index(passage.period) if passage.period in PERIODS else 0)
+                columns['doc_section'].append(sections.setdefault(passage.section, len(sections)))
+                columns['text_start'].append(len(text))
+                columns['text_length'].append(len(encoded))
+                text.extend(encoded)
+        source_table['source_starts'].append(len(columns['doc_length']))
+
+        n_docs = len(columns['doc_length'])
+        average_length = sum(columns['doc_length']) / n_docs if n_docs else 0.0
+        norms = array('f', (K1 * (1 - B + B * length / average_length) if average_length else K1
+                            for length in columns['doc_length']))
+
+        terms_blob = bytearray()
+        term_starts, posting_starts = array('Q', [0]), array('Q', [0])
+        posting_docs, posting_tfs = array('I'), array('H')
+        for term in sorted(postings):
+            docs, frequencies = postings.pop(term)
+            terms_blob.extend(term.encode('utf-8'))
+            term_starts.append(len(terms_blob))
+            posting_docs.extend(docs)
+            posting_tfs.extend(frequencies)
+            posting_starts.append(len(posting_docs))
+
+        arrays = {**columns, **source_table, 'norms': norms, 'terms': array('B', terms_blob),
+                  'term_starts': term_starts, 'posting_starts': posting_starts,
+                  'posting_docs': posting_docs, 'posting_tfs': posting_tfs, 'text': array('B', text)}
+        header = {
+            'version': INDEX_VERSION,
+            'byteorder': sys.byteorder,
+            'built_at': time.time(),
+            'n_docs': n_docs,
+            'average_length': average_length,
+            'companies': list(companies),
+            'sections': list(sections),
+            'sources': versions
+        }
+        cls._write(path, header, arrays)
+        logger.info(f"Built search index of {n_docs} passages and {len(term_starts) - 1} terms "
+                    f"in {time.perf_counter() - start_time:.1f}s")
+        return cls(path)
+
+    @staticmethod
+    def _write(path: Path, header: Dict, arrays: Dict[str, array]):
+        """Write header and arrays to a temporary file and swap it in atomically"""
+        layout, offset = {}, 0
+        for name, values in arrays.items():
+            layout[name] = [offset, values.typecode, len(values)]
+            offset += -(-len(values) * values.itemsize // 8) * 8
+
+        # The header holds absolute offsets, so grow the data start until the header fits before it
+        data_start = 16
+        while True:
+            absolute = {name: [data_start + entry[0], *entry[1:]] for name, entry in layout.items()}
+            header_bytes = json.dumps({**header, 'arrays': absolute}, separators=(',', ':')).encode('utf-8')
+            if 16 + len(header_bytes) <= data_start:
+                break
+            data_start = -(-(16 + len(header_bytes)) // 8) * 8
+        header_bytes += b' ' * (data_start - 16 - len(header_bytes))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC + len(header_bytes).to_bytes(8, 'little') + header_bytes)
+                for values in arrays.values():
+                    values.tofile(f)
+                    f.write(b'\0' * (-f.tell() % 8))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def is_stale(self) -> bool:
+        """True if a source file was added, removed or changed since the index was built"""
+        current = []
+        for source in iter_sources():
+            stat = source.path.stat()
+            current.append([str(source.path), stat.st_mtime_ns, stat.st_size])
+        return sorted(current) != sorted(self.header['sources'])
+
+    def search(self, query: str, company: Optional[str] = None, years: Optional[Iterable] = None,
+               forms: Optional[Iterable[str]] = None, k: int = 10) -> List[SearchHit]:
+        """
+        Rank passages against a query with BM25
+
+        Args:
+            query (str): Free-text query
+            company (str): Only this company (name, ticker or CIK)
+            years (Iterable): Only these filing years
+            forms (Iterable[str]): Only these forms ("10-K", "8-K", "10-Q")
+            k (int): Number of hits to return
+
+        Returns:
+            List[SearchHit]: Best passages first (empty if nothing matches)
+        """
+        ranges = self._doc_ranges(company, forms)
+        if ranges is not None and not ranges:
+            return []
+        year_filter = {int(year) for year in years} if years else None
+
+        docs, frequencies = self._arrays['posting_docs'], self._arrays['posting_tfs']
+        norms, year_column = self._arrays['norms'], self._arrays['doc_year']
+        posting_starts = self._arrays['posting_starts']
+
+        # Rarest terms first; each term adds at most idf * (K1 + 1) to a passage's score
+        terms = []
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id is not None:
+                start, end = posting_starts[term_id], posting_starts[term_id + 1]
+                idf = math.log(1 + (self.n_docs - (end - start) + 0.5) / (end - start + 0.5))
+                terms.append((end - start, idf, start, end))
+        terms.sort()
+        remaining = sum(idf * (K1 + 1) for _, idf, _, _ in terms)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for df, idf, start, end in terms:
+            if len(scores) >= k and len(scores) * 16 < df \
+                    and heapq.nlargest(k, scores.values())[-1] >= remaining:
+                # MaxScore: a passage without any of the rarer terms can no longer reach
+                # the top k, so the remaining common terms only update existing candidates
+                for doc_id in scores:
+                    position = bisect_left(docs, doc_id, start, end)
+                    if position < end and docs[position] == doc_id:
+                        frequency = frequencies[position]
+                        scores[doc_id] += idf * frequency * (K1 + 1) / (frequency + norms[doc_id])
+            else:
+                if ranges is None:
+                    spans = [(start, end)]
+                else:
+                    spans = [(bisect_left(docs, first, start, end), bisect_left(docs, last, start, end))
+                             for first, last in ranges]
+                weight = idf * (K1 + 1)
+                for span_start, span_end in spans:
+                    postings = zip(docs[span_start:span_end], frequencies[span_start:span_end])
+                    if year_filter is not None:
+                        postings = ((doc_id, frequency) for doc_id, frequency in postings
+                                    if year_column[doc_id] in year_filter)
+                    for doc_id, frequency in postings:
+                        scores[doc_id] += weight * frequency / (frequency + norms[doc_id])
+            remaining -= idf * (K1 + 1)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self._hit(doc_id, score) for doc_id, score in top]
+
+    def passage(self, doc_id: int) -> str:
+        """Text of one passage"""
+        start = self._arrays['text_start'][doc_id]
+        return bytes(self._arrays['text'][start:start + self._arrays['text_length'][doc_id]]).decode('utf-8')
+
+    def _hit(self, doc_id: int, score: float) -> SearchHit:
+        year = self._arrays['doc_year'][doc_id]
+        return SearchHit(
+            score=round(score, 4),
+            company=self.companies[self._arrays['doc_company'][doc_id]],
+            form=FORMS[self._arrays['doc_form'][doc_id]],
+            year=str(year) if year else '',
+            period=PERIODS[self._arrays['doc_period'][doc_id]],
+            section=self.sections[self._arrays['doc_section'][doc_id]],
+            text=self.passage(doc_id),
+            source=self._source_path(doc_id)
+        )
+
+    def _source_path(self, doc_id: int) -> str:
+        return self.header['sources'][bisect_left(self._arrays['source_starts'], doc_id + 1) - 1][0]
+
+    def _doc_ranges(self, company: Optional[str], forms: Optional[Iterable[str]]) -> Optional[List[Tuple[int, int]]]:
+        """Passage id ranges allowed by the company and form filters; None means all"""
+        form_ids = None
+        if forms:
+            form_ids = {FORMS.index(name) for name in map(normalize_form, forms) if name}
+        if company is None and form_ids is None:
+            return None
+
+        if company is not None:
+            resolved = get_resolver().resolve(company)
+            key = resolved.key if resolved else company
+            company_ids = [self.companies.index(key)] if key in self.companies else []
+        else:
+            company_ids = list(self._company_ranges)
+
+        ranges = []
+        for company_id in company_ids:
+            for form_id, first, last in self._company_ranges[company_id]:
+                if form_ids is None or form_id in form_ids:
+                    if ranges and ranges[-1][1] == first:
+                        ranges[-1] = (ranges[-1][0], last)
+                    else:
+                        ranges.append((first, last))
+        return ranges
+
+    def _term_id(self, term: str) -> Optional[int]:
+        """Binary search of the sorted term list"""
+        target = term.encode('utf-8')
+        blob, starts = self._arrays['terms'], self._arrays['term_starts']
+        low, high = 0, self._term_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = bytes(blob[starts[middle]:starts[middle + 1]])
+            if candidate < target:
+                low = middle + 1
+            elif candidate > target:
+                high = middle
+            else:
+                return middle
+        return None
+
+
+_refresher = IndexRefresher('search index', SearchIndex, SearchIndex.build,
+                            float(os.getenv('SEARCH_INDEX_REFRESH', STALE_CHECK_INTERVAL)))
+
+
+def get_search_index(wait: bool = False) -> SearchIndex:
+    """
+    Return the process-wide search index
+
+    The index is built in the background when missing, and rebuilt there when the source
+    files change (checked every SEARCH_INDEX_REFRESH seconds); the current index keeps
+    serving until the new one replaces it.
+
+    Args:
+        wait (bool): Build or rebuild now if needed and wait for it (for the CLI)
+
+    Raises:
+        IndexUnavailable: If the index has not been built yet and wait is not set
+    """
+    return _refresher.get(wait=wait)
+
+
+def search(query: str, company: Optional[str] = None, years: Optional[Iterable] = None,
+           forms: Optional[Iterable[str]] = None, k: int = 10) -> List[SearchHit]:
+    """Search the process-wide index (see SearchIndex.search)"""
+    return get_search_index().search(query, company=company, years=years, forms=forms, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the full-text search index')
+    parser.add_argument('query', nargs='?', help='Search query (omit to only build the index)')
+    parser.add_argument('--company', help='Company name, ticker or CIK')
+    parser.add_argument('--years', nargs='+', help='Filing years')
+    parser.add_argument('--forms', nargs='+', help='Forms: 10-K, 8-K, 10-Q')
+    parser.add_argument('-k', type=int, default=5, help='Number of hits')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index first')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index = SearchIndex.build() if args.rebuild else get_search_index(wait=True)
+    print(f"📦 {index.n_docs} passages indexed in {index.path} ({time.perf_counter() - start_time:.1f}s)")
+    if not args.query:
+        return
+
+    start_time = time.perf_counter()
+    hits = index.search(args.query, company=args.company, years=args.years, forms=args.forms, k=args.k)
+    print(f"🔍 {len(hits)} hit(s) in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+    for rank, hit in enumerate(hits, 1):
+        period = f" {hit.period}" if hit.period else ''
+        print(f"\n{rank}. [{hit.score:.2f}] {hit.company} {hit.form} {hit.year}{period} - {hit.section}")
+        print(f"   {hit.text[:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
-import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 from datetime import datetime, timedelta
 import re
 from typing import Dict, List, Optional, Tuple
 import argparse
 from dotenv import load_dotenv
+from json_index import open_index
+from llm_client import get_model_for
 
 # Load environment variables
 load_dotenv()
@@ -21,13 +21,7 @@ class DateBasedSECAnalyzer:
             json_folder_path (str): Path to folder containing SEC forms JSON files
             json_file_path (str): Path to specific JSON file (deprecated, use json_folder_path)
         """
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('date_analysis', api_key=api_key)
         
         # Handle both folder and single file paths for backward compatibility
         if json_folder_path:
@@ -553,9 +547,9 @@ Query: "What happened between January and March 2021?"
             return {"error": f"JSON file not found: {self.json_file_path}"}
         
         try:
-            print(f"📖 Reading JSON file: {self.json_file_path}")
-            with open(self.json_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            print(f"📖 Indexing JSON file: {self.json_file_path}")
+            # Filings are decoded from byte offsets; only dates are read for filings outside the range
+            index = open_index(self.json_file_path, max_depth=4)
             
             date_range = dates_data.get("date_range", {})
             start_date = date_range.get("start_date")
@@ -566,45 +560,49 @@ Query: "What happened between January and March 2021?"
             relevant_sections = {}
             
             # Navigate through JSON structure to find date-based entries
-            for company, company_data in data.items():
-                print(f"📊 Analyzing company: {company}")
-                company_filings = []
+            with index.mapped() as view:
+                for company in index.keys():
+                    print(f"📊 Analyzing company: {company}")
+                    company_filings = []
                 
-                # Handle different JSON structures
-                if isinstance(company_data, dict):
-                    # Structure: {year: [filings]} or {year: {data}}
-                    for year_key, year_data in company_data.items():
-                        if isinstance(year_data, list):
-                            # Array of filings under year key
-                            for filing in year_data:
-                                if self._is_filing_in_date_range(filing, start_date, end_date):
-                                    company_filings.append(filing)
-                                    filing_date = filing.get("FILING_DATE", "unknown")
-                                    print(f"✓ Found relevant filing dated: {filing_date}")
-                        elif isinstance(year_data, dict):
-                            # Single filing or other structure
-                            if self._is_filing_in_date_range(year_data, start_date, end_date):
-                                company_filings.append(year_data)
-                                filing_date = year_data.get("FILING_DATE", year_key)
-                                print(f"✓ Found relevant entry for: {filing_date}")
-                elif isinstance(company_data, list):
-                    # Direct array of filings
-                    for filing in company_data:
-                        if self._is_filing_in_date_range(filing, start_date, end_date):
-                            company_filings.append(filing)
-                            filing_date = filing.get("FILING_DATE", "unknown")
-                            print(f"✓ Found relevant filing dated: {filing_date}")
+                    # Handle different JSON structures
+                    if index.kind(company) == 'object':
+                        # Structure: {year: [filings]} or {year: {data}}
+                        for year_key in index.keys(company):
+                            if index.kind(company, year_key) == 'array':
+                                # Array of filings under year key
+                                for position in index.keys(company, year_key):
+                                    filing = self._filing_dates(view, company, year_key, position)
+                                    if self._is_filing_in_date_range(filing, start_date, end_date):
+                                        company_filings.append(view.load(company, year_key, position))
+                                        filing_date = filing.get("FILING_DATE", "unknown")
+                                        print(f"✓ Found relevant filing dated: {filing_date}")
+                            elif index.kind(company, year_key) == 'object':
+                                # Single filing or other structure
+                                year_data = self._filing_dates(view, company, year_key)
+                                if self._is_filing_in_date_range(year_data, start_date, end_date):
+                                    company_filings.append(view.load(company, year_key))
+                                    filing_date = year_data.get("FILING_DATE", year_key)
+                                    print(f"✓ Found relevant entry for: {filing_date}")
+                    elif index.kind(company) == 'array':
+                        # Direct array of filings
+                        for position in index.keys(company):
+                            filing = self._filing_dates(view, company, position)
+                            if self._is_filing_in_date_range(filing, start_date, end_date):
+                                company_filings.append(view.load(company, position))
+                                filing_date = filing.get("FILING_DATE", "unknown")
+                                print(f"✓ Found relevant filing dated: {filing_date}")
                 
-                if company_filings:
-                    relevant_sections[company] = {
-                        "filings": company_filings,
-                        "total_filings": len(company_filings)
-                    }
+                    if company_filings:
+                        relevant_sections[company] = {
+                            "filings": company_filings,
+                            "total_filings": len(company_filings)
+                        }
             
             if not relevant_sections:
                 print("⚠️ No relevant sections found for the specified dates")
                 # Let's show what dates we actually found for debugging
-                self._debug_available_dates(data)
+                self._debug_available_dates(index.load())
                 return {"error": "No data found for the specified date range"}
             
             print(f"📋 Found {len(relevant_sections)} companies with relevant data")
@@ -617,6 +615,18 @@ Query: "What happened between January and March 2021?"
             print(f"❌ Error reading JSON file: {str(e)}")
             return {"error": f"Error reading JSON file: {str(e)}"}
 
+    def _filing_dates(self, view, *path) -> Dict:
+        """
+        Decode only the FILING_DATE of an indexed filing, for the date range check
+        
+        Non-object entries are decoded whole so the check treats them as before.
+        """
+        if view.index.kind(*path) != 'object':
+            return view.load(*path)
+        if view.index.has(*path, "FILING_DATE"):
+            return {"FILING_DATE": view.load(*path, "FILING_DATE")}
+        return {}
+
     def _is_filing_in_date_range(self, filing: Dict, start_date: str, end_date: str) -> bool:
         """
         Check if a filing falls within the specified date range
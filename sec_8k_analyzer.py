@@ -1,12 +1,17 @@
-import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 from datetime import datetime, timedelta
 import re
+import time
 from typing import Dict, List, Optional, Tuple
 import argparse
 from dotenv import load_dotenv
+from company_resolver import get_resolver
+from corpus_cache import get_corpus_cache
+from json_index import open_index
+from llm_client import get_model_for
+from query_parser import parse_query
+from tool_result import ToolResult, add_token_usage, serve_json_rpc
 
 # Load environment variables
 load_dotenv()
@@ -20,13 +25,8 @@ class SEC8KAnalyzer:
             api_key (str): Google Gemini API key
             json_folder (str): Path to folder containing 8-K JSON files
         """
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('8k_analysis', api_key=api_key)
+        self.extraction_model = get_model_for('8k_extraction', api_key=api_key)
         self.json_folder = Path(json_folder)
 
     def get_8k_analysis_system_prompt(self) -> str:
@@ -130,10 +130,15 @@ Before finalizing your response, verify:
 ---
 """
 
-    def extract_company_and_criteria(self, user_query: str) -> Dict:
+    def extract_company_and_criteria(self, user_query: str, usage: Optional[Dict] = None) -> Dict:
         """
         Extract company name and analysis criteria from user query using LLM
         """
+        parsed = parse_query(user_query)
+        if parsed.confident:
+            print(f"⚡ Parameters parsed locally (confidence {parsed.confidence:.2f}), skipping the LLM")
+            return parsed.eightk_parameters()
+        
         extraction_prompt = """You are an expert SEC 8-K filing analyst. Extract company name and analysis focus from user queries using EXACT reference mappings.
 
 ## EXACT COMPANY NAMES (use these exact formats):
@@ -206,83 +211,53 @@ Examples:
 Query: """
         
         try:
-            response = self.model.generate_content(extraction_prompt + user_query)
-            if response.text:
-                # Clean and parse JSON
-                text = response.text.strip()
-                if text.startswith('```json'):
-                    text = text.split('```json')[1].split('```')[0]
-                elif text.startswith('```'):
-                    text = text.split('```')[1].split('```')[0]
-                    
-                result = json.loads(text)
-                print(f"✓ Extracted: {result['company']}, focus: {result['analysis_focus']}")
-                if result.get('time_period'):
-                    print(f"  Time period: {result['time_period']}")
-                return result
+            result = self.extraction_model.generate_validated(extraction_prompt + user_query,
+                                                              self._parse_extraction, usage=usage)
+            print(f"✓ Extracted: {result['company']}, focus: {result['analysis_focus']}")
+            if result.get('time_period'):
+                print(f"  Time period: {result['time_period']}")
+            return result
         except Exception as e:
             print(f"⚠️ Extraction error: {e}")
         
         # Fallback extraction
         return self._fallback_extraction(user_query)
 
-    def _fallback_extraction(self, user_query: str) -> Dict:
-        """Simple regex-based fallback extraction"""
-        companies = {
-            "apple": "Apple Inc.",
-            "microsoft": "Microsoft Corporation",
-            "nvidia": "NVIDIA Corporation",
-            "meta": "Meta Platforms Inc.",
-            "facebook": "Meta Platforms Inc.",
-            "google": "Alphabet Inc.",
-            "amazon": "Amazon.com Inc.",
-            "tesla": "Tesla Inc.",
-            "johnson": "Johnson & Johnson",
-            "jpmorgan": "JPMorgan Chase & Co.",
-            "doordash": "DoorDash Inc.",
-            "roku": "Roku Inc.",
-            "zoom": "Zoom Communications Inc."
-        }
-        
-        query_lower = user_query.lower()
-        company = None
-        
-        for key, name in companies.items():
-            if key in query_lower:
-                company = name
-                break
-        
-        # Extract analysis focus
-        focus_keywords = {
-            "acquisition": "acquisitions",
-            "merger": "acquisitions", 
-            "deal": "acquisitions",
-            "financial": "financial_results",
-            "earnings": "financial_results",
-            "revenue": "financial_results",
-            "legal": "legal_matters",
-            "lawsuit": "legal_matters",
-            "debt": "debt_issuance",
-            "bond": "debt_issuance",
-            "notes": "debt_issuance"
-        }
-        
-        analysis_focus = "all"
-        for keyword, focus in focus_keywords.items():
-            if keyword in query_lower:
-                analysis_focus = focus
-                break
+    def _parse_extraction(self, text: str) -> Dict:
+        """
+        Parse and validate the extraction JSON
         
-        # Extract year
-        year_match = re.search(r'\b(20\d{2})\b', user_query)
-        time_period = year_match.group(1) if year_match else None
+        Raises:
+            ValueError: If the text is not JSON or fails validation
+        """
+        text = (text or '').strip()
+        if text.startswith('```json'):
+            text = text.split('```json')[1].split('```')[0]
+        elif text.startswith('```'):
+            text = text.split('```')[1].split('```')[0]
+            
+        return self._validate_extraction(json.loads(text))
+
+    def _validate_extraction(self, result) -> Dict:
+        """
+        Check that extracted or caller-supplied parameters have what the pipeline reads
         
-        return {
-            "company": company or "Unknown Company",
-            "analysis_focus": analysis_focus,
-            "time_period": time_period,
-            "confidence": "medium" if company else "low"
-        }
+        Raises:
+            ValueError: If company or analysis focus is missing, or the time period is not a year
+        """
+        if not isinstance(result, dict):
+            raise ValueError("extraction must be an object")
+        if not result.get('company') or not result.get('analysis_focus'):
+            raise ValueError("extraction is missing company or analysis_focus")
+        if result.get('confidence') not in ('high', 'medium', 'low'):
+            raise ValueError(f"invalid confidence {result.get('confidence')!r}")
+        if result.get('time_period') and not re.fullmatch(r'20\d{2}', str(result['time_period'])):
+            raise ValueError(f"invalid time_period {result['time_period']!r}")
+        return result
+
+    def _fallback_extraction(self, user_query: str) -> Dict:
+        """Local parser fallback, used whatever its confidence"""
+        return parse_query(user_query).eightk_parameters()
 
     def find_company_file(self, company_name: str) -> Optional[Path]:
         """Find JSON file for company"""
@@ -290,44 +265,43 @@ Query: """
             print(f"❌ Folder not found: {self.json_folder}")
             return None
         
-        json_files = list(self.json_folder.glob("*.json"))
-        print(f"📁 Available 8-K files: {[f.stem for f in json_files]}")
+        json_file = get_resolver().find_file(company_name, self.json_folder, '8k')
+        if json_file:
+            print(f"✓ Found match: {json_file}")
+        else:
+            print(f"❌ No 8-K file found for: {company_name}")
+        return json_file
+
+    def analyze_8k_filings(self, json_file: Path, analysis_focus: str, time_period: Optional[str], query: str,
+                           usage: Optional[Dict] = None) -> str:
+        """Analyze the 8-K filings with strict data accuracy (API errors and empty responses raise)"""
+        # Years are indexed by byte offset ({company: {year: ...}}), so only the requested ones are
+        # decoded, and decoded years stay in the shared corpus cache until the file changes
+        index = open_index(json_file, max_depth=2)
+        corpus = get_corpus_cache()
+        company = get_resolver().key_for_file(json_file, '8k')
         
-        # Normalize and search
-        normalized_company = company_name.lower().replace(" ", "").replace("inc", "").replace("corp", "").replace(".", "")
+        # Extract relevant data based on time period
+        relevant_data = {}
+        with index.mapped() as view:
+            for company_key in index.keys():
+                if index.kind(company_key) == 'object':
+                    for year_key in index.keys(company_key):
+                        if time_period is None or year_key == time_period:
+                            relevant_data[year_key] = corpus.get(
+                                company, json_file, ('8k', company_key, year_key),
+                                lambda: view.load(company_key, year_key)
+                            )
         
-        for file in json_files:
-            normalized_file = file.stem.lower().replace("_", "").replace("8k", "")
-            if normalized_company[:5] in normalized_file or normalized_file[:5] in normalized_company:
-                print(f"✓ Found match: {file}")
-                return file
+        if not relevant_data:
+            return f"No 8-K data found for the specified criteria"
         
-        print(f"❌ No 8-K file found for: {company_name}")
-        return None
-
-    def analyze_8k_filings(self, json_file: Path, analysis_focus: str, time_period: Optional[str], query: str) -> str:
-        """Analyze the 8-K filings with strict data accuracy"""
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Extract relevant data based on time period
-            relevant_data = {}
-            for company_key, company_data in data.items():
-                if isinstance(company_data, dict):
-                    for year_key, year_data in company_data.items():
-                        if time_period is None or year_key == time_period:
-                            relevant_data[year_key] = year_data
-            
-            if not relevant_data:
-                return f"No 8-K data found for the specified criteria"
-            
-            print(f"📊 Analyzing 8-K data for {len(relevant_data)} year(s)")
-            
-            # Create focused analysis prompt
-            system_prompt = self.get_8k_analysis_system_prompt()
-            
-            analysis_prompt = f"""{system_prompt}
+        print(f"📊 Analyzing 8-K data for {len(relevant_data)} year(s)")
+        
+        # Create focused analysis prompt
+        system_prompt = self.get_8k_analysis_system_prompt()
+        
+        analysis_prompt = f"""{system_prompt}
 
 **USER QUERY**: {query}
 **ANALYSIS FOCUS**: {analysis_focus}
@@ -346,37 +320,109 @@ Query: """
 7. Reference specific sections and items for all major points
 
 **RESPOND WITH COMPREHENSIVE ANALYSIS**:"""
-            
-            response = self.model.generate_content(analysis_prompt)
-            return response.text if response.text else "Analysis failed"
-            
-        except Exception as e:
-            return f"Error analyzing 8-K filings: {str(e)}"
+        
+        response = self.model.generate_content(analysis_prompt)
+        add_token_usage(usage, response)
+        if not response.text:
+            raise ValueError("Empty response from analysis")
+        return response.text
 
-    def process_query(self, user_query: str) -> str:
-        """Main processing pipeline"""
-        print(f"🚀 Processing 8-K query: {user_query}")
+    def _supplied_extraction(self, parameters: Optional[Dict]) -> Optional[Dict]:
+        """
+        Use parameters supplied by the caller in place of the extraction call
         
-        # Step 1: Extract company and criteria
-        extraction = self.extract_company_and_criteria(user_query)
+        Returns:
+            Optional[Dict]: Validated parameters, or None to extract from the query
+        """
+        if parameters is None:
+            return None
+        try:
+            extraction = self._validate_extraction(dict(parameters))
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ Ignoring supplied parameters ({e}), extracting from the query")
+            return None
+        print("✓ Using supplied parameters, skipping extraction")
+        return extraction
+
+    def analyze_query(self, query: str, save_output: bool = False,
+                      parameters: Optional[Dict] = None) -> ToolResult:
+        """
+        Complete 8-K query processing pipeline
+        
+        Args:
+            query (str): User's original query
+            save_output (bool): Also write the analysis to an 8k_analysis_*.txt file
+            parameters (Dict): Parameters already extracted by the caller
+                (company, analysis_focus, time_period, confidence); skips the extraction call when valid
+            
+        Returns:
+            ToolResult: Analysis content with parameters, timings and token usage
+        """
+        print(f"🚀 Processing 8-K query: {query}")
+        start_time = time.perf_counter()
+        timings = {}
+        usage = {}
+        
+        # Step 1: Extract company and criteria, unless the caller already did
+        extraction = self._supplied_extraction(parameters)
+        if not extraction:
+            extraction = self.extract_company_and_criteria(query, usage=usage)
+        timings['extraction'] = time.perf_counter() - start_time
         
         if extraction['confidence'] == 'low':
-            return "❌ Could not identify company in query. Please specify a company name."
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_8k_analyzer', query,
+                "❌ Could not identify company in query. Please specify a company name.",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
         
         # Step 2: Find company file
         json_file = self.find_company_file(extraction['company'])
         if not json_file:
-            return f"❌ No 8-K data file found for {extraction['company']}"
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_8k_analyzer', query,
+                f"❌ No 8-K data file found for {extraction['company']}",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
         
         # Step 3: Analyze 8-K filings
-        result = self.analyze_8k_filings(
-            json_file, 
-            extraction['analysis_focus'], 
-            extraction['time_period'],
-            user_query
-        )
+        stage_start = time.perf_counter()
+        try:
+            result = self.analyze_8k_filings(
+                json_file, 
+                extraction['analysis_focus'], 
+                extraction['time_period'],
+                query,
+                usage=usage
+            )
+        except Exception as e:
+            timings['analysis'] = time.perf_counter() - stage_start
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_8k_analyzer', query, f"Error analyzing 8-K filings: {str(e)}",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
+        timings['analysis'] = time.perf_counter() - stage_start
         
-        # Step 4: Save result
+        # Step 4: Optionally save result
+        filename = self.save_analysis_result(result, query, extraction) if save_output else None
+        
+        timings['total'] = time.perf_counter() - start_time
+        return ToolResult(
+            tool='sec_8k_analyzer',
+            query=query,
+            success=True,
+            content=result,
+            metadata={"parameters": extraction, "json_file_used": str(json_file)},
+            timings=timings,
+            token_usage=usage,
+            output_file=filename
+        )
+
+    def save_analysis_result(self, result: str, user_query: str, extraction: Dict) -> str:
+        """Save an 8-K analysis to a txt file and return its path"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_query = re.sub(r'[^\w\s-]', '', user_query)[:50]
         safe_query = re.sub(r'[-\s]+', '_', safe_query)
@@ -393,20 +439,56 @@ Query: """
             f.write(result)
         
         print(f"✅ 8-K Analysis complete! Saved to: {filename}")
-        return result
+        return filename
+
+    def process_8k_query(self, user_query: str) -> Dict:
+        """
+        Complete 8-K query processing pipeline, saving the result to a file
+        
+        Args:
+            user_query (str): User's original query
+            
+        Returns:
+            Dict: Processing results and file paths
+        """
+        result = self.analyze_query(user_query, save_output=True)
+        if not result.success:
+            return {"success": False, "error": result.error}
+        
+        return {
+            "success": True,
+            "parameters": result.metadata["parameters"],
+            "json_file_used": result.metadata["json_file_used"],
+            "analysis_result": result.content,
+            "output_file": result.output_file
+        }
+
+    def process_query(self, user_query: str) -> str:
+        """Main processing pipeline"""
+        result = self.process_8k_query(user_query)
+        if not result["success"]:
+            return result["error"]
+        return result["analysis_result"]
 
 
 def main():
     """Command line interface"""
     parser = argparse.ArgumentParser(description='Analyze SEC 8-K Current Events filings')
-    parser.add_argument('query', help='Your question about material events and current reports')
+    parser.add_argument('query', nargs='?', help='Your question about material events and current reports')
     parser.add_argument('-f', '--folder', default='gemini_8k', help='Folder containing 8-K JSON files')
     parser.add_argument('-k', '--api-key', help='Gemini API key')
+    parser.add_argument('--rpc', action='store_true', help='Serve JSON-RPC "analyze" requests on stdin/stdout')
     
     args = parser.parse_args()
+    if not args.query and not args.rpc:
+        parser.error("Please provide a query or use --rpc")
     
     try:
         analyzer = SEC8KAnalyzer(api_key=args.api_key, json_folder=args.folder)
+        if args.rpc:
+            serve_json_rpc('sec_8k_analyzer', analyzer.analyze_query)
+            return
+        
         result = analyzer.process_query(args.query)
         
         print("\n" + "="*60)
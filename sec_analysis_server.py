@@ -4,18 +4,26 @@ SEC Analysis AI - Flask Backend Server
 Integrates with sec_master_analyzer.py to provide web API for frontend
 """
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import os
 import sys
 import subprocess
 import json
 import logging
+from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
 import threading
 import time
 from dotenv import load_dotenv
+from analysis_jobs import AnalysisJobManager, QueueFullError
+from results_cache import ResultsCache
+from llm_client import client_stats
+from corpus_cache import get_corpus_cache
+from index_refresher import IndexUnavailable
+from search_index import search as search_passages
+from semantic_index import semantic_search
 
 # Load environment variables
 load_dotenv()
@@ -30,16 +38,149 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Map orchestrator tool names to the keys used by the frontend
+TOOL_RESULT_KEYS = {
+    'sec_tools': '10k',
+    'sec_8k_analyzer': '8k',
+    'sec_insider_analyzer': 'form4'
+}
+
 class SECAnalysisServer:
-    def __init__(self):
+    def __init__(self, execution_mode=None):
         self.analysis_in_progress = {}
-        self.results_cache = {}
+        self.results_cache = ResultsCache(
+            max_entries=int(os.getenv('RESULTS_CACHE_MAX_ENTRIES', '256')),
+            max_bytes=int(os.getenv('RESULTS_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            ttl=int(os.getenv('RESULTS_CACHE_TTL', str(24 * 3600))),
+            db_path=os.getenv('RESULTS_CACHE_DB', str(Path(__file__).parent / 'cache' / 'results_cache.sqlite3')) or None
+        )
+        
+        # "inprocess" keeps long-lived analyzer instances, "subprocess" shells out per request
+        self.execution_mode = (execution_mode or os.getenv('SEC_ANALYSIS_MODE', 'inprocess')).lower()
+        self._master_analyzer = None
+        self._analyzer_lock = threading.Lock()
+        
+        # Report files are an optional side output; results are returned in memory
+        self.save_outputs = os.getenv('SAVE_ANALYSIS_FILES', 'true').lower() not in ('0', 'false', 'no')
+        
+        # Analyses run on a bounded worker pool instead of the request threads
+        self.job_manager = AnalysisJobManager(
+            runner=self.run_master_analyzer,
+            max_workers=int(os.getenv('ANALYSIS_WORKERS', '4')),
+            max_queue_depth=int(os.getenv('ANALYSIS_MAX_QUEUE', '20')),
+            job_ttl=int(os.getenv('ANALYSIS_JOB_TTL', '3600')),
+            job_deadline=float(os.getenv('ANALYSIS_DEADLINE', '240')) or None,
+            on_complete=self._cache_job_result
+        )
+        
+    def submit_analysis(self, query):
+        """Queue an analysis job, answering from the cache or an in-flight job when possible"""
+        cached = self.results_cache.get(query)
+        if cached is not None:
+            logger.info("Returning cached results")
+            return self.job_manager.add_completed(query, cached)
+        
+        # Identical queries already being analyzed attach to the running job
+        return self.job_manager.submit(query, key=self.results_cache.make_key(query))
+    
+    def _cache_job_result(self, job):
+        """Store a finished job's results in the cache, unless they failed or left sources out"""
+        # A result missing sources (e.g. tools cut off by the deadline) is not worth serving for a day
+        result = job.result or {}
+        if result.get('success') is False or result.get('omitted_sources'):
+            logger.info("Not caching incomplete results")
+            return
+        self.results_cache.set(job.query, job.result)
+        
+    def get_master_analyzer(self):
+        """Return the shared in-process master analyzer, creating it on first use"""
+        if self._master_analyzer is None:
+            with self._analyzer_lock:
+                if self._master_analyzer is None:
+                    from sec_master_analyzer import SECMasterAnalyzer
+                    logger.info("Initializing in-process SEC analyzers...")
+                    self._master_analyzer = SECMasterAnalyzer(in_process=True, save_outputs=self.save_outputs)
+        return self._master_analyzer
+        
+    def run_master_analyzer(self, query, progress_callback=None, deadline=None):
+        """
+        Run the master analyzer with the given query, answering by deadline (time.time()) if given
         
-    def run_master_analyzer(self, query):
-        """Run the master analyzer with the given query"""
+        Raises:
+            RuntimeError: If the analysis failed; the message becomes the job's error
+        """
+        if self.execution_mode == 'subprocess':
+            return self.run_master_analyzer_subprocess(query, deadline)
+        return self.run_master_analyzer_in_process(query, progress_callback, deadline)
+    
+    def run_master_analyzer_in_process(self, query, progress_callback=None, deadline=None):
+        """Run the master analyzer inside the server process and return structured results"""
         try:
-            # Run the master analyzer
-            cmd = [sys.executable, 'sec_master_analyzer.py', query]
+            analyzer = self.get_master_analyzer()
+            analysis = analyzer.process_comprehensive_query(query, progress_callback=progress_callback,
+                                                            deadline=deadline)
+        except Exception as e:
+            logger.error(f"Error running in-process master analyzer: {e}")
+            raise RuntimeError(f"Analysis error: {e}") from e
+        
+        if not analysis.get('success'):
+            logger.error(f"Master analyzer reported failure: {analysis.get('error')}")
+            raise RuntimeError(analysis.get('error') or 'Analysis failed')
+        return self.build_results_from_analysis(analysis, query)
+    
+    def build_results_from_analysis(self, analysis, query):
+        """Convert the orchestrator's result dict into the API response format"""
+        results = {
+            'query': query,
+            'timestamp': datetime.now().isoformat(),
+            'analysis_directory': analysis.get('analysis_directory'),
+            'combined_analysis': analysis.get('combined_analysis', ''),
+            'individual_analyses': {},
+            'sources': [],
+            'analysis_files': [],
+            'omitted_sources': analysis.get('omitted_sources', []),
+            'timings': analysis.get('timings', {}),
+            'token_usage': analysis.get('token_usage', {})
+        }
+        
+        output_file = analysis.get('output_file')
+        if output_file:
+            results['analysis_files'].append(os.path.basename(output_file))
+        
+        for tool_result in analysis.get('analysis_results', []):
+            analysis_type = TOOL_RESULT_KEYS.get(tool_result.get('tool'))
+            if analysis_type and tool_result.get('success'):
+                results['individual_analyses'][analysis_type] = tool_result['content']
+        
+        for tool_name, file_path in analysis.get('individual_files', {}).items():
+            results['analysis_files'].append(os.path.basename(file_path))
+        
+        for analysis_type in TOOL_RESULT_KEYS.values():
+            if analysis_type not in results['individual_analyses']:
+                results['individual_analyses'][analysis_type] = f"# {analysis_type.upper()} Analysis\n\nNo specific {analysis_type.upper()} analysis available for this query."
+        
+        company = self.extract_company_from_query(query)
+        results['sources'] = [
+            {'type': '10-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_10k.json'},
+            {'type': '8-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_8k.json'},
+            {'type': 'Form 4', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_form4.json'}
+        ]
+        
+        return results
+    
+    def run_master_analyzer_subprocess(self, query, deadline=None):
+        """Run the master analyzer script in a subprocess and read its JSON result from stdout"""
+        try:
+            cmd = [sys.executable, 'sec_master_analyzer.py', '--json', query]
+            if not self.save_outputs:
+                cmd.insert(2, '--no-files')
+            
+            # Pass the remaining budget on; the hard timeout leaves a little slack past it
+            timeout = 300  # 5 minute timeout
+            if deadline:
+                remaining = max(1.0, deadline - time.time())
+                cmd[2:2] = ['--time-budget', f'{remaining:.0f}']
+                timeout = remaining + 30
             
             # Set environment for UTF-8 encoding
             env = os.environ.copy()
@@ -53,130 +194,25 @@ class SECAnalysisServer:
                 text=True,
                 encoding='utf-8',
                 env=env,
-                timeout=300  # 5 minute timeout
+                timeout=timeout
             )
-            
-            if result.returncode == 0:
-                return self.parse_analysis_output(result.stdout, query)
-            else:
-                logger.error(f"Master analyzer failed: {result.stderr}")
-                return None
-                
         except subprocess.TimeoutExpired:
-            logger.error("Analysis timed out after 5 minutes")
-            return None
+            logger.error(f"Analysis timed out after {timeout:.0f} seconds")
+            raise RuntimeError(f"Analysis timed out after {timeout:.0f} seconds")
         except Exception as e:
             logger.error(f"Error running master analyzer: {e}")
-            return None
-    
-    def parse_analysis_output(self, output, query):
-        """Parse the output from master analyzer and find result files"""
-        try:
-            # Look for the comprehensive analysis directory in output
-            lines = output.split('\n')
-            analysis_dir = None
-            
-            for line in lines:
-                # Look for the analysis directory line with emoji
-                if '📁 Analysis directory:' in line or 'Analysis directory:' in line:
-                    # Extract directory name
-                    if '📁 Analysis directory:' in line:
-                        analysis_dir = line.split('📁 Analysis directory:')[1].strip()
-                    else:
-                        analysis_dir = line.split('Analysis directory:')[1].strip()
-                    break
-                elif 'comprehensive_analysis_' in line and ('created' in line.lower() or 'directory' in line.lower()):
-                    # Try to extract from other context
-                    parts = line.split()
-                    for part in parts:
-                        if 'comprehensive_analysis_' in part:
-                            analysis_dir = part.strip('.,!').strip()
-                            break
-            
-            if not analysis_dir:
-                # Try to find the most recent comprehensive analysis directory
-                try:
-                    report_dirs = [d for d in os.listdir('.') if d.startswith('comprehensive_analysis_')]
-                    if report_dirs:
-                        # Sort by creation time to get the most recent
-                        report_dirs.sort(key=lambda x: os.path.getctime(x), reverse=True)
-                        analysis_dir = report_dirs[0]  # Get most recent
-                        logger.info(f"Using most recent analysis directory: {analysis_dir}")
-                except Exception as e:
-                    logger.error(f"Error finding recent directories: {e}")
-            
-            if analysis_dir and os.path.exists(analysis_dir):
-                logger.info(f"Found analysis directory: {analysis_dir}")
-                return self.load_analysis_results(analysis_dir, query)
-            else:
-                logger.error(f"Could not find analysis directory: {analysis_dir}")
-                return self.create_fallback_results(query)
-                
-        except Exception as e:
-            logger.error(f"Error parsing analysis output: {e}")
-            return self.create_fallback_results(query)
-    
-    def load_analysis_results(self, analysis_dir, query):
-        """Load analysis results from the generated files"""
+            raise RuntimeError(f"Analysis error: {e}") from e
+        
         try:
-            results = {
-                'query': query,
-                'timestamp': datetime.now().isoformat(),
-                'analysis_directory': analysis_dir,
-                'combined_analysis': '',
-                'individual_analyses': {},
-                'sources': [],
-                'analysis_files': []
-            }
-            
-            # Load comprehensive analysis - look for the main file
-            comprehensive_files = [f for f in os.listdir(analysis_dir) if f.startswith('comprehensive_analysis_') and f.endswith('.txt')]
-            if comprehensive_files:
-                comprehensive_file = os.path.join(analysis_dir, comprehensive_files[0])
-                with open(comprehensive_file, 'r', encoding='utf-8') as f:
-                    results['combined_analysis'] = f.read()
-                results['analysis_files'].append(comprehensive_files[0])
-                logger.info(f"Loaded comprehensive analysis: {comprehensive_files[0]}")
-            
-            # Load individual analyses
-            individual_files = {
-                '10k': ['query_answer_', 'sec_tools_'],
-                '8k': ['sec_8k_analyzer_'],
-                'form4': ['sec_insider_analyzer_', 'insider_analysis_']
-            }
-            
-            for analysis_type, prefixes in individual_files.items():
-                content_found = False
-                for prefix in prefixes:
-                    matching_files = [f for f in os.listdir(analysis_dir) if f.startswith(prefix) and f.endswith('.txt')]
-                    if matching_files:
-                        filepath = os.path.join(analysis_dir, matching_files[0])
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            results['individual_analyses'][analysis_type] = f.read()
-                        results['analysis_files'].append(matching_files[0])
-                        content_found = True
-                        logger.info(f"Loaded {analysis_type} analysis: {matching_files[0]}")
-                        break
-                
-                if not content_found:
-                    results['individual_analyses'][analysis_type] = f"# {analysis_type.upper()} Analysis\n\nNo specific {analysis_type.upper()} analysis available for this query."
-            
-            # Extract company name from query for sources
-            company = self.extract_company_from_query(query)
-            
-            # Generate source information
-            results['sources'] = [
-                {'type': '10-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_10k.json'},
-                {'type': '8-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_8k.json'},
-                {'type': 'Form 4', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_form4.json'}
-            ]
-            
-            logger.info(f"Successfully loaded analysis results from {analysis_dir}")
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error loading analysis results: {e}")
-            return self.create_fallback_results(query)
+            analysis = json.loads(result.stdout)
+        except json.JSONDecodeError:
+            logger.error(f"Master analyzer returned no JSON result: {result.stderr[-1000:]}")
+            raise RuntimeError('Analysis returned no result')
+        
+        if not analysis.get('success'):
+            logger.error(f"Master analyzer failed: {analysis.get('error', result.stderr[-1000:])}")
+            raise RuntimeError(analysis.get('error') or 'Analysis failed')
+        return self.build_results_from_analysis(analysis, query)
     
     def extract_company_from_query(self, query):
         """Extract company name from query"""
@@ -202,51 +238,6 @@ class SECAnalysisServer:
                 return company
         
         return 'Apple Inc'  # Default fallback
-    
-    def create_fallback_results(self, query):
-        """Create fallback results if analysis fails"""
-        company = self.extract_company_from_query(query)
-        
-        return {
-            'query': query,
-            'timestamp': datetime.now().isoformat(),
-            'analysis_directory': None,
-            'combined_analysis': f"""# SEC Analysis Results
-
-## Query Analysis
-**Query:** {query}
-**Company:** {company}
-**Analysis Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-## Status
-The analysis system is currently processing your request. This may take a few moments as we:
-
-1. **Parse your query** and extract relevant parameters
-2. **Search SEC filing databases** for the most relevant documents  
-3. **Run AI analysis** across 10-K, 8-K, and Form 4 filings
-4. **Generate comprehensive insights** and recommendations
-
-Please try refreshing in a few moments, or contact support if the issue persists.
-
-## Available Data Sources
-- 10-K Annual Reports (Business segments, risk factors, financial data)
-- 8-K Current Event Reports (Material changes, acquisitions, management changes)  
-- Form 4 Insider Trading Reports (Executive transactions, insider sentiment)
-
-*Analysis powered by SEC Analysis AI - Financial Intelligence Platform*
-            """,
-            'individual_analyses': {
-                '10k': f"# {company} 10-K Analysis\n\nAnalysis in progress... Please check back in a few moments.",
-                '8k': f"# {company} 8-K Analysis\n\nAnalysis in progress... Please check back in a few moments.", 
-                'form4': f"# {company} Form 4 Analysis\n\nAnalysis in progress... Please check back in a few moments."
-            },
-            'sources': [
-                {'type': '10-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_10k.json'},
-                {'type': '8-K', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_8k.json'},
-                {'type': 'Form 4', 'company': company, 'year': '2024', 'filename': f'{company.replace(" ", "_")}_form4.json'}
-            ],
-            'analysis_files': []
-        }
 
 # Initialize server instance
 sec_server = SECAnalysisServer()
@@ -275,24 +266,16 @@ def analyze_query():
         
         logger.info(f"Received analysis request: {query}")
         
-        # Check cache first (optional optimization)
-        cache_key = f"{query}_{datetime.now().strftime('%Y-%m-%d')}"
-        if cache_key in sec_server.results_cache:
-            logger.info("Returning cached results")
-            return jsonify(sec_server.results_cache[cache_key])
-        
-        # Run the analysis
-        results = sec_server.run_master_analyzer(query)
+        try:
+            job = sec_server.submit_analysis(query)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting analysis request: {e}")
+            response = jsonify({'error': 'Server busy', 'message': str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
         
-        if results:
-            # Cache the results
-            sec_server.results_cache[cache_key] = results
-            logger.info("Analysis completed successfully")
-            return jsonify(results)
-        else:
-            logger.error("Analysis failed")
-            fallback_results = sec_server.create_fallback_results(query)
-            return jsonify(fallback_results)
+        # Cached results come back as an already-completed job
+        return jsonify(job.to_dict()), 200 if job.is_finished else 202
             
     except Exception as e:
         logger.error(f"API error: {e}")
@@ -301,6 +284,34 @@ def analyze_query():
             'message': str(e)
         }), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Get the status and, once finished, the results of an analysis job"""
+    job = sec_server.job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """Stream an analysis job's progress as Server-Sent Events"""
+    job = sec_server.job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        for event in job.iter_events():
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/status')
 def get_status():
     """Get server status"""
@@ -308,6 +319,11 @@ def get_status():
         'status': 'online',
         'timestamp': datetime.now().isoformat(),
         'version': '1.0.0',
+        'execution_mode': sec_server.execution_mode,
+        'jobs': sec_server.job_manager.stats(),
+        'results_cache': sec_server.results_cache.stats(),
+        'llm': client_stats(),
+        'corpus_cache': get_corpus_cache().stats(),
         'analysis_tools': ['sec_tools.py', 'sec_8k_analyzer.py', 'sec_insider_analyzer.py'],
         'available_companies': [
             'Apple Inc', 'Microsoft Corporation', 'NVIDIA Corporation',
@@ -316,6 +332,35 @@ def get_status():
         ]
     })
 
+@app.route('/api/search')
+def search_filings():
+    """Search filing passages (q, company, years, forms, k and mode=bm25|semantic query parameters)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    def listed(name):
+        values = [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+        return values or None
+    
+    mode = request.args.get('mode', 'bm25').lower()
+    if mode not in ('bm25', 'semantic'):
+        return jsonify({'error': 'mode must be bm25 or semantic'}), 400
+    
+    try:
+        hits = (semantic_search if mode == 'semantic' else search_passages)(
+            query,
+            company=request.args.get('company') or None,
+            years=listed('years'),
+            forms=listed('forms'),
+            k=min(request.args.get('k', 10, type=int), 100)
+        )
+    except IndexUnavailable as e:
+        return jsonify({'error': 'Search index not ready', 'message': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': 'Invalid search parameters', 'message': str(e)}), 400
+    return jsonify({'query': query, 'mode': mode, 'hits': [asdict(hit) for hit in hits]})
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -362,7 +407,9 @@ if __name__ == '__main__':
     logger.info("Starting SEC Analysis AI Server...")
     logger.info("Frontend available at: http://localhost:5000")
     logger.info("API endpoints:")
-    logger.info("  POST /api/analyze - Main analysis endpoint")
+    logger.info("  POST /api/analyze - Queue an analysis job")
+    logger.info("  GET /api/jobs/<id> - Analysis job status and results")
+    logger.info("  GET /api/jobs/<id>/events - Analysis progress stream (SSE)")
     logger.info("  GET /api/status - Server status")
     logger.info("  GET /api/health - Health check")
     
@@ -1,12 +1,17 @@
-import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 from datetime import datetime, timedelta
 import re
+import time
 from typing import Dict, List, Optional, Tuple
 import argparse
 from dotenv import load_dotenv
+from company_resolver import get_resolver
+from corpus_cache import get_corpus_cache
+from json_index import open_index
+from llm_client import get_model_for
+from query_parser import parse_query
+from tool_result import ToolResult, add_token_usage, serve_json_rpc
 
 # Load environment variables
 load_dotenv()
@@ -20,19 +25,20 @@ class InsiderTradingAnalyzer:
             api_key (str): Google Gemini API key
             json_folder (str): Path to folder containing Form 4 JSON files
         """
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('insider_analysis', api_key=api_key)
+        self.extraction_model = get_model_for('insider_extraction', api_key=api_key)
         self.json_folder = Path(json_folder)
 
-    def extract_company_and_dates(self, user_query: str) -> Dict:
+    def extract_company_and_dates(self, user_query: str, usage: Optional[Dict] = None) -> Dict:
         """
         Extract company name and dates from user query using LLM
         """
+        # Form 4 analysis needs a date range, so the local parse only stands in when the query names a period
+        parsed = parse_query(user_query)
+        if parsed.confident and parsed.date_range:
+            print(f"⚡ Parameters parsed locally (confidence {parsed.confidence:.2f}), skipping the LLM")
+            return parsed.insider_parameters()
+        
         extraction_prompt = """You are an expert SEC Form 4 insider trading analyst. Extract company name and dates from user queries using EXACT reference mappings.
 
 ## EXACT COMPANY NAMES (use these exact formats for JSON matching):
@@ -97,78 +103,58 @@ Examples:
 Query: """
         
         try:
-            response = self.model.generate_content(extraction_prompt + user_query)
-            if response.text:
-                # Clean and parse JSON
-                text = response.text.strip()
-                if text.startswith('```json'):
-                    text = text.split('```json')[1].split('```')[0]
-                elif text.startswith('```'):
-                    text = text.split('```')[1].split('```')[0]
-                    
-                result = json.loads(text)
-                print(f"✓ Extracted: {result['company']}, dates: {result['date_range']['start_date']} to {result['date_range']['end_date']}")
-                return result
+            result = self.extraction_model.generate_validated(extraction_prompt + user_query,
+                                                              self._parse_extraction, usage=usage)
+            print(f"✓ Extracted: {result['company']}, dates: {result['date_range']['start_date']} to {result['date_range']['end_date']}")
+            return result
         except Exception as e:
             print(f"⚠️ Extraction error: {e}")
         
         # Fallback extraction
         return self._fallback_extraction(user_query)
 
-    def _fallback_extraction(self, user_query: str) -> Dict:
-        """Simple regex-based fallback extraction with correct naming format"""
-        companies = {
-            "apple": "Apple_Inc",
-            "microsoft": "MICROSOFT_CORP", 
-            "nvidia": "NVIDIA_CORP",
-            "meta": "Meta_Platforms_Inc",
-            "facebook": "Meta_Platforms_Inc",
-            "jpmorgan": "JPMORGAN_CHASE_&_CO",
-            "chase": "JPMORGAN_CHASE_&_CO",
-            "johnson": "JOHNSON_&_JOHNSON",
-            "j&j": "JOHNSON_&_JOHNSON",
-            "doordash": "DoorDash_Inc",
-            "roku": "ROKU_INC",
-            "zoom": "Zoom_Communications_Inc",
-            "unitedhealth": "UNITEDHEALTH_GROUP_INC"
-        }
-        
-        query_lower = user_query.lower()
-        company = None
-        
-        for key, name in companies.items():
-            if key in query_lower:
-                company = name
-                break
+    def _parse_extraction(self, text: str) -> Dict:
+        """
+        Parse and validate the extraction JSON
         
-        # Extract year/month patterns
-        import re
-        dates = re.findall(r'(\w+)\s+(\d{4})', user_query)
-        if dates:
-            month_name, year = dates[0]
-            month_map = {"january": 1, "february": 2, "march": 3, "april": 4, 
-                        "may": 5, "june": 6, "july": 7, "august": 8,
-                        "september": 9, "october": 10, "november": 11, "december": 12}
-            
-            month_num = month_map.get(month_name.lower(), 1)
-            start_date = f"{year}-{month_num:02d}-01"
-            
-            # Calculate end date (last day of month)
-            if month_num == 12:
-                next_month = f"{int(year)+1}-01-01"
-            else:
-                next_month = f"{year}-{month_num+1:02d}-01"
+        Raises:
+            ValueError: If the text is not JSON or fails validation
+        """
+        text = (text or '').strip()
+        if text.startswith('```json'):
+            text = text.split('```json')[1].split('```')[0]
+        elif text.startswith('```'):
+            text = text.split('```')[1].split('```')[0]
             
-            from datetime import datetime, timedelta
-            end_date = (datetime.strptime(next_month, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-        else:
-            start_date = "2021-01-01"
-            end_date = "2021-12-31"
+        return self._validate_extraction(json.loads(text))
+
+    def _validate_extraction(self, result) -> Dict:
+        """
+        Check that extracted or caller-supplied parameters have what the pipeline reads
         
+        Raises:
+            ValueError: If company or date range is missing, or a date is not YYYY-MM-DD
+        """
+        if not isinstance(result, dict):
+            raise ValueError("extraction must be an object")
+        date_range = result.get('date_range')
+        if not result.get('company') or not isinstance(date_range, dict):
+            raise ValueError("extraction is missing company or date_range")
+        if result.get('confidence') not in ('high', 'medium', 'low'):
+            raise ValueError(f"invalid confidence {result.get('confidence')!r}")
+        for key in ('start_date', 'end_date'):
+            datetime.strptime(str(date_range.get(key)), '%Y-%m-%d')
+        return result
+
+    def _fallback_extraction(self, user_query: str) -> Dict:
+        """Local parser fallback, used whatever its confidence"""
+        parsed = parse_query(user_query)
+        start_date, end_date = parsed.date_range or ("2021-01-01", "2021-12-31")
         return {
-            "company": company or "Unknown Company",
+            "company": parsed.form4_company or "Unknown Company",
             "date_range": {"start_date": start_date, "end_date": end_date},
-            "confidence": "medium" if company else "low"
+            "analysis_type": parsed.analysis_type,
+            "confidence": parsed.confidence_label
         }
 
     def find_company_file(self, company_name: str) -> Optional[Path]:
@@ -177,48 +163,43 @@ Query: """
             print(f"❌ Folder not found: {self.json_folder}")
             return None
         
-        json_files = list(self.json_folder.glob("*.json"))
-        print(f"📁 Available files: {[f.stem for f in json_files]}")
+        json_file = get_resolver().find_file(company_name, self.json_folder, 'form4')
+        if json_file:
+            print(f"✓ Found match: {json_file}")
+        else:
+            print(f"❌ No file found for: {company_name}")
+        return json_file
+
+    def analyze_filings(self, json_file: Path, start_date: str, end_date: str, query: str,
+                        usage: Optional[Dict] = None) -> str:
+        """Analyze the Form 4 filings (API errors and empty responses raise)"""
+        # Filings and their fields are indexed by byte offset ({company: {year: [filing]}}),
+        # so only the filing dates and the matching filings are decoded; both stay in the
+        # shared corpus cache until the file changes
+        index = open_index(json_file, max_depth=4)
+        corpus = get_corpus_cache()
+        company = get_resolver().key_for_file(json_file, 'form4')
         
-        # Normalize and search
-        normalized_company = company_name.lower().replace(" ", "").replace("inc", "").replace("corp", "").replace(".", "")
+        relevant_filings = []
         
-        for file in json_files:
-            normalized_file = file.stem.lower().replace("_", "").replace("form4", "")
-            if normalized_company[:5] in normalized_file or normalized_file[:5] in normalized_company:
-                print(f"✓ Found match: {file}")
-                return file
+        # Extract relevant filings within date range
+        with index.mapped() as view:
+            filing_dates = corpus.get(company, json_file, 'filing_dates', lambda: self._filing_dates(view))
+            for company_key, year_key, position, filing_date in filing_dates:
+                if self._is_date_in_range(filing_date, start_date, end_date):
+                    relevant_filings.append(corpus.get(
+                        company, json_file, ('filing', company_key, year_key, position),
+                        lambda: view.load(company_key, year_key, position)
+                    ))
+                    print(f"✓ Found relevant filing dated: {filing_date}")
         
-        print(f"❌ No file found for: {company_name}")
-        return None
-
-    def analyze_filings(self, json_file: Path, start_date: str, end_date: str, query: str) -> str:
-        """Analyze the Form 4 filings"""
-        try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-            
-            relevant_filings = []
-            
-            # Extract relevant filings within date range - handle the nested structure
-            for company_key, company_data in data.items():
-                if isinstance(company_data, dict):
-                    for year_key, year_data in company_data.items():
-                        if isinstance(year_data, list):  # Year contains list of filings
-                            for filing in year_data:
-                                if isinstance(filing, dict):
-                                    filing_date = filing.get('FILING_DATE', '')
-                                    if self._is_date_in_range(filing_date, start_date, end_date):
-                                        relevant_filings.append(filing)
-                                        print(f"✓ Found relevant filing dated: {filing_date}")
-            
-            print(f"📊 Found {len(relevant_filings)} relevant filings")
-            
-            if not relevant_filings:
-                return f"No insider trading filings found in the specified date range ({start_date} to {end_date})"
-            
-            # Analyze with Gemini
-            analysis_prompt = f"""Analyze these SEC Form 4 insider trading filings and answer the user's query.
+        print(f"📊 Found {len(relevant_filings)} relevant filings")
+        
+        if not relevant_filings:
+            return f"No insider trading filings found in the specified date range ({start_date} to {end_date})"
+        
+        # Analyze with Gemini
+        analysis_prompt = f"""Analyze these SEC Form 4 insider trading filings and answer the user's query.
 
 User Query: {query}
 Date Range: {start_date} to {end_date}
@@ -234,12 +215,32 @@ Provide a comprehensive analysis including:
 5. Any significant observations
 
 Be specific about dates, names, titles, and transaction amounts. If no actual trades occurred, explain what the filings show."""
-            
-            response = self.model.generate_content(analysis_prompt)
-            return response.text if response.text else "Analysis failed"
-            
-        except Exception as e:
-            return f"Error analyzing filings: {str(e)}"
+        
+        response = self.model.generate_content(analysis_prompt)
+        add_token_usage(usage, response)
+        if not response.text:
+            raise ValueError("Empty response from analysis")
+        return response.text
+
+    def _filing_dates(self, view) -> List[Tuple[str, str, int, str]]:
+        """
+        Decode the FILING_DATE of every filing - handle the nested structure
+        
+        Returns:
+            List[Tuple[str, str, int, str]]: (company key, year, position, filing date) per filing
+        """
+        index = view.index
+        filing_dates = []
+        for company_key in index.keys():
+            if index.kind(company_key) == 'object':
+                for year_key in index.keys(company_key):
+                    if index.kind(company_key, year_key) == 'array':  # Year contains list of filings
+                        for position in index.keys(company_key, year_key):
+                            if index.kind(company_key, year_key, position) == 'object':
+                                filing_date = (view.load(company_key, year_key, position, 'FILING_DATE')
+                                               if index.has(company_key, year_key, position, 'FILING_DATE') else '')
+                                filing_dates.append((company_key, year_key, position, filing_date))
+        return filing_dates
 
     def _is_date_in_range(self, date_str: str, start_date: str, end_date: str) -> bool:
         """Check if date string falls within range"""
@@ -254,28 +255,99 @@ Be specific about dates, names, titles, and transaction amounts. If no actual tr
         except:
             return False
 
-    def process_query(self, user_query: str) -> str:
-        """Main processing pipeline"""
-        print(f"🚀 Processing: {user_query}")
+    def _supplied_extraction(self, parameters: Optional[Dict]) -> Optional[Dict]:
+        """
+        Use parameters supplied by the caller in place of the extraction call
         
-        # Step 1: Extract company and dates
-        extraction = self.extract_company_and_dates(user_query)
+        Returns:
+            Optional[Dict]: Validated parameters, or None to extract from the query
+        """
+        if parameters is None:
+            return None
+        try:
+            extraction = self._validate_extraction(dict(parameters))
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ Ignoring supplied parameters ({e}), extracting from the query")
+            return None
+        print("✓ Using supplied parameters, skipping extraction")
+        return extraction
+
+    def analyze_query(self, query: str, save_output: bool = False,
+                      parameters: Optional[Dict] = None) -> ToolResult:
+        """
+        Complete Form 4 query processing pipeline
+        
+        Args:
+            query (str): User's original query
+            save_output (bool): Also write the analysis to an insider_analysis_*.txt file
+            parameters (Dict): Parameters already extracted by the caller
+                (company, date_range, analysis_type, confidence); skips the extraction call when valid
+            
+        Returns:
+            ToolResult: Analysis content with parameters, timings and token usage
+        """
+        print(f"🚀 Processing: {query}")
+        start_time = time.perf_counter()
+        timings = {}
+        usage = {}
+        
+        # Step 1: Extract company and dates, unless the caller already did
+        extraction = self._supplied_extraction(parameters)
+        if not extraction:
+            extraction = self.extract_company_and_dates(query, usage=usage)
+        timings['extraction'] = time.perf_counter() - start_time
         
         if extraction['confidence'] == 'low':
-            return "❌ Could not identify company in query. Please specify a company name."
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_insider_analyzer', query,
+                "❌ Could not identify company in query. Please specify a company name.",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
         
         # Step 2: Find company file
         json_file = self.find_company_file(extraction['company'])
         if not json_file:
-            return f"❌ No data file found for {extraction['company']}"
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_insider_analyzer', query,
+                f"❌ No data file found for {extraction['company']}",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
         
         # Step 3: Analyze filings
         start_date = extraction['date_range']['start_date']
         end_date = extraction['date_range']['end_date']
         
-        result = self.analyze_filings(json_file, start_date, end_date, user_query)
+        stage_start = time.perf_counter()
+        try:
+            result = self.analyze_filings(json_file, start_date, end_date, query, usage=usage)
+        except Exception as e:
+            timings['analysis'] = time.perf_counter() - stage_start
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure(
+                'sec_insider_analyzer', query, f"Error analyzing filings: {str(e)}",
+                metadata={"parameters": extraction}, timings=timings, token_usage=usage
+            )
+        timings['analysis'] = time.perf_counter() - stage_start
+        
+        # Step 4: Optionally save result
+        filename = self.save_analysis_result(result, query, extraction) if save_output else None
         
-        # Step 4: Save result
+        timings['total'] = time.perf_counter() - start_time
+        return ToolResult(
+            tool='sec_insider_analyzer',
+            query=query,
+            success=True,
+            content=result,
+            metadata={"parameters": extraction, "json_file_used": str(json_file)},
+            timings=timings,
+            token_usage=usage,
+            output_file=filename
+        )
+
+    def save_analysis_result(self, result: str, user_query: str, extraction: Dict) -> str:
+        """Save an insider trading analysis to a txt file and return its path"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"insider_analysis_{timestamp}.txt"
         
@@ -283,26 +355,62 @@ Be specific about dates, names, titles, and transaction amounts. If no actual tr
             f.write(f"=== INSIDER TRADING ANALYSIS ===\n")
             f.write(f"Query: {user_query}\n")
             f.write(f"Company: {extraction['company']}\n")
-            f.write(f"Date Range: {start_date} to {end_date}\n")
+            f.write(f"Date Range: {extraction['date_range']['start_date']} to {extraction['date_range']['end_date']}\n")
             f.write(f"Generated: {datetime.now()}\n")
             f.write("="*50 + "\n\n")
             f.write(result)
         
         print(f"✅ Analysis complete! Saved to: {filename}")
-        return result
+        return filename
+
+    def process_insider_query(self, user_query: str) -> Dict:
+        """
+        Complete Form 4 query processing pipeline, saving the result to a file
+        
+        Args:
+            user_query (str): User's original query
+            
+        Returns:
+            Dict: Processing results and file paths
+        """
+        result = self.analyze_query(user_query, save_output=True)
+        if not result.success:
+            return {"success": False, "error": result.error}
+        
+        return {
+            "success": True,
+            "parameters": result.metadata["parameters"],
+            "json_file_used": result.metadata["json_file_used"],
+            "analysis_result": result.content,
+            "output_file": result.output_file
+        }
+
+    def process_query(self, user_query: str) -> str:
+        """Main processing pipeline"""
+        result = self.process_insider_query(user_query)
+        if not result["success"]:
+            return result["error"]
+        return result["analysis_result"]
 
 
 def main():
     """Command line interface"""
     parser = argparse.ArgumentParser(description='Analyze insider trading from Form 4 data')
-    parser.add_argument('query', help='Your question about insider trading')
+    parser.add_argument('query', nargs='?', help='Your question about insider trading')
     parser.add_argument('-f', '--folder', default='gemini_form4', help='Folder containing JSON files')
     parser.add_argument('-k', '--api-key', help='Gemini API key')
+    parser.add_argument('--rpc', action='store_true', help='Serve JSON-RPC "analyze" requests on stdin/stdout')
     
     args = parser.parse_args()
+    if not args.query and not args.rpc:
+        parser.error("Please provide a query or use --rpc")
     
     try:
         analyzer = InsiderTradingAnalyzer(api_key=args.api_key, json_folder=args.folder)
+        if args.rpc:
+            serve_json_rpc('sec_insider_analyzer', analyzer.analyze_query)
+            return
+        
         result = analyzer.process_query(args.query)
         print("\n" + "="*50)
         print("ANALYSIS RESULT:")
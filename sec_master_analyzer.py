@@ -1,32 +1,51 @@
+import contextlib
+import dataclasses
 import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 from datetime import datetime
 import re
 import subprocess
 import sys
-from typing import Dict, List, Optional, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from context_packer import pack_sources, synthesis_budget
+from llm_client import call_deadline, call_time_left, get_model_for
+from query_parser import ParsedQuery, parse_query
+from sec_tools import SECFormsTools
+from sec_8k_analyzer import SEC8KAnalyzer
+from sec_insider_analyzer import InsiderTradingAnalyzer
+from single_flight import SingleFlight
+from tool_result import ToolResult, add_token_usage, call_json_rpc
 
 # Load environment variables
 load_dotenv()
 
 class SECMasterAnalyzer:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, in_process=False, save_outputs=True, tool_timeout=None, max_tool_workers=None,
+                 synthesis_reserve=None, synthesis_tokens=None):
         """
         Initialize SEC Master Analyzer that orchestrates all SEC analysis tools
         
         Args:
             api_key (str): Google Gemini API key
+            in_process (bool): Call long-lived tool instances directly instead of
+                spawning one subprocess per tool
+            save_outputs (bool): Write the comprehensive_analysis_* report directory;
+                results are always returned in memory
+            tool_timeout (float): Seconds each tool may run before it is reported as timed
+                out (default TOOL_TIMEOUT or 180)
+            max_tool_workers (int): Threads shared by concurrent tool runs (default TOOL_WORKERS or 12)
+            synthesis_reserve (float): Seconds before a request deadline at which tool results
+                stop being waited for so synthesis can finish, capped at half the time left
+                (default SYNTHESIS_RESERVE or 60)
+            synthesis_tokens (int): Token budget shared by the analyses given to synthesis
+                (default SYNTHESIS_TOKEN_BUDGET or 6000; 0 sends them whole)
         """
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('synthesis', api_key=api_key)
+        self.routing_model = get_model_for('query_routing', api_key=api_key)
         
         # Define tool configurations
         self.tools = {
@@ -46,23 +65,90 @@ class SECMasterAnalyzer:
                 'data_type': 'Insider trading activity'
             }
         }
+        
+        self.save_outputs = save_outputs
+        
+        # Long-lived tool instances for in-process mode
+        self.in_process = in_process
+        self.tool_instances = {}
+        if in_process:
+            self.tool_instances = {
+                'sec_tools': SECFormsTools(api_key=api_key),
+                'sec_8k_analyzer': SEC8KAnalyzer(api_key=api_key),
+                'sec_insider_analyzer': InsiderTradingAnalyzer(api_key=api_key)
+            }
+        
+        # Identical tool runs requested concurrently share one execution
+        self.tool_flights = SingleFlight()
+        
+        # The tools are independent, so they run side by side on a shared pool
+        self.tool_timeout = float(tool_timeout or os.getenv('TOOL_TIMEOUT', '180'))
+        self.tool_executor = ThreadPoolExecutor(
+            max_workers=int(max_tool_workers or os.getenv('TOOL_WORKERS', '12')),
+            thread_name_prefix='sec-tool'
+        )
+        self.synthesis_reserve = float(synthesis_reserve or os.getenv('SYNTHESIS_RESERVE', '60'))
+        self.synthesis_tokens = synthesis_budget() if synthesis_tokens is None else int(synthesis_tokens)
 
-    def enhance_user_query(self, user_query: str) -> Dict:
+    def enhance_user_query(self, user_query: str, usage: Optional[Dict] = None) -> Dict:
         """
         Enhance user query and determine which tools to use
+        
+        Queries the local parser resolves confidently (one named company, a clear
+        period) are routed by keyword with locally parsed tool parameters, without
+        an LLM call.
         """
+        parsed = parse_query(user_query)
+        if parsed.confident:
+            print(f"⚡ Query parsed locally (confidence {parsed.confidence:.2f}), skipping the routing call")
+            return self._keyword_enhancement(user_query, parsed)
+        
         enhancement_prompt = """You are an expert SEC filing analyst. Analyze the user's query and enhance it for comprehensive SEC analysis across different filing types.
 
 ## TASK
 1. Enhance the user query to be more specific and analytical
 2. Determine which SEC filing types would be most relevant
 3. Create optimized queries for each relevant tool
+4. Extract each tool's parameters so the tools can skip their own extraction step
 
 ## AVAILABLE TOOLS & DATA:
 - **10-K Tool**: Annual reports, business segments, risk factors, financial information, governance
 - **8-K Tool**: Current events, material changes, acquisitions, earnings releases, legal matters
 - **Form 4 Tool**: Insider trading, executive transactions, director activity
 
+## TOOL PARAMETERS (use these exact formats)
+Companies (10-K and 8-K name → Form 4 name):
+- Apple Inc → Apple_Inc
+- Microsoft Corporation → MICROSOFT_CORP
+- NVIDIA Corporation → NVIDIA_CORP
+- Meta Platforms Inc → Meta_Platforms_Inc
+- JPMorgan Chase & Co → JPMORGAN_CHASE_&_CO
+- Johnson & Johnson → JOHNSON_&_JOHNSON
+- DoorDash Inc → DoorDash_Inc
+- Roku Inc → ROKU_INC
+- Zoom Communications Inc → Zoom_Communications_Inc
+
+Valid years: 2020-2025.
+
+sec_tools parameters:
+- "year": "YYYY", "latest", or "YYYY,YYYY" for comparisons
+- "company": 10-K name
+- "category": "Part I: Business and Risk Factors", "Part II: Financial Information", "Part III: Governance", "Part IV: Exhibits and Schedules" or "all"
+- "subcategory": "Item 1. Business", "Item 1A. Risk Factors", "Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations (MD&A)", another exact 10-K item name, or "general"
+- "items": list of the exact 10-K item names the query needs (e.g. ["Item 1A. Risk Factors"] or ["Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations (MD&A)", "Item 7A. Quantitative and Qualitative Disclosures About Market Risk"]); [] only when the whole part is needed
+
+sec_8k_analyzer parameters:
+- "company": 8-K name
+- "analysis_focus": acquisitions, financial_results, material_agreements, management_changes, legal_matters, regulation_fd, debt_financing or all
+- "time_period": "YYYY" or null
+- "confidence": high, medium or low
+
+sec_insider_analyzer parameters:
+- "company": Form 4 name
+- "date_range": {"start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}
+- "analysis_type": executive_transactions, director_activity, insider_sentiment, large_transactions, stock_options, recent_activity or all
+- "confidence": high, medium or low
+
 ## RESPONSE FORMAT
 Return ONLY valid JSON:
 
@@ -73,17 +159,20 @@ Return ONLY valid JSON:
     {
       "tool": "sec_tools",
       "query": "Specific enhanced query for 10-K analysis",
-      "rationale": "Why this tool is needed"
+      "rationale": "Why this tool is needed",
+      "parameters": {"year": "...", "company": "...", "category": "...", "subcategory": "...", "items": ["..."]}
     },
     {
       "tool": "sec_8k_analyzer", 
       "query": "Specific enhanced query for 8-K analysis",
-      "rationale": "Why this tool is needed"
+      "rationale": "Why this tool is needed",
+      "parameters": {"company": "...", "analysis_focus": "...", "time_period": null, "confidence": "..."}
     },
     {
       "tool": "sec_insider_analyzer",
       "query": "Specific enhanced query for Form 4 analysis", 
-      "rationale": "Why this tool is needed"
+      "rationale": "Why this tool is needed",
+      "parameters": {"company": "...", "date_range": {"start_date": "...", "end_date": "..."}, "analysis_type": "...", "confidence": "..."}
     }
   ],
   "expected_insights": "What key insights should emerge from combined analysis"
@@ -99,17 +188,20 @@ User: "Tell me about Apple"
     {
       "tool": "sec_tools",
       "query": "What are Apple's main business segments, revenue streams, and key risk factors?",
-      "rationale": "10-K provides foundational business understanding"
+      "rationale": "10-K provides foundational business understanding",
+      "parameters": {"year": "latest", "company": "Apple Inc", "category": "Part I: Business and Risk Factors", "subcategory": "general", "items": ["Item 1. Business", "Item 1A. Risk Factors"]}
     },
     {
       "tool": "sec_8k_analyzer",
       "query": "What material events and current developments has Apple reported recently?",
-      "rationale": "8-K shows recent material changes and events"
+      "rationale": "8-K shows recent material changes and events",
+      "parameters": {"company": "Apple Inc", "analysis_focus": "all", "time_period": null, "confidence": "high"}
     },
     {
       "tool": "sec_insider_analyzer", 
       "query": "Show me recent Apple insider trading activity and executive transactions",
-      "rationale": "Form 4 reveals management sentiment and activity"
+      "rationale": "Form 4 reveals management sentiment and activity",
+      "parameters": {"company": "Apple_Inc", "date_range": {"start_date": "2024-01-01", "end_date": "2024-12-31"}, "analysis_type": "executive_transactions", "confidence": "high"}
     }
   ],
   "expected_insights": "Integrated view of Apple's business model, recent strategic moves, and management confidence levels"
@@ -119,21 +211,11 @@ User Query: """
         
         try:
             full_prompt = enhancement_prompt + user_query
-            response = self.model.generate_content(full_prompt)
-            
-            if response.text:
-                # Clean and parse JSON
-                text = response.text.strip()
-                if text.startswith('```json'):
-                    text = text.split('```json')[1].split('```')[0]
-                elif text.startswith('```'):
-                    text = text.split('```')[1].split('```')[0]
-                    
-                result = json.loads(text)
-                print(f"✓ Query enhanced successfully")
-                print(f"📋 Analysis scope: {result['analysis_scope']}")
-                print(f"🔧 Tools to use: {len(result['tools_to_use'])}")
-                return result
+            result = self.routing_model.generate_validated(full_prompt, self._parse_enhancement, usage=usage)
+            print(f"✓ Query enhanced successfully")
+            print(f"📋 Analysis scope: {result['analysis_scope']}")
+            print(f"🔧 Tools to use: {len(result['tools_to_use'])}")
+            return result
                 
         except Exception as e:
             print(f"⚠️ Query enhancement error: {e}")
@@ -141,10 +223,46 @@ User Query: """
         # Fallback enhancement
         return self._fallback_enhancement(user_query)
 
+    def _parse_enhancement(self, text: str) -> Dict:
+        """
+        Parse and validate the query enhancement JSON
+
+        Raises:
+            ValueError: If required fields are missing or a tool is unknown
+        """
+        text = (text or '').strip()
+        if text.startswith('```json'):
+            text = text.split('```json')[1].split('```')[0]
+        elif text.startswith('```'):
+            text = text.split('```')[1].split('```')[0]
+
+        result = json.loads(text)
+        if not result.get('enhanced_query') or 'analysis_scope' not in result:
+            raise ValueError("enhancement is missing enhanced_query or analysis_scope")
+        tools = result.get('tools_to_use')
+        if not isinstance(tools, list) or not tools:
+            raise ValueError("enhancement has no tools_to_use")
+        for tool in tools:
+            if tool.get('tool') not in self.tools or not tool.get('query'):
+                raise ValueError(f"unknown tool or empty query in {tool}")
+            # Parameters are optional; the tool validates them and extracts its own if they are unusable
+            if not isinstance(tool.get('parameters'), dict):
+                tool.pop('parameters', None)
+        return result
+
     def _fallback_enhancement(self, user_query: str) -> Dict:
         """Fallback query enhancement using basic logic"""
         print("🔄 Using fallback query enhancement...")
+        return self._keyword_enhancement(user_query)
+
+    def _keyword_enhancement(self, user_query: str, parsed: Optional[ParsedQuery] = None) -> Dict:
+        """
+        Choose tools by keyword, attaching locally parsed parameters when given
         
+        Args:
+            user_query (str): Original user query
+            parsed (ParsedQuery): Confident local parse whose parameters the tools should use
+        """
         # Basic enhancement logic
         enhanced_query = f"Provide comprehensive SEC analysis of: {user_query}"
         
@@ -189,6 +307,16 @@ User Query: """
                 }
             ])
         
+        if parsed:
+            tool_parameters = {
+                'sec_tools': parsed.tenk_parameters(),
+                'sec_8k_analyzer': parsed.eightk_parameters(),
+                'sec_insider_analyzer': parsed.insider_parameters()
+            }
+            for tool in tools_to_use:
+                if tool_parameters[tool['tool']]:
+                    tool['parameters'] = tool_parameters[tool['tool']]
+        
         return {
             "enhanced_query": enhanced_query,
             "analysis_scope": f"Comprehensive SEC analysis covering: {user_query}",
@@ -196,119 +324,169 @@ User Query: """
             "expected_insights": f"Multi-dimensional analysis of {user_query} across different SEC filing types"
         }
 
-    def run_analysis_tool(self, tool_config: Dict) -> Dict:
+    def run_analysis_tool(self, tool_config: Dict) -> ToolResult:
+        """
+        Run individual analysis tool and return its structured result
+        
+        Concurrent calls for the same tool, query (ignoring case and whitespace) and
+        parameters attach to the run already in progress instead of starting another one.
+        """
+        key = (tool_config['tool'], ' '.join(tool_config['query'].lower().split()),
+               json.dumps(tool_config.get('parameters'), sort_keys=True))
+        runner = self.run_analysis_tool_in_process if self.in_process else self.run_analysis_tool_subprocess
+        
+        result, shared = self.tool_flights.do(key, lambda: runner(tool_config))
+        if shared:
+            print(f"🔗 {tool_config['tool']} result shared with an identical in-flight run")
+            result = dataclasses.replace(
+                result, query=tool_config['query'], metadata={**result.metadata, 'coalesced': True}
+            )
+        return result
+
+    def run_analysis_tool_in_process(self, tool_config: Dict) -> ToolResult:
+        """
+        Run individual analysis tool on its long-lived instance
+        """
+        tool_name = tool_config['tool']
+        query = tool_config['query']
+        
+        print(f"🔍 Running {tool_name} (in-process): {query[:60]}...")
+        
+        start_time = time.perf_counter()
+        try:
+            result = self.tool_instances[tool_name].analyze_query(query, parameters=tool_config.get('parameters'))
+        except Exception as e:
+            result = ToolResult.failure(tool_name, query, str(e),
+                                        timings={'total': time.perf_counter() - start_time})
+        
+        self._print_tool_outcome(result)
+        return result
+
+    def run_analysis_tool_subprocess(self, tool_config: Dict) -> ToolResult:
         """
-        Run individual analysis tool and capture results
+        Run individual analysis tool as a separate script, calling it over JSON-RPC
         """
         tool_name = tool_config['tool']
         query = tool_config['query']
         
         print(f"🔍 Running {tool_name}: {query[:60]}...")
         
+        # The query travels on stdin, so no shell quoting is involved on any platform
+        env = os.environ.copy()
+        env['PYTHONIOENCODING'] = 'utf-8'
+        if os.name == 'nt':
+            env['PYTHONLEGACYWINDOWSSTDIO'] = '1'
+        
+        cmd = [sys.executable, self.tools[tool_name]['script'], '--rpc']
+        start_time = time.perf_counter()
         try:
-            # Build command - ensure proper quote handling and encoding for Windows
-            script_path = self.tools[tool_name]['script']
-            
-            # For Windows, we need to handle quotes carefully and set UTF-8 encoding
-            if os.name == 'nt':  # Windows
-                # Set environment variables for UTF-8 encoding
-                env = os.environ.copy()
-                env['PYTHONIOENCODING'] = 'utf-8'
-                env['PYTHONLEGACYWINDOWSSTDIO'] = '1'
-                
-                cmd = f'python "{script_path}" "{query}"'
-                result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd(), 
-                                      shell=True, env=env, encoding='utf-8', errors='replace')
-            else:  # Unix/Linux
-                cmd = [sys.executable, script_path, query]
-                result = subprocess.run(cmd, capture_output=True, text=True, cwd=os.getcwd())
-            
-            # Run the tool
-            start_time = datetime.now()
-            end_time = datetime.now()
-            
-            if result.returncode == 0:
-                # Parse output to find generated file
-                output_lines = result.stdout.split('\n')
-                generated_file = None
-                
-                # Look for different patterns in the output
-                for line in output_lines:
-                    line = line.strip()
-                    if 'saved to:' in line.lower() or 'result saved to:' in line.lower() or 'analysis saved to:' in line.lower():
-                        # Extract filename from output - look for .txt files
-                        parts = line.split()
-                        for part in parts:
-                            if part.endswith('.txt'):
-                                generated_file = part
-                                break
-                    elif line.startswith('📄') and '.txt' in line:
-                        # Pattern: 📄 Result saved to: filename.txt
-                        parts = line.split()
-                        for part in parts:
-                            if part.endswith('.txt'):
-                                generated_file = part
-                                break
-                    
-                    if generated_file:
-                        break
-                
-                if generated_file and os.path.exists(generated_file):
-                    # Read the generated analysis
-                    with open(generated_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    print(f"✅ {tool_name} completed successfully")
-                    return {
-                        'success': True,
-                        'tool': tool_name,
-                        'query': query,
-                        'file_path': generated_file,
-                        'content': content,
-                        'execution_time': (end_time - start_time).total_seconds()
-                    }
-                else:
-                    print(f"⚠️ {tool_name} completed but no output file found")
-                    print(f"STDOUT: {result.stdout}")
-                    print(f"STDERR: {result.stderr}")
-                    return {
-                        'success': False,
-                        'tool': tool_name,
-                        'query': query,
-                        'error': 'No output file generated',
-                        'stdout': result.stdout,
-                        'stderr': result.stderr
-                    }
-            else:
-                print(f"❌ {tool_name} failed with error code {result.returncode}")
-                print(f"STDOUT: {result.stdout}")
-                print(f"STDERR: {result.stderr}")
-                return {
-                    'success': False,
-                    'tool': tool_name,
-                    'query': query,
-                    'error': f'Tool failed with code {result.returncode}',
-                    'stdout': result.stdout,
-                    'stderr': result.stderr
-                }
-                
+            params = {'query': query}
+            if tool_config.get('parameters'):
+                params['parameters'] = tool_config['parameters']
+            time_left = call_time_left()
+            timeout = self.tool_timeout if time_left is None else min(self.tool_timeout, time_left)
+            result = call_json_rpc(cmd, params, timeout=timeout, env=env)
         except Exception as e:
-            print(f"❌ Error running {tool_name}: {str(e)}")
-            return {
-                'success': False,
-                'tool': tool_name,
-                'query': query,
-                'error': str(e)
-            }
+            result = ToolResult.failure(tool_name, query, str(e),
+                                        timings={'total': time.perf_counter() - start_time})
+        
+        self._print_tool_outcome(result)
+        return result
+
+    def run_tools_concurrently(self, tool_configs: List[Dict],
+                               progress_callback: Optional[Callable[[str, Dict], None]] = None,
+                               timeout: Optional[float] = None) -> List[ToolResult]:
+        """
+        Run the selected tools at the same time and wait up to timeout seconds for them
+        
+        Tools still running when the timeout expires are reported as failed results so
+        synthesis can go ahead with the others. The tools' Gemini calls (and tool
+        subprocesses) share the same deadline through llm_client.call_deadline, so an
+        abandoned tool stops at its next call instead of holding a pool thread.
+        
+        Args:
+            tool_configs (List[Dict]): {"tool", "query", "parameters"} entries from the enhancement step
+            progress_callback (Callable): Optional progress event receiver
+            timeout (float): Seconds to wait (defaults to tool_timeout)
+        
+        Returns:
+            List[ToolResult]: One result per tool config, in the same order
+        """
+        timeout = self.tool_timeout if timeout is None else max(0.0, timeout)
+        tools_deadline = time.time() + timeout
+
+        def run(tool_config: Dict) -> ToolResult:
+            self._report_progress(progress_callback, 'tool_started', tool=tool_config['tool'], query=tool_config['query'])
+            with call_deadline(tools_deadline):
+                result = self.run_analysis_tool(tool_config)
+                # A tool whose calls were cut off by the deadline timed out rather than failed
+                if not result.success and call_time_left() == 0:
+                    result = dataclasses.replace(result, metadata={**result.metadata, 'timed_out': True})
+            return result
+        
+        futures = {self.tool_executor.submit(run, tool_config): i for i, tool_config in enumerate(tool_configs)}
+        results: Dict[int, ToolResult] = {}
+        
+        def record(i: int, result: ToolResult):
+            results[i] = result
+            self._report_progress(
+                progress_callback, 'tool_finished',
+                tool=result.tool,
+                success=result.success,
+                execution_time=result.execution_time,
+                error=result.error
+            )
+        
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                i = futures[future]
+                try:
+                    record(i, future.result())
+                except Exception as e:
+                    record(i, ToolResult.failure(tool_configs[i]['tool'], tool_configs[i]['query'], str(e)))
+        except FuturesTimeoutError:
+            for future, i in futures.items():
+                if i in results:
+                    continue
+                future.cancel()
+                print(f"⏱️ {tool_configs[i]['tool']} did not finish within {timeout:.0f}s")
+                record(i, ToolResult.failure(
+                    tool_configs[i]['tool'], tool_configs[i]['query'],
+                    f"Timed out after {timeout:.0f} seconds",
+                    timings={'total': timeout},
+                    metadata={'timed_out': True}
+                ))
+        
+        return [results[i] for i in range(len(tool_configs))]
+
+    def _print_tool_outcome(self, result: ToolResult):
+        """Print a one-line summary of a tool run"""
+        if result.success:
+            print(f"✅ {result.tool} completed successfully ({result.execution_time:.1f}s)")
+        else:
+            print(f"❌ {result.tool} failed: {result.error}")
 
-    def combine_analyses(self, original_query: str, enhanced_query: str, analysis_results: List[Dict]) -> str:
+    def combine_analyses(self, original_query: str, enhanced_query: str, analysis_results: List[ToolResult],
+                         progress_callback: Optional[Callable[[str, Dict], None]] = None,
+                         usage: Optional[Dict] = None, deadline: Optional[float] = None,
+                         packing: Optional[List[Dict]] = None) -> str:
         """
         Combine and synthesize all analysis results using Gemini
+        
+        The successful analyses share a budget of synthesis_tokens: each gets a share by
+        relevance to the query and length, and one over its share is cut down to its most
+        relevant sentences (context_packer.pack_sources). What each source kept is appended
+        to packing when a list is given.
+        
+        When a progress callback is given the synthesis is streamed and every chunk
+        of text is reported as a "synthesis_token" event as soon as it arrives. With a
+        deadline (time.time() value) the stream is cut off once it passes and the
+        partial synthesis is returned.
         """
         print("🔄 Combining analyses with Gemini...")
         
         # Filter successful results
-        successful_results = [r for r in analysis_results if r.get('success', False)]
+        successful_results = [r for r in analysis_results if r.success]
         
         if not successful_results:
             return "❌ No successful analyses to combine."
@@ -326,23 +504,42 @@ You have been provided with analysis results from three specialized SEC tools:
 
 """
         
+        # Fit the analyses into the synthesis budget, compressing the ones over their share
+        contents, allocations = pack_sources([r.content for r in successful_results],
+                                             f"{original_query}\n{enhanced_query}", self.synthesis_tokens)
+        
         # Add each successful analysis
-        for i, result in enumerate(successful_results, 1):
-            tool_desc = self.tools[result['tool']]['description']
-            data_type = self.tools[result['tool']]['data_type']
+        for i, (result, content, allocation) in enumerate(zip(successful_results, contents, allocations), 1):
+            tool_desc = self.tools[result.tool]['description']
+            data_type = self.tools[result.tool]['data_type']
+            content_label = "**ANALYSIS CONTENT**:"
+            if allocation.compressed:
+                content_label = (f"**ANALYSIS CONTENT** (key excerpts, ~{allocation.tokens_after:,} of "
+                                 f"~{allocation.tokens_before:,} tokens; [...] marks omitted text):")
+                print(f"📦 {result.tool}: ~{allocation.tokens_before:,} → ~{allocation.tokens_after:,} tokens "
+                      f"(share {allocation.budget:,} of {self.synthesis_tokens:,})")
+            if packing is not None:
+                packing.append({'tool': result.tool, **allocation.to_dict()})
             
             combination_prompt += f"""
-### SOURCE {i}: {result['tool'].upper().replace('_', ' ')} 
+### SOURCE {i}: {result.tool.upper().replace('_', ' ')} 
 **Data Type**: {data_type}
 **Tool Focus**: {tool_desc}
-**Query Used**: {result['query']}
+**Query Used**: {result.query}
 
-**ANALYSIS CONTENT**:
-{result['content'][:4000]}  # Limit content to avoid token limits
+{content_label}
+{content}
 
 ---
 """
         
+        # Tell the model which sources are missing so it does not present a partial picture as complete
+        omitted_results = [r for r in analysis_results if not r.success]
+        if omitted_results:
+            combination_prompt += "\n## SOURCES NOT AVAILABLE\nThe following analyses did not complete and are NOT included above; mention these gaps in the Analysis Notes:\n"
+            for result in omitted_results:
+                combination_prompt += f"- {self.tools[result.tool]['description']} ({result.error})\n"
+        
         combination_prompt += f"""
 
 ## SYNTHESIS REQUIREMENTS
@@ -416,44 +613,162 @@ RESPOND WITH COMPREHENSIVE SYNTHESIS:
 """
         
         try:
+            if progress_callback or deadline:
+                response = self.model.generate_content(combination_prompt, stream=True)
+                text_parts = []
+                for chunk in response:
+                    chunk_text = self._chunk_text(chunk)
+                    if chunk_text:
+                        text_parts.append(chunk_text)
+                        self._report_progress(progress_callback, 'synthesis_token', text=chunk_text)
+                    if deadline and time.time() >= deadline:
+                        print("⏱️ Request deadline reached during synthesis, returning partial analysis")
+                        text_parts.append("\n\n[Synthesis cut off at the request deadline]")
+                        break
+                else:
+                    add_token_usage(usage, response)
+                combined_text = ''.join(text_parts)
+                return combined_text if combined_text else "Failed to generate combined analysis"
+            
             response = self.model.generate_content(combination_prompt)
+            add_token_usage(usage, response)
             return response.text if response.text else "Failed to generate combined analysis"
             
         except Exception as e:
             return f"Error combining analyses: {str(e)}"
 
-    def process_comprehensive_query(self, user_query: str) -> Dict:
+    def _chunk_text(self, chunk) -> str:
+        """Return the text of a streamed response chunk (empty for chunks without text parts)"""
+        try:
+            return chunk.text or ''
+        except ValueError:
+            return ''
+
+    def _report_progress(self, progress_callback: Optional[Callable[[str, Dict], None]], event: str, **data):
+        """Forward a pipeline stage event to the caller without letting it break the analysis"""
+        if not progress_callback:
+            return
+        try:
+            progress_callback(event, data)
+        except Exception as e:
+            print(f"⚠️ Progress callback error: {e}")
+
+    def process_comprehensive_query(self, user_query: str,
+                                    progress_callback: Optional[Callable[[str, Dict], None]] = None,
+                                    deadline: Optional[float] = None) -> Dict:
         """
         Main processing pipeline that orchestrates all tools
+        
+        Args:
+            user_query (str): User's original query
+            progress_callback (Callable): Optional callback receiving (event, data) for each
+                pipeline stage: query_enhanced, tool_started, tool_finished,
+                synthesis_started, synthesis_token and synthesis_finished
+            deadline (float): Optional time.time() by which the answer is needed. Tools are
+                waited for until synthesis_reserve seconds before it (or half the time left,
+                if that is shorter); whatever has finished by then is synthesized and the
+                rest is reported under omitted_sources.
         """
         print(f"🚀 Starting comprehensive SEC analysis: {user_query}")
         print("="*80)
+        start_time = time.perf_counter()
+        timings = {}
+        usage = {}
         
         # Step 1: Enhance query and determine tools
-        enhancement = self.enhance_user_query(user_query)
+        enhancement = self.enhance_user_query(user_query, usage=usage)
+        timings['enhancement'] = time.perf_counter() - start_time
+        self._report_progress(
+            progress_callback, 'query_enhanced',
+            enhanced_query=enhancement['enhanced_query'],
+            analysis_scope=enhancement['analysis_scope'],
+            tools=[tool_config['tool'] for tool_config in enhancement['tools_to_use']]
+        )
         
-        # Step 2: Run each tool
-        analysis_results = []
-        for tool_config in enhancement['tools_to_use']:
-            result = self.run_analysis_tool(tool_config)
-            analysis_results.append(result)
+        # Step 2: Run the tools concurrently, leaving time for synthesis before the deadline
+        stage_start = time.perf_counter()
+        tool_wait = self.tool_timeout
+        if deadline:
+            # With less than twice the reserve left, split the time evenly so the tools
+            # still get a share instead of all being dropped
+            time_left = deadline - time.time()
+            tool_wait = min(tool_wait, time_left - min(self.synthesis_reserve, time_left / 2))
+        analysis_results = self.run_tools_concurrently(enhancement['tools_to_use'], progress_callback, timeout=tool_wait)
+        timings['tools'] = time.perf_counter() - stage_start
         
         print("\n" + "="*80)
         print("📊 INDIVIDUAL ANALYSIS SUMMARY:")
         for result in analysis_results:
-            status = "✅" if result.get('success') else "❌"
-            tool = result['tool'].replace('_', ' ').title()
+            status = "✅" if result.success else "❌"
+            tool = result.tool.replace('_', ' ').title()
             print(f"  {status} {tool}")
         
+        successful_results = [r for r in analysis_results if r.success]
+        omitted_sources = [
+            {'tool': r.tool, 'reason': 'timeout' if r.metadata.get('timed_out') else 'error', 'error': r.error}
+            for r in analysis_results if not r.success
+        ]
+        
         # Step 3: Combine all analyses
         print("\n" + "="*80)
+        stage_start = time.perf_counter()
+        self._report_progress(progress_callback, 'synthesis_started', sources=len(successful_results))
+        synthesis_packing = []
         combined_analysis = self.combine_analyses(
             user_query, 
             enhancement['enhanced_query'], 
-            analysis_results
+            analysis_results,
+            progress_callback=progress_callback,
+            usage=usage,
+            deadline=deadline,
+            packing=synthesis_packing
         )
+        self._report_progress(progress_callback, 'synthesis_finished', length=len(combined_analysis))
+        timings['synthesis'] = time.perf_counter() - stage_start
+        
+        # Token usage across the orchestrator's own calls and every tool
+        total_usage = dict(usage)
+        for result in analysis_results:
+            for key, count in result.token_usage.items():
+                total_usage[key] = total_usage.get(key, 0) + count
+        
+        # Step 4: Optionally save individual analyses and comprehensive result
+        saved = {'analysis_directory': None, 'output_file': None, 'individual_files': {}, 'index_file': None}
+        if self.save_outputs:
+            saved = self.save_analysis_outputs(user_query, enhancement, analysis_results, combined_analysis)
+        timings['total'] = time.perf_counter() - start_time
         
-        # Step 4: Save individual analyses and comprehensive result
+        print(f"\n✅ Comprehensive analysis complete in {timings['total']:.1f}s!")
+        
+        # An answer with no source behind it is an error, not an analysis
+        success = bool(successful_results)
+        if not success:
+            print("❌ No analysis tool succeeded")
+        
+        return {
+            'success': success,
+            'error': None if success else 'No analysis tool succeeded',
+            'original_query': user_query,
+            'enhanced_query': enhancement['enhanced_query'],
+            'tools_used': len(enhancement['tools_to_use']),
+            'successful_analyses': len(successful_results),
+            'omitted_sources': omitted_sources,
+            'analysis_results': [r.to_dict() for r in analysis_results],
+            'combined_analysis': combined_analysis,
+            'timings': timings,
+            'token_usage': total_usage,
+            'synthesis_packing': synthesis_packing,
+            **saved
+        }
+
+    def save_analysis_outputs(self, user_query: str, enhancement: Dict, analysis_results: List[ToolResult],
+                              combined_analysis: str) -> Dict:
+        """
+        Write the comprehensive_analysis_* directory (individual, master and index files)
+        
+        Returns:
+            Dict: analysis_directory, output_file, individual_files and index_file paths
+        """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_query = re.sub(r'[^\w\s-]', '', user_query)[:40]
         safe_query = re.sub(r'[-\s]+', '_', safe_query)
@@ -464,21 +779,21 @@ RESPOND WITH COMPREHENSIVE SYNTHESIS:
         
         # Save individual analysis files in the directory
         individual_files = {}
-        successful_results = [r for r in analysis_results if r.get('success', False)]
+        successful_results = [r for r in analysis_results if r.success]
         
         for result in successful_results:
-            if result.get('content'):
-                tool_name = result['tool']
+            if result.content:
+                tool_name = result.tool
                 individual_file = os.path.join(analysis_dir, f"{tool_name}_analysis_{timestamp}.txt")
                 
                 with open(individual_file, 'w', encoding='utf-8') as f:
                     f.write(f"=== {tool_name.upper().replace('_', ' ')} ANALYSIS ===\n")
                     f.write(f"Original Query: {user_query}\n")
-                    f.write(f"Tool Query: {result['query']}\n")
+                    f.write(f"Tool Query: {result.query}\n")
                     f.write(f"Generated: {datetime.now()}\n")
-                    f.write(f"Execution Time: {result.get('execution_time', 0):.2f} seconds\n")
+                    f.write(f"Execution Time: {result.execution_time:.2f} seconds\n")
                     f.write("="*80 + "\n\n")
-                    f.write(result['content'])
+                    f.write(result.content)
                 
                 individual_files[tool_name] = individual_file
                 print(f"💾 Saved {tool_name} analysis: {individual_file}")
@@ -497,15 +812,15 @@ RESPOND WITH COMPREHENSIVE SYNTHESIS:
             f.write("INDIVIDUAL TOOL RESULTS:\n")
             f.write("-" * 40 + "\n")
             for result in analysis_results:
-                status = "SUCCESS" if result.get('success') else "FAILED"
-                tool_name = result['tool']
+                status = "SUCCESS" if result.success else "FAILED"
+                tool_name = result.tool
                 f.write(f"{tool_name.upper()}: {status}\n")
-                if result.get('success') and tool_name in individual_files:
+                if result.success and tool_name in individual_files:
                     f.write(f"  Individual File: {individual_files[tool_name]}\n")
-                elif result.get('file_path'):
-                    f.write(f"  Original Output: {result['file_path']}\n")
-                if result.get('error'):
-                    f.write(f"  Error: {result['error']}\n")
+                elif result.output_file:
+                    f.write(f"  Original Output: {result.output_file}\n")
+                if result.error:
+                    f.write(f"  Error: {result.error}\n")
             f.write("\n" + "="*80 + "\n\n")
             
             f.write("COMPREHENSIVE COMBINED ANALYSIS:\n")
@@ -519,13 +834,13 @@ RESPOND WITH COMPREHENSIVE SYNTHESIS:
                 f.write("="*80 + "\n")
                 
                 for result in successful_results:
-                    tool_desc = self.tools[result['tool']]['description']
-                    f.write(f"\n### {result['tool'].upper().replace('_', ' ')} ANALYSIS\n")
+                    tool_desc = self.tools[result.tool]['description']
+                    f.write(f"\n### {result.tool.upper().replace('_', ' ')} ANALYSIS\n")
                     f.write(f"**Tool Focus**: {tool_desc}\n")
-                    f.write(f"**Query Used**: {result['query']}\n")
+                    f.write(f"**Query Used**: {result.query}\n")
                     f.write("-" * 60 + "\n")
-                    f.write(result['content'][:3000])  # First 3000 chars
-                    if len(result['content']) > 3000:
+                    f.write(result.content[:3000])  # First 3000 chars
+                    if len(result.content) > 3000:
                         f.write("\n\n[... See individual file for complete analysis ...]\n")
                     f.write("\n" + "-" * 60 + "\n")
         
@@ -548,21 +863,13 @@ RESPOND WITH COMPREHENSIVE SYNTHESIS:
             f.write(f"\nTotal Files: {len(individual_files) + 2}\n")
             f.write(f"Successful Analyses: {len(successful_results)}/{len(analysis_results)}\n")
         
-        print(f"\n✅ Comprehensive analysis complete!")
-        print(f"� Analysis directory: {analysis_dir}")
-        print(f"�📄 Master report: {os.path.basename(comprehensive_file)}")
+        print(f"📁 Analysis directory: {analysis_dir}")
+        print(f"📄 Master report: {os.path.basename(comprehensive_file)}")
         print(f"📇 Analysis index: analysis_index.txt")
         if individual_files:
             print(f"📄 Individual files: {len(individual_files)} saved")
         
         return {
-            'success': True,
-            'original_query': user_query,
-            'enhanced_query': enhancement['enhanced_query'],
-            'tools_used': len(enhancement['tools_to_use']),
-            'successful_analyses': len([r for r in analysis_results if r.get('success')]),
-            'analysis_results': analysis_results,
-            'combined_analysis': combined_analysis,
             'analysis_directory': analysis_dir,
             'output_file': comprehensive_file,
             'individual_files': individual_files,
@@ -577,21 +884,42 @@ def main():
     parser = argparse.ArgumentParser(description='Comprehensive SEC Analysis Master Tool')
     parser.add_argument('query', help='Your comprehensive question about SEC filings and corporate analysis')
     parser.add_argument('-k', '--api-key', help='Gemini API key')
+    parser.add_argument('--in-process', action='store_true', help='Run the analysis tools in this process instead of as subprocesses')
+    parser.add_argument('--json', action='store_true', help='Print the full result as JSON on stdout (progress goes to stderr)')
+    parser.add_argument('--no-files', action='store_true', help='Do not write the comprehensive_analysis_* directory')
+    parser.add_argument('--time-budget', type=float, help='Seconds until the answer is needed; slow tools are left out')
     
     args = parser.parse_args()
+    deadline = time.time() + args.time_budget if args.time_budget else None
+    
+    if args.json:
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                analyzer = SECMasterAnalyzer(api_key=args.api_key, in_process=args.in_process,
+                                             save_outputs=not args.no_files)
+                result = analyzer.process_comprehensive_query(args.query, deadline=deadline)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+        print(json.dumps(result, default=str))
+        sys.exit(0 if result.get('success') else 1)
     
     try:
-        analyzer = SECMasterAnalyzer(api_key=args.api_key)
-        result = analyzer.process_comprehensive_query(args.query)
+        analyzer = SECMasterAnalyzer(api_key=args.api_key, in_process=args.in_process,
+                                     save_outputs=not args.no_files)
+        result = analyzer.process_comprehensive_query(args.query, deadline=deadline)
         
         if result['success']:
             print("\n" + "="*80)
             print("🎯 COMPREHENSIVE ANALYSIS SUMMARY:")
             print("="*80)
-            print(f"✓ Analysis directory: {result['analysis_directory']}")
             print(f"✓ Tools used: {result['tools_used']}")
             print(f"✓ Successful analyses: {result['successful_analyses']}")
-            print(f"✓ Master report: {os.path.basename(result['output_file'])}")
+            print(f"✓ Token usage: {result['token_usage'].get('total_tokens', 0)} tokens")
+            for omitted in result['omitted_sources']:
+                print(f"⚠️ Omitted {omitted['tool']} ({omitted['reason']}): {omitted['error']}")
+            if result['analysis_directory']:
+                print(f"✓ Analysis directory: {result['analysis_directory']}")
+                print(f"✓ Master report: {os.path.basename(result['output_file'])}")
             if result.get('individual_files'):
                 print(f"✓ Individual files: {len(result['individual_files'])}")
                 for tool_name, file_path in result['individual_files'].items():
@@ -602,7 +930,9 @@ def main():
             print(f"\n📋 PREVIEW:\n{preview}...")
             
         else:
-            print("❌ Comprehensive analysis failed")
+            print(f"❌ Comprehensive analysis failed: {result.get('error')}")
+            for omitted in result.get('omitted_sources', []):
+                print(f"⚠️ Omitted {omitted['tool']} ({omitted['reason']}): {omitted['error']}")
             
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -618,4 +948,5 @@ python sec_master_analyzer.py "Analyze Microsoft's strategic position and inside
 python sec_master_analyzer.py "What's happening with NVIDIA - business, events, and management actions?"
 python sec_master_analyzer.py "Comprehensive analysis of Meta's corporate situation"
 python sec_master_analyzer.py "Give me a complete picture of Johnson & Johnson"
+python sec_master_analyzer.py --json --no-files "Apple risk factors 2023" > result.json
 """
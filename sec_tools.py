@@ -1,11 +1,18 @@
-import os
 import json
-import google.generativeai as genai
 from pathlib import Path
 from datetime import datetime
 import re
+import time
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from company_resolver import get_resolver
+from context_packer import pack_sections
+from corpus_cache import get_corpus_cache
+from llm_client import get_model_for
+from query_parser import parse_query
+from section_store import get_section_store
+from slice_summarizer import SliceSummarizer
+from tool_result import ToolResult, add_token_usage, serve_json_rpc
 
 # Load environment variables
 load_dotenv()
@@ -19,13 +26,10 @@ class SECFormsTools:
             api_key (str): Google Gemini API key
             reports_folder (str): Path to folder containing JSON reports
         """
-        if api_key is None:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("API key must be provided either as parameter or GEMINI_API_KEY environment variable")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = get_model_for('10k_analysis', api_key=api_key)
+        self.extraction_model = get_model_for('10k_extraction', api_key=api_key)
+        # Multi-year queries summarize each (year, item) slice in parallel, then compare the summaries
+        self.summarizer = SliceSummarizer(get_model_for('10k_summary', api_key=api_key))
         self.reports_folder = Path(reports_folder)
         
         # Ensure reports folder exists
@@ -42,16 +46,22 @@ class SECFormsTools:
             # Add more form types later: "4", "8-K"
         }
 
-    def enhance_query_and_extract_parameters(self, user_query: str) -> Dict:
+    def enhance_query_and_extract_parameters(self, user_query: str, usage: Optional[Dict] = None) -> Dict:
         """
         Enhance user query and extract parameters using LLM
         
         Args:
             user_query (str): Original user query
+            usage (Dict): Optional token usage totals to update
             
         Returns:
             Dict: Enhanced query and extracted parameters
         """
+        parsed = parse_query(user_query)
+        if parsed.confident:
+            print(f"⚡ Parameters parsed locally (confidence {parsed.confidence:.2f}), skipping the LLM")
+            return {"enhanced_query": user_query, "parameters": parsed.tenk_parameters()}
+        
         enhancement_prompt = """You are an expert SEC 10-K filing analyst. Your task is to analyze user queries about SEC forms and extract specific parameters while enhancing the query for better analysis.
 
 ## EXACT COMPANY NAMES (use these exact formats):
@@ -68,7 +78,8 @@ class SECFormsTools:
 ## EXACT PART NAMES (use these exact formats):
 - "Part I: Business and Risk Factors"
 - "Part II: Financial Information"  
-- "Part III: Corporate Governance and Executive Compensation"
+- "Part III: Governance"
+- "Part IV: Exhibits and Schedules"
 
 ## EXACT SECTION NAMES (use these exact formats):
 - "Item 1. Business"
@@ -80,9 +91,13 @@ class SECFormsTools:
 - "Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations (MD&A)"
 - "Item 7A. Quantitative and Qualitative Disclosures About Market Risk"
 - "Item 8. Financial Statements and Supplementary Data"
+- "Item 9A. Controls and Procedures"
 - "Item 10. Directors, Executive Officers and Corporate Governance"
 - "Item 11. Executive Compensation"
 - "Item 12. Security Ownership of Certain Beneficial Owners and Management and Related Stockholder Matters"
+- "Item 13. Certain Relationships and Related Transactions, and Director Independence"
+- "Item 14. Principal Accountant Fees and Services"
+- "Item 15. Exhibits, Financial Statement Schedules"
 
 ## VALID YEARS: 2020, 2021, 2022, 2023, 2024, 2025 (use "latest" for most recent)
 
@@ -100,6 +115,8 @@ class SECFormsTools:
 ## TASK
 1. Enhance the user query to be more specific and analytical
 2. Extract parameters using EXACT names from the reference above
+3. List in "items" only the sections the query needs (e.g. just Item 1A for risk factors, just Item 7
+   for MD&A); only use an empty list when the query needs the whole part
 
 ## CRITICAL: RETURN ONLY VALID JSON
 Your response must be ONLY the JSON object below, no additional text before or after.
@@ -111,7 +128,8 @@ Your response must be ONLY the JSON object below, no additional text before or a
     "company": "Exact Company Name from list above",
     "form_type": "10-K",
     "category": "Exact Part Name from list above or all",
-    "subcategory": "Exact Section Name from list above or general"
+    "subcategory": "Exact Section Name from list above or general",
+    "items": ["Exact Section Names from list above the query needs, most relevant first"]
   }
 }
 
@@ -125,7 +143,8 @@ User: "What are Apple's main risk factors?"
     "company": "Apple Inc",
     "form_type": "10-K",
     "category": "Part I: Business and Risk Factors",
-    "subcategory": "Item 1A. Risk Factors"
+    "subcategory": "Item 1A. Risk Factors",
+    "items": ["Item 1A. Risk Factors"]
   }
 }
 
@@ -137,7 +156,21 @@ User: "How do Microsoft's risk factors compare between 2022 and 2023?"
     "company": "Microsoft Corporation",
     "form_type": "10-K",
     "category": "Part I: Business and Risk Factors",
-    "subcategory": "Item 1A. Risk Factors"
+    "subcategory": "Item 1A. Risk Factors",
+    "items": ["Item 1A. Risk Factors"]
+  }
+}
+
+User: "How did NVIDIA's revenue and market risk exposure change in 2024?"
+{
+  "enhanced_query": "Analyze NVIDIA Corporation's 2024 revenue performance and drivers as discussed in MD&A, together with its quantitative and qualitative market risk disclosures such as interest rate and foreign exchange exposure.",
+  "parameters": {
+    "year": "2024",
+    "company": "NVIDIA Corporation",
+    "form_type": "10-K",
+    "category": "Part II: Financial Information",
+    "subcategory": "Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations (MD&A)",
+    "items": ["Item 7. Management's Discussion and Analysis of Financial Condition and Results of Operations (MD&A)", "Item 7A. Quantitative and Qualitative Disclosures About Market Risk"]
   }
 }
 
@@ -145,29 +178,56 @@ User Query: """
         
         try:
             full_prompt = enhancement_prompt + user_query
-            response = self.model.generate_content(full_prompt)
-            
-            if response.text:
-                # Clean the response text
-                response_text = response.text.strip()
-                
-                # Try to extract JSON from response
-                json_result = self._extract_json_from_response(response_text)
-                
-                if json_result:
-                    print(f"✓ Query enhanced and parameters extracted")
-                    return json_result
-                else:
-                    print("⚠️ Could not extract valid JSON from response")
-                    print(f"Raw response: {response_text[:200]}...")
-                    return self._fallback_parameter_extraction(user_query)
-            else:
-                raise Exception("Empty response from LLM")
+            json_result = self.extraction_model.generate_validated(full_prompt, self._parse_parameters, usage=usage)
+            print(f"✓ Query enhanced and parameters extracted")
+            return json_result
                 
         except Exception as e:
             print(f"⚠️ Error in query enhancement: {str(e)}")
             return self._fallback_parameter_extraction(user_query)
 
+    def _parse_parameters(self, response_text: str) -> Dict:
+        """
+        Parse and validate the enhanced query and parameters returned by the LLM
+        
+        Raises:
+            ValueError: If no JSON is found or required parameters are missing
+        """
+        if not response_text:
+            raise ValueError("Empty response from LLM")
+        
+        json_result = self._extract_json_from_response(response_text.strip())
+        if not json_result:
+            raise ValueError(f"Could not extract valid JSON from response: {response_text[:200]}...")
+        
+        if not json_result.get('enhanced_query'):
+            raise ValueError("response is missing enhanced_query")
+        json_result['parameters'] = self._validate_parameters(json_result.get('parameters'))
+        return json_result
+
+    def _validate_parameters(self, parameters) -> Dict:
+        """
+        Check that extracted or caller-supplied parameters have what the pipeline reads
+        
+        Raises:
+            ValueError: If parameters is not a dict, lacks company, year or category, or
+                has items that are not a list of strings
+        """
+        if not isinstance(parameters, dict):
+            raise ValueError("parameters must be an object")
+        missing = [key for key in ('company', 'year', 'category') if not parameters.get(key)]
+        if missing:
+            raise ValueError(f"parameters are missing {', '.join(missing)}")
+        
+        # Items are optional; a single name or "all" is accepted for a list
+        items = parameters.get('items') or []
+        if isinstance(items, str):
+            items = [] if items.lower() in ('all', 'general') else [items]
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            raise ValueError(f"invalid items {parameters.get('items')!r}")
+        parameters['items'] = items
+        return parameters
+
     def _extract_json_from_response(self, response_text: str) -> Optional[Dict]:
         """
         Extract JSON from LLM response that may contain extra text
@@ -226,60 +286,13 @@ User Query: """
         """
         print("🔄 Using fallback parameter extraction...")
         
-        # Extract company names (more comprehensive list)
-        company_mapping = {
-            "apple": "Apple Inc.",
-            "microsoft": "Microsoft Corporation", 
-            "google": "Alphabet Inc.",
-            "amazon": "Amazon.com Inc.",
-            "tesla": "Tesla Inc.",
-            "meta": "Meta Platforms Inc.",
-            "facebook": "Meta Platforms Inc.",
-            "nvidia": "NVIDIA Corporation",
-            "intel": "Intel Corporation",
-            "amd": "Advanced Micro Devices Inc."
-        }
-        
-        query_lower = user_query.lower()
-        company = "Unknown Company"
-        
-        for keyword, full_name in company_mapping.items():
-            if keyword in query_lower:
-                company = full_name
-                break
-        
-        # Extract year
-        year_pattern = r'\b(20\d{2})\b'
-        year_match = re.search(year_pattern, user_query)
-        year = year_match.group(1) if year_match else "2020"  # Default to 2020 based on user's data
-        
-        # Determine category based on keywords
-        category = "all"
-        subcategory = "general"
-        
-        if any(word in query_lower for word in ["risk", "factor", "business"]):
-            category = "Part I: Business and Risk Factors"
-            if "risk" in query_lower:
-                subcategory = "Item 1A. Risk Factors"
-            elif "business" in query_lower:
-                subcategory = "Item 1. Business"
-        elif any(word in query_lower for word in ["financial", "revenue", "income", "profit", "earnings"]):
-            category = "Part II: Financial Information"
-            subcategory = "Item 7. Management's Discussion and Analysis"
-        elif any(word in query_lower for word in ["governance", "director", "executive", "compensation"]):
-            category = "Part III: Governance"
-        
-        enhanced_query = f"Provide a detailed analysis of {company}'s {category.lower()} information from their {year} 10-K filing, specifically addressing: {user_query}"
+        # Same local parser as the fast path, used here whatever its confidence
+        parameters = parse_query(user_query).tenk_parameters()
+        enhanced_query = f"Provide a detailed analysis of {parameters['company']}'s {parameters['category'].lower()} information from their {parameters['year']} 10-K filing, specifically addressing: {user_query}"
         
         result = {
             "enhanced_query": enhanced_query,
-            "parameters": {
-                "year": year,
-                "company": company,
-                "form_type": "10-K",
-                "category": category,
-                "subcategory": subcategory
-            }
+            "parameters": parameters
         }
         
         print(f"📋 Fallback extraction completed:")
@@ -368,115 +381,72 @@ When analyzing multiple years, organize your response as follows:
         Find JSON file for the specified company in reports folder
         
         Args:
-            company_name (str): Company name to search for
+            company_name (str): Company name, ticker or CIK
             
         Returns:
             Optional[Path]: Path to the JSON file if found
         """
         print(f"🔍 Searching for JSON file for: {company_name}")
         
-        # List all available JSON files for debugging
-        json_files = list(self.reports_folder.glob("*.json"))
-        print(f"📁 Available JSON files: {[f.stem for f in json_files]}")
-        
-        # Normalize company name for matching
-        normalized_search = self._normalize_company_name(company_name)
+        json_file = get_resolver().find_file(company_name, self.reports_folder, '10k')
+        if json_file:
+            print(f"✓ Found match: {json_file}")
+        else:
+            print(f"❌ No matching file found for: {company_name}")
+        return json_file
+
+    def extract_category_content(self, json_file_path: Path, year: str, category: str,
+                                 items: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Extract content from specific category (or specific items) in JSON file
+        Handles both single years and multi-year comparisons
         
-        # Try different matching strategies
-        for json_file in json_files:
-            file_stem = json_file.stem
-            normalized_file = self._normalize_company_name(file_stem)
-            
-            # Strategy 1: Exact match after normalization
-            if normalized_search == normalized_file:
-                print(f"✓ Found exact match: {json_file}")
-                return json_file
-            
-            # Strategy 2: Check if search term is in filename
-            if normalized_search in normalized_file or normalized_file in normalized_search:
-                print(f"✓ Found partial match: {json_file}")
-                return json_file
+        Args:
+            json_file_path (Path): Path to JSON file
+            year (str): Year(s) to extract data for (can be "2022, 2023" for comparisons)
+            category (str): Category to extract
+            items (List[str]): Item names or codes (e.g. "Item 1A. Risk Factors", "Item 7A") to
+                extract instead of the whole category; a year with none of them falls back to the category
             
-            # Strategy 3: Check core company name (first word)
-            search_core = normalized_search.split()[0] if normalized_search else ""
-            file_core = normalized_file.split()[0] if normalized_file else ""
-            if search_core and file_core and (search_core == file_core or len(search_core) > 3 and search_core in file_core):
-                print(f"✓ Found core name match: {json_file}")
-                return json_file
-        
-        print(f"❌ No matching file found for: {company_name}")
-        return None
-    
-    def _normalize_company_name(self, name: str) -> str:
-        """
-        Normalize company name for matching
+        Returns:
+            Optional[str]: Category content as string
         """
-        if not name:
-            return ""
-        
-        # Convert to lowercase and remove common suffixes/prefixes
-        normalized = name.lower()
-        
-        # Remove common corporate suffixes
-        suffixes = [
-            " inc.", " inc", " corporation", " corp.", " corp", " company", " co.", " co",
-            " ltd.", " ltd", " limited", " llc", " l.l.c.", " plc"
-        ]
-        
-        for suffix in suffixes:
-            if normalized.endswith(suffix):
-                normalized = normalized[:-len(suffix)]
-                break
-        
-        # Remove extra whitespace and special characters
-        normalized = re.sub(r'[^\w\s]', '', normalized)
-        normalized = ' '.join(normalized.split())
-        
-        return normalized
+        sections = self.collect_sections(json_file_path, year, category, items)
+        return self.format_sections(sections, category, items) if sections else None
 
-    def extract_category_content(self, json_file_path: Path, year: str, category: str) -> Optional[str]:
+    def collect_sections(self, json_file_path: Path, year: str, category: str,
+                         items: Optional[List[str]] = None) -> Optional[Dict[str, Dict[str, Dict[str, object]]]]:
         """
-        Extract content from specific category in JSON file
-        Handles both single years and multi-year comparisons
+        Collect the sections a query asks for, by year
+        
+        Sections are read from the section store, which re-ingests the file only when
+        it has changed since the last query, and kept in the shared corpus cache so
+        repeat queries for a company are served from memory.
         
         Args:
             json_file_path (Path): Path to JSON file
             year (str): Year(s) to extract data for (can be "2022, 2023" for comparisons)
             category (str): Category to extract
+            items (List[str]): Item names or codes to extract instead of the whole category
             
         Returns:
-            Optional[str]: Category content as string
+            Optional[Dict]: Year -> part -> item -> content, or None if nothing matched
         """
         try:
-            print(f"📖 Reading JSON file: {json_file_path}")
-            with open(json_file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            store = get_section_store()
+            corpus = get_corpus_cache()
+            company_key = store.sync(json_file_path)
+            available_years = corpus.get(company_key, json_file_path, 'years', lambda: store.years(company_key))
             
-            print(f"🔍 JSON structure - Top level keys: {list(data.keys())}")
+            print(f"📊 Company: {company_key}")
+            print(f"📅 Available years: {available_years}")
             
-            # Navigate through JSON structure - handle the new format
-            if "years_data" in data:
-                company_data = data["years_data"]
-                company_key = data.get("company_name", "Unknown Company")
-            else:
-                # Fallback to old format
-                company_data = None
-                company_key = None
-                for key in data.keys():
-                    if isinstance(data[key], dict):
-                        company_data = data[key]
-                        company_key = key
-                        break
-            
-            if not company_data:
+            if not available_years:
                 print("❌ No company data found in JSON")
                 return None
             
-            print(f"📊 Company: {company_key}")
-            print(f"📅 Available years: {list(company_data.keys())}")
-            
             # Handle multi-year queries (e.g., "2022, 2023")
-            years_to_extract = self._parse_years(year, list(company_data.keys()))
+            years_to_extract = self._parse_years(year, available_years)
             
             if not years_to_extract:
                 print(f"❌ No valid years found from: {year}")
@@ -488,84 +458,37 @@ When analyzing multiple years, organize your response as follows:
             multi_year_data = {}
             
             for target_year in years_to_extract:
-                year_data = company_data.get(target_year)
+                year_data = corpus.get(company_key, json_file_path, ('year', target_year),
+                                       lambda: store.get_year(company_key, target_year))
                 
-                if not year_data:
-                    print(f"⚠️ No data found for year: {target_year}")
+                if items:
+                    item_data = self._select_items(year_data, items)
+                    if item_data:
+                        multi_year_data[target_year] = item_data
+                        continue
+                    print(f"⚠️ Items {items} not found in year {target_year}, using category '{category}'")
+                
+                if category == "all":
+                    multi_year_data[target_year] = year_data
                     continue
                 
-                # Handle new JSON format with parts/sections structure
-                if "content" in year_data and "parts" in year_data["content"]:
-                    parts_data = year_data["content"]["parts"]
-                    
-                    if category == "all":
-                        # Convert parts format to categories format
-                        categories_data = {}
-                        for part in parts_data:
-                            part_name = part.get("part_name", "Unknown Part")
-                            categories_data[part_name] = {}
-                            
-                            for section in part.get("sections", []):
-                                section_category = section.get("category", "Unknown Category")
-                                section_content = section.get("content", "")
-                                categories_data[part_name][section_category] = section_content
-                        
-                        multi_year_data[target_year] = categories_data
-                    else:
-                        # Find matching category
-                        found_category = False
-                        for part in parts_data:
-                            part_name = part.get("part_name", "")
-                            if category in part_name or part_name in category:
-                                part_content = {}
-                                for section in part.get("sections", []):
-                                    section_category = section.get("category", "Unknown Category")
-                                    section_content = section.get("content", "")
-                                    part_content[section_category] = section_content
-                                
-                                multi_year_data[target_year] = {category: part_content}
-                                found_category = True
-                                break
-                        
-                        if not found_category:
-                            print(f"⚠️ Category '{category}' not found in year {target_year}")
-                            available_parts = [part.get("part_name", "Unknown") for part in parts_data]
-                            print(f"Available parts for {target_year}: {available_parts}")
+                # Exact part name first, then the looser containment match the extraction prompt relies on,
+                # then the part number alone ("Part III: ..." under any title)
+                parts = list(year_data)
+                part_name = next((part for part in parts if part == category), None) or next(
+                    (part for part in parts if category in part or part in category), None) or next(
+                    (part for part in parts if part.split(':')[0].strip() == category.split(':')[0].strip()), None)
                 
-                # Fallback to old format if CATEGORIES exists
-                elif "CATEGORIES" in year_data:
-                    categories_data = year_data["CATEGORIES"]
-                    
-                    if category == "all":
-                        multi_year_data[target_year] = categories_data
-                    else:
-                        if category in categories_data:
-                            multi_year_data[target_year] = {category: categories_data[category]}
-                        else:
-                            print(f"⚠️ Category '{category}' not found in year {target_year}")
-                            print(f"Available categories for {target_year}: {list(categories_data.keys())}")
+                if part_name:
+                    multi_year_data[target_year] = {category: year_data[part_name]}
                 else:
-                    print(f"⚠️ No valid content structure found for year: {target_year}")
-                    print(f"Available keys in year data: {list(year_data.keys()) if year_data else 'None'}")
+                    print(f"⚠️ Category '{category}' not found in year {target_year}")
+                    print(f"Available parts for {target_year}: {parts}")
             
             if not multi_year_data:
                 print(f"❌ No data extracted for any requested years")
                 return None
-            
-            # Format the result
-            if len(multi_year_data) == 1:
-                # Single year result
-                year_key = list(multi_year_data.keys())[0]
-                return json.dumps(multi_year_data[year_key], indent=2)
-            else:
-                # Multi-year comparison result
-                comparison_data = {
-                    "comparison_type": "multi_year_analysis",
-                    "years_compared": list(multi_year_data.keys()),
-                    "category": category,
-                    "data": multi_year_data
-                }
-                return json.dumps(comparison_data, indent=2)
+            return multi_year_data
             
         except json.JSONDecodeError as e:
             print(f"❌ JSON parsing error: {str(e)}")
@@ -574,6 +497,69 @@ When analyzing multiple years, organize your response as follows:
             print(f"❌ Error extracting category content: {str(e)}")
             return None
 
+    def format_sections(self, sections: Dict[str, Dict[str, Dict[str, object]]], category: str,
+                        items: Optional[List[str]] = None, summarized: bool = False) -> str:
+        """
+        Format collected sections as the JSON content of the analysis prompt
+        
+        Args:
+            sections (Dict): Year -> part -> item -> content from collect_sections
+            category (str): Requested category
+            items (List[str]): Requested items, if any
+            summarized (bool): The contents are per-slice summaries (SliceSummarizer), not filing text
+            
+        Returns:
+            str: One year's parts, or a multi-year comparison document
+        """
+        summary_note = "summaries written from the full text of each year's sections"
+        if len(sections) == 1:
+            # Single year result
+            year_data = next(iter(sections.values()))
+            return json.dumps({"content_type": summary_note, "data": year_data} if summarized else year_data,
+                              indent=2)
+        
+        # Multi-year comparison result
+        comparison_data = {
+            "comparison_type": "multi_year_analysis",
+            "years_compared": list(sections.keys()),
+            "category": category,
+            "data": sections
+        }
+        if items:
+            comparison_data["items"] = items
+        if summarized:
+            comparison_data["content_type"] = summary_note
+        return json.dumps(comparison_data, indent=2)
+
+    def _select_items(self, year_data: Dict[str, Dict[str, str]], items: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        Pick individual items out of a year's parts
+        
+        Items are matched by item code, so "Item 7A", "7A" and the full item name all
+        select "Item 7A. Quantitative and Qualitative Disclosures About Market Risk".
+        
+        Args:
+            year_data (Dict): Part -> item -> content for one year
+            items (List[str]): Requested items, most relevant first
+            
+        Returns:
+            Dict[str, Dict[str, str]]: Part -> item -> content for the items found, in the order requested
+        """
+        wanted = [self._item_code(item) for item in items]
+        found = {}
+        for code in dict.fromkeys(code for code in wanted if code):
+            for part_name, part_items in year_data.items():
+                for item_name, content in part_items.items():
+                    if self._item_code(item_name) == code:
+                        found.setdefault(part_name, {})[item_name] = content
+        return found
+
+    @staticmethod
+    def _item_code(item: str) -> Optional[str]:
+        """Item code of an item name: "Item 1A. Risk Factors" -> "1A" """
+        match = re.match(r'\s*(?:item\s+)?(\d{1,2}[a-c]?)\b', item, re.IGNORECASE)
+        return match.group(1).upper() if match else None
+
     def _parse_years(self, year_string: str, available_years: List[str]) -> List[str]:
         """
         Parse year string and return list of valid years
@@ -614,32 +600,32 @@ When analyzing multiple years, organize your response as follows:
         print(f"⚠️ Year {clean_year} not available in data")
         return []
 
-    def analyze_10k_content(self, enhanced_query: str, category_content: str) -> str:
+    def analyze_10k_content(self, enhanced_query: str, category_content: str, usage: Optional[Dict] = None) -> str:
         """
         Analyze 10-K content using LLM with system prompt
         
         Args:
             enhanced_query (str): Enhanced user query
             category_content (str): Content from specific category
+            usage (Dict): Optional token usage totals to update
             
         Returns:
             str: Analysis results
-        """
-        try:
-            system_prompt = self.get_10k_analysis_system_prompt()
-            full_prompt = system_prompt + category_content + f"\n\n## USER QUERY TO ANALYZE:\n{enhanced_query}"
             
-            print("🔍 Analyzing content with Gemini...")
-            response = self.model.generate_content(full_prompt)
-            
-            if response.text:
-                print("✓ Analysis completed")
-                return response.text
-            else:
-                return "Error: Empty response from analysis"
-                
-        except Exception as e:
-            return f"Error during analysis: {str(e)}"
+        Raises:
+            ValueError: If the model returns an empty response (API errors propagate as well)
+        """
+        system_prompt = self.get_10k_analysis_system_prompt()
+        full_prompt = system_prompt + category_content + f"\n\n## USER QUERY TO ANALYZE:\n{enhanced_query}"
+        
+        print("🔍 Analyzing content with Gemini...")
+        response = self.model.generate_content(full_prompt)
+        add_token_usage(usage, response)
+        
+        if not response.text:
+            raise ValueError("Empty response from analysis")
+        print("✓ Analysis completed")
+        return response.text
 
     def save_analysis_result(self, result: str, query: str) -> str:
         """
@@ -675,23 +661,60 @@ When analyzing multiple years, organize your response as follows:
             print(f"Error saving result: {str(e)}")
             return ""
 
-    def process_10k_query(self, user_query: str) -> Dict:
+    def _supplied_parameters(self, query: str, parameters: Optional[Dict]) -> Optional[Dict]:
+        """
+        Use parameters supplied by the caller in place of the extraction call
+        
+        Args:
+            query (str): Query, already enhanced by the caller
+            parameters (Dict): Supplied parameters, or None
+            
+        Returns:
+            Optional[Dict]: Enhanced query and parameters, or None to extract from the query
+        """
+        if parameters is None:
+            return None
+        try:
+            params = self._validate_parameters(dict(parameters))
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ Ignoring supplied parameters ({e}), extracting from the query")
+            return None
+        print("✓ Using supplied parameters, skipping extraction")
+        return {"enhanced_query": query, "parameters": {"form_type": "10-K", **params}}
+
+    def analyze_query(self, query: str, save_output: bool = False,
+                      parameters: Optional[Dict] = None) -> ToolResult:
         """
         Complete 10-K query processing pipeline
         
         Args:
-            user_query (str): User's original query
+            query (str): User's original query
+            save_output (bool): Also write the analysis to a query_answer_*.txt file
+            parameters (Dict): Parameters already extracted by the caller (year, company,
+                category, subcategory); skips the extraction call when valid
             
         Returns:
-            Dict: Processing results and file paths
+            ToolResult: Analysis content with parameters, timings and token usage
         """
+        start_time = time.perf_counter()
+        timings = {}
+        usage = {}
+        
+        def failure(error: str, **metadata) -> ToolResult:
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult.failure('sec_tools', query, error, metadata=metadata,
+                                      timings=timings, token_usage=usage)
+        
         try:
-            print(f"🚀 Processing 10-K query: {user_query}")
+            print(f"🚀 Processing 10-K query: {query}")
             
-            # Step 1: Enhance query and extract parameters
-            enhanced_data = self.enhance_query_and_extract_parameters(user_query)
+            # Step 1: Enhance query and extract parameters, unless the caller already did
+            enhanced_data = self._supplied_parameters(query, parameters)
+            if not enhanced_data:
+                enhanced_data = self.enhance_query_and_extract_parameters(query, usage=usage)
             enhanced_query = enhanced_data["enhanced_query"]
             params = enhanced_data["parameters"]
+            timings['extraction'] = time.perf_counter() - start_time
             
             print(f"📊 Extracted parameters:")
             for key, value in params.items():
@@ -700,49 +723,106 @@ When analyzing multiple years, organize your response as follows:
             # Step 2: Find company JSON file
             json_file = self.find_company_json_file(params["company"])
             if not json_file:
-                return {
-                    "success": False,
-                    "error": f"No JSON file found for company: {params['company']}",
-                    "available_files": [f.stem for f in self.reports_folder.glob("*.json")]
-                }
+                return failure(
+                    f"No JSON file found for company: {params['company']}",
+                    parameters=params,
+                    available_files=[f.stem for f in self.reports_folder.glob("*.json")]
+                )
             
             print(f"📁 Found company file: {json_file}")
             
-            # Step 3: Extract category content
-            category_content = self.extract_category_content(
+            # Step 3: Extract category content, keeping the chunks relevant to the query within the token budget
+            stage_start = time.perf_counter()
+            sections = self.collect_sections(
                 json_file, 
                 params["year"], 
-                params["category"]
+                params["category"],
+                params.get("items")
             )
             
-            if not category_content:
-                return {
-                    "success": False,
-                    "error": f"No content found for category: {params['category']} in year: {params['year']}"
-                }
-            
-            print(f"📋 Extracted content from category: {params['category']}")
-            
-            # Step 4: Analyze content with LLM
-            analysis_result = self.analyze_10k_content(enhanced_query, category_content)
-            
-            # Step 5: Save result to file
-            output_file = self.save_analysis_result(analysis_result, user_query)
-            
-            return {
-                "success": True,
-                "enhanced_query": enhanced_query,
-                "parameters": params,
-                "json_file_used": str(json_file),
-                "analysis_result": analysis_result,
-                "output_file": output_file
-            }
+            if not sections:
+                timings['content_extraction'] = time.perf_counter() - stage_start
+                return failure(
+                    f"No content found for category: {params['category']} in year: {params['year']}",
+                    parameters=params
+                )
+            
+            print(f"📋 Extracted content from {', '.join(params.get('items') or []) or 'category: ' + params['category']}")
+            packing = map_stats = None
+            if self.summarizer.applies(sections):
+                # Map: summarize every (year, item) slice in parallel; the analysis call below is the reduce
+                timings['content_extraction'] = time.perf_counter() - stage_start
+                stage_start = time.perf_counter()
+                summaries, map_stats = self.summarizer.summarize(sections, params["company"], enhanced_query,
+                                                                 usage=usage)
+                category_content = self.format_sections(summaries, params["category"], params.get("items"),
+                                                        summarized=True)
+                timings['map'] = time.perf_counter() - stage_start
+                print(f"🗺️ Summarized {map_stats.slices} slices ({map_stats.cached} cached) in "
+                      f"{map_stats.seconds:.1f}s: ~{map_stats.tokens_in:,} → ~{map_stats.tokens_out:,} tokens")
+            else:
+                sections, packing = pack_sections(sections, enhanced_query)
+                category_content = self.format_sections(sections, params["category"], params.get("items"))
+                timings['content_extraction'] = time.perf_counter() - stage_start
+                if packing.packed:
+                    print(f"📦 Packed {packing.chunks_kept}/{packing.chunks} chunks: "
+                          f"~{packing.tokens_before:,} → ~{packing.tokens_after:,} tokens (budget {packing.budget:,})")
+            
+            # Step 4: Analyze content with LLM (the reduce step when slices were summarized)
+            stage_start = time.perf_counter()
+            try:
+                analysis_result = self.analyze_10k_content(enhanced_query, category_content, usage=usage)
+            except Exception as e:
+                timings['analysis'] = time.perf_counter() - stage_start
+                return failure(f"Analysis error: {str(e)}", enhanced_query=enhanced_query, parameters=params)
+            timings['analysis'] = time.perf_counter() - stage_start
+            
+            # Step 5: Optionally save result to file
+            output_file = self.save_analysis_result(analysis_result, query) if save_output else None
+            
+            timings['total'] = time.perf_counter() - start_time
+            return ToolResult(
+                tool='sec_tools',
+                query=query,
+                success=True,
+                content=analysis_result,
+                metadata={
+                    "enhanced_query": enhanced_query,
+                    "parameters": params,
+                    "json_file_used": str(json_file),
+                    **({"context_packing": packing.to_dict()} if packing else {}),
+                    **({"map_reduce": map_stats.to_dict()} if map_stats else {})
+                },
+                timings=timings,
+                token_usage=usage,
+                output_file=output_file
+            )
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": f"Processing error: {str(e)}"
-            }
+            return failure(f"Processing error: {str(e)}")
+
+    def process_10k_query(self, user_query: str) -> Dict:
+        """
+        Complete 10-K query processing pipeline, saving the result to a file
+        
+        Args:
+            user_query (str): User's original query
+            
+        Returns:
+            Dict: Processing results and file paths
+        """
+        result = self.analyze_query(user_query, save_output=True)
+        if not result.success:
+            return {"success": False, "error": result.error, **result.metadata}
+        
+        return {
+            "success": True,
+            "enhanced_query": result.metadata["enhanced_query"],
+            "parameters": result.metadata["parameters"],
+            "json_file_used": result.metadata["json_file_used"],
+            "analysis_result": result.content,
+            "output_file": result.output_file
+        }
 
 
     def test_setup(self) -> Dict:
@@ -828,6 +908,7 @@ def main():
     parser.add_argument('-k', '--api-key', help='Google Gemini API key')
     parser.add_argument('-r', '--reports', default='gemini_10k', help='Reports folder path')
     parser.add_argument('-t', '--test', action='store_true', help='Run setup test')
+    parser.add_argument('--rpc', action='store_true', help='Serve JSON-RPC "analyze" requests on stdin/stdout')
     
     args = parser.parse_args()
     
@@ -840,6 +921,10 @@ def main():
             tools.test_setup()
             return
         
+        if args.rpc:
+            serve_json_rpc('sec_tools', tools.analyze_query)
+            return
+        
         # Check if query provided
         if not args.query:
             parser.error("Please provide a query or use --test to test setup")
@@ -868,6 +953,7 @@ if __name__ == "__main__":
 # Command line usage:
 python sec_tools.py "What are Apple's main risk factors in 2023?"
 python sec_tools.py "Tell me about Microsoft's financial performance" -r "path/to/reports"
+echo '{"jsonrpc": "2.0", "id": 1, "method": "analyze", "params": {"query": "Apple risk factors 2023"}}' | python sec_tools.py --rpc
 
 # Module usage:
 from sec_tools import SECFormsTools
@@ -875,4 +961,7 @@ from sec_tools import SECFormsTools
 tools = SECFormsTools()
 result = tools.process_10k_query("What are Tesla's business segments?")
 print(result["analysis_result"])
+
+result = tools.analyze_query("What are Tesla's business segments?")  # ToolResult, no file written
+print(result.content, result.timings, result.token_usage)
 """
\ No newline at end of file
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - 10-K Section Store
+SQLite index of 10-K section text keyed by (company, year, part, item), ingested from the
+gemini_10k JSON files so a query reads the sections it needs instead of parsing the whole file
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from company_resolver import get_resolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent / 'cache' / 'sections.db'
+
+# (year, part, item, content, is_json)
+SectionRow = Tuple[str, str, str, str, int]
+
+
+def iter_sections(data: Dict) -> Iterator[SectionRow]:
+    """
+    Flatten a 10-K JSON document into section rows
+
+    Handles the current {"years_data": {year: {"content": {"parts": [...]}}}} layout and
+    the legacy {company: {year: {"CATEGORIES": {category: ...}}}} layout. Legacy values
+    that are not plain text are kept as JSON so they read back unchanged.
+
+    Args:
+        data (Dict): Parsed 10-K JSON file
+
+    Yields:
+        SectionRow: (year, part, item, content, is_json)
+    """
+    if 'years_data' in data:
+        years_data = data['years_data']
+    else:
+        years_data = next((value for value in data.values() if isinstance(value, dict)), {})
+
+    for year, year_data in years_data.items():
+        if not isinstance(year_data, dict):
+            continue
+        content = year_data.get('content')
+        if isinstance(content, dict) and 'parts' in content:
+            for part in content['parts']:
+                part_name = part.get('part_name', 'Unknown Part')
+                for section in part.get('sections', []):
+                    text = section.get('content', '')
+                    yield (year, part_name, section.get('category', 'Unknown Category'),
+                           text if isinstance(text, str) else json.dumps(text), 0 if isinstance(text, str) else 1)
+        elif 'CATEGORIES' in year_data:
+            for category, value in year_data['CATEGORIES'].items():
+                items = value.items() if isinstance(value, dict) else [(category, value)]
+                for item, text in items:
+                    yield (year, category, item,
+                           text if isinstance(text, str) else json.dumps(text), 0 if isinstance(text, str) else 1)
+
+
+class SectionStore:
+    """Thread-safe SQLite store of 10-K sections, refreshed when a source file changes"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Open (and create if needed) the store
+
+        Args:
+            db_path (str): SQLite file (default SECTION_STORE_PATH or cache/sections.db)
+        """
+        self.db_path = Path(db_path or os.getenv('SECTION_STORE_PATH') or DEFAULT_DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "company TEXT PRIMARY KEY, company_name TEXT, path TEXT NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, ingested_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sections ("
+                "company TEXT NOT NULL, year TEXT NOT NULL, part TEXT NOT NULL, item TEXT NOT NULL, "
+                "position INTEGER NOT NULL, content TEXT NOT NULL, is_json INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (company, year, part, item))"
+            )
+
+    @staticmethod
+    def company_key(json_file: Path) -> str:
+        """Store key for a 10-K file: the resolver's company key, else the file stem"""
+        return get_resolver().key_for_file(json_file, '10k')
+
+    def sync(self, json_file: Path) -> str:
+        """
+        Make sure the store holds the current contents of a 10-K file
+
+        Costs a stat and a primary-key lookup when the file is unchanged.
+
+        Args:
+            json_file (Path): gemini_10k JSON file
+
+        Returns:
+            str: Company key to read the file's sections with
+        """
+        json_file = Path(json_file)
+        company = self.company_key(json_file)
+        stat = json_file.stat()
+        with self._lock:
+            row = self._db.execute("SELECT mtime_ns, size FROM sources WHERE company = ?", (company,)).fetchone()
+        if row != (stat.st_mtime_ns, stat.st_size):
+            self.ingest_file(json_file, company)
+        return company
+
+    def ingest_file(self, json_file: Path, company: Optional[str] = None) -> int:
+        """
+        Replace a company's sections with the contents of a 10-K file
+
+        Args:
+            json_file (Path): gemini_10k JSON file
+            company (str): Company key (default from the file name)
+
+        Returns:
+            int: Number of sections stored
+        """
+        json_file = Path(json_file)
+        company = company or self.company_key(json_file)
+        stat = json_file.stat()
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rows = [(company, year, part, item, position, content, is_json)
+                for position, (year, part, item, content, is_json) in enumerate(iter_sections(data))]
+
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sections WHERE company = ?", (company,))
+            # A repeated item keeps its first position and its last content, as a dict would
+            self._db.executemany(
+                "INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (company, year, part, item) "
+                "DO UPDATE SET content = excluded.content, is_json = excluded.is_json", rows
+            )
+            self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                             (company, data.get('company_name'), str(json_file), stat.st_mtime_ns,
+                              stat.st_size, time.time()))
+        logger.info(f"Ingested {len(rows)} sections for {company} from {json_file}")
+        return len(rows)
+
+    def ingest_folder(self, folder) -> Dict[str, int]:
+        """
+        Ingest every changed 10-K file in a folder
+
+        Args:
+            folder: Folder of gemini_10k JSON files
+
+        Returns:
+            Dict[str, int]: Sections stored per re-ingested company
+        """
+        ingested = {}
+        for json_file in sorted(Path(folder).glob('*.json')):
+            company = self.company_key(json_file)
+            before = self._source_version(company)
+            self.sync(json_file)
+            if self._source_version(company) != before:
+                ingested[company] = self.count(company)
+        return ingested
+
+    def years(self, company: str) -> List[str]:
+        """Years with at least one section, in filing order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT year FROM sections WHERE company = ? GROUP BY year ORDER BY MIN(position)", (company,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def parts(self, company: str, year: str) -> List[str]:
+        """Part (legacy: category) names for a year, in filing order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT part FROM sections WHERE company = ? AND year = ? GROUP BY part ORDER BY MIN(position)",
+                (company, year)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_section(self, company: str, year: str, part: str, item: str) -> Optional[str]:
+        """Text of one section, or None if the filing has no such item"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content FROM sections WHERE company = ? AND year = ? AND part = ? AND item = ?",
+                (company, year, part, item)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_part(self, company: str, year: str, part: str) -> Dict[str, object]:
+        """Item -> content for one part of a year's filing, in filing order"""
+        return self.get_year(company, year, part).get(part, {})
+
+    def get_year(self, company: str, year: str, part: Optional[str] = None) -> Dict[str, Dict[str, object]]:
+        """
+        Part -> item -> content for a year's filing
+
+        Args:
+            company (str): Company key from sync()
+            year (str): Filing year
+            part (str): Only this part (default all parts)
+
+        Returns:
+            Dict[str, Dict[str, object]]: Sections in filing order
+        """
+        query = "SELECT part, item, content, is_json FROM sections WHERE company = ? AND year = ?"
+        args = [company, year]
+        if part is not None:
+            query += " AND part = ?"
+            args.append(part)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY position", args).fetchall()
+
+        result: Dict[str, Dict[str, object]] = {}
+        for part_name, item, content, is_json in rows:
+            result.setdefault(part_name, {})[item] = json.loads(content) if is_json else content
+        return result
+
+    def count(self, company: str) -> int:
+        """Number of sections stored for a company"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sections WHERE company = ?", (company,)).fetchone()[0]
+
+    def _source_version(self, company: str) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            return self._db.execute("SELECT mtime_ns, size FROM sources WHERE company = ?", (company,)).fetchone()
+
+
+_store: Optional[SectionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_section_store() -> SectionStore:
+    """Return the process-wide section store, opening it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SectionStore()
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest 10-K JSON files into the section store')
+    parser.add_argument('--folder', default='gemini_10k', help='Folder of 10-K JSON files')
+    parser.add_argument('--db', help='SQLite file (default SECTION_STORE_PATH or cache/sections.db)')
+    parser.add_argument('--force', action='store_true', help='Re-ingest files even if unchanged')
+    args = parser.parse_args()
+
+    store = SectionStore(args.db)
+    start_time = time.perf_counter()
+    if args.force:
+        ingested = {store.company_key(path): store.ingest_file(path) for path in sorted(Path(args.folder).glob('*.json'))}
+    else:
+        ingested = store.ingest_folder(args.folder)
+
+    for company, sections in ingested.items():
+        print(f"✅ {company}: {sections} sections")
+    print(f"📦 {len(ingested)} file(s) ingested into {store.db_path} in {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Semantic Passage Index
+Dense retrieval over the same paragraph passages as the full-text index, using TF-IDF
+vectors reduced with a truncated SVD (latent semantic indexing) computed in NumPy. Vectors
+are stored as float16 or int8 in one memory-mapped file, grouped into inverted lists so a
+query scores a few thousand passages instead of all of them. Runs on CPU with no network.
+"""
+
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from company_resolver import get_resolver
+from filing_corpus import FORMS, Source, iter_passages, iter_sources, normalize_form
+from index_refresher import IndexRefresher
+from search_index import PERIODS, STALE_CHECK_INTERVAL, SearchHit, tokenize
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+MAGIC = b'SECLSI\x00\x00'
+DEFAULT_INDEX_PATH = Path(__file__).parent / 'cache' / 'semantic_index.bin'
+
+DEFAULT_DIMENSIONS = 256
+MAX_FEATURES = 60000      # vocabulary size (most frequent terms seen in at least MIN_DF passages)
+MIN_DF = 2
+EXACT_SCAN_LIMIT = 32768  # filtered searches over at most this many passages skip the inverted lists
+DEFAULT_PROBES = 16       # inverted lists scored per query
+BLOCK_NNZ = 200000        # non-zeros per block in the sparse products
+
+
+def _sparse_dot(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray) -> np.ndarray:
+    """Multiply a CSR matrix by a dense matrix, a block of rows at a time"""
+    rows = len(indptr) - 1
+    result = np.zeros((rows, dense.shape[1]), dtype=np.float32)
+    row = 0
+    while row < rows:
+        last = int(np.searchsorted(indptr, indptr[row] + BLOCK_NNZ, side='right')) - 1
+        last = min(max(last, row + 1), rows)
+        start, end = indptr[row], indptr[last]
+        if end > start:
+            products = data[start:end, None] * dense[indices[start:end]]
+            # reduceat needs strictly increasing starts, so empty rows are left at zero
+            nonempty = np.flatnonzero(np.diff(indptr[row:last + 1]) > 0)
+            result[row + nonempty] = np.add.reduceat(products, indptr[row + nonempty] - start, axis=0)
+        row = last
+    return result
+
+
+def _transpose(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, columns: int):
+    """CSR of the transposed matrix"""
+    order = np.argsort(indices, kind='stable')
+    row_ids = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    transposed_indptr = np.zeros(columns + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=columns), out=transposed_indptr[1:])
+    return transposed_indptr, row_ids[order], data[order]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(vectors: np.ndarray, lists: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids of a cosine k-means over (a sample of) the vectors"""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), lists * 40), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.linalg.norm(sums, axis=1) == 0
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class SemanticIndex:
+    """
+    Read-only LSI index backed by a memory-mapped file
+
+    Same file layout as the full-text index (magic, header length, JSON header, 8-byte
+    aligned arrays). Passages are stored ordered by inverted list; each list holds the
+    passages closest to one k-means centroid of the reduced vectors.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open an index file
+
+        Args:
+            path (str): Index file (default SEMANTIC_INDEX_PATH or cache/semantic_index.bin)
+
+        Raises:
+            ValueError: If the file is not a semantic index of this version
+        """
+        self.path = Path(path or os.getenv('SEMANTIC_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        with open(self.path, 'rb') as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapped[:8] != MAGIC:
+            raise ValueError(f"Not a semantic index: {self.path}")
+        header_length = int.from_bytes(self._mapped[8:16], 'little')
+        self.header = json.loads(self._mapped[16:16 + header_length])
+        if self.header.get('version') != INDEX_VERSION or self.header.get('byteorder') != sys.byteorder:
+            raise ValueError(f"Semantic index {self.path} was built by another version or platform")
+
+        self._arrays = {
+            name: np.frombuffer(self._mapped, dtype=np.dtype(dtype), count=int(np.prod(shape)), offset=offset).reshape(shape)
+            for name, (offset, dtype, shape) in self.header['arrays'].items()
+        }
+        self.companies: List[str] = self.header['companies']
+        self.sections: List[str] = self.header['sections']
+        self.n_docs: int = self.header['n_docs']
+        self.dimensions: int = self.header['dimensions']
+        self._vocabulary = {term: column for column, term in enumerate(self.header['vocabulary'])}
+
+    @classmethod
+    def build(cls, path: Optional[str] = None, sources: Optional[Iterable[Source]] = None,
+              dimensions: int = DEFAULT_DIMENSIONS, dtype: str = 'float16') -> 'SemanticIndex':
+        """
+        Compute passage vectors for the corpus and write the index file
+
+        Args:
+            path (str): Index file (default SEMANTIC_INDEX_PATH or cache/semantic_index.bin)
+            sources (Iterable[Source]): Files to index (default iter_sources())
+            dimensions (int): Number of SVD components kept
+            dtype (str): Stored vector type, "float16" or "int8" (per-row scaled)
+
+        Returns:
+            SemanticIndex: The new index, opened
+        """
+        if dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported vector type: {dtype}")
+        path = Path(path or os.getenv('SEMANTIC_INDEX_PATH') or DEFAULT_INDEX_PATH)
+        start_time = time.perf_counter()
+        sources = sorted(sources if sources is not None else iter_sources(),
+                         key=lambda source: (source.company, FORMS.index(source.form), str(source.path)))
+
+        companies: Dict[str, int] = {}
+        sections: Dict[str, int] = {}
+        metadata = {'doc_company': [], 'doc_form': [], 'doc_year': [], 'doc_period': [], 'doc_section': [],
+                    'doc_source': []}
+        texts: List[bytes] = []
+        documents: List[Counter] = []
+        document_frequency: Counter = Counter()
+        versions = []
+        for source in sources:
+            stat = source.path.stat()
+            versions.append([str(source.path), stat.st_mtime_ns, stat.st_size])
+            for passage in iter_passages(source):
+                terms = Counter(tokenize(f"{passage.section}\n{passage.text}"))
+                documents.append(terms)
+                document_frequency.update(terms.keys())
+                metadata['doc_company'].append(companies.setdefault(passage.company, len(companies)))
+                metadata['doc_form'].append(FORMS.index(passage.form))
+                metadata['doc_year'].append(int(passage.year) if passage.year.isdigit() else 0)
+                metadata['doc_period'].append(PERIODS.index(passage.period) if passage.period in PERIODS else 0)
+                metadata['doc_section'].append(sections.setdefault(passage.section, len(sections)))
+                metadata['doc_source'].append(len(versions) - 1)
+                texts.append(passage.text.encode('utf-8'))
+        n_docs = len(documents)
+        if n_docs < 2:
+            raise ValueError("Not enough passages to build a semantic index")
+
+        # TF-IDF matrix: sublinear term frequency, smoothed idf, unit-length rows
+        vocabulary = sorted(term for term, df in document_frequency.most_common(MAX_FEATURES) if df >= MIN_DF)
+        columns = {term: column for column, term in enumerate(vocabulary)}
+        idf = np.array([math.log((1 + n_docs) / (1 + document_frequency[term])) + 1 for term in vocabulary],
+                       dtype=np.float32)
+        indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        indices, data = [], []
+        for row, terms in enumerate(documents):
+            kept = [(columns[term], count) for term, count in terms.items() if term in columns]
+            indices.extend(column for column, _ in kept)
+            data.extend(1 + math.log(count) for _, count in kept)
+            indptr[row + 1] = len(indices)
+        del documents
+        indices = np.array(indices, dtype=np.int32)
+        data = np.array(data, dtype=np.float32) * idf[indices]
+        row_lengths = np.diff(indptr)
+        row_norms = np.sqrt(np.bincount(np.repeat(np.arange(n_docs), row_lengths), weights=data ** 2,
+                                        minlength=n_docs))
+        data /= np.repeat(np.maximum(row_norms, 1e-12), row_lengths).astype(np.float32)
+
+        components = cls._truncated_svd(indptr, indices, data, len(vocabulary), min(dimensions, len(vocabulary) - 1))
+        vectors = _normalize_rows(_sparse_dot(indptr, indices, data, components.T))
+
+        # Inverted lists: passages grouped by nearest centroid
+        lists = max(1, min(int(2 * math.sqrt(n_docs)), n_docs // 40 or 1))
+        centroids = _spherical_kmeans(vectors, lists)
+        assignment = np.concatenate([np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+                                     for start in range(0, n_docs, 65536)])
+        order = np.argsort(assignment, kind='stable')
+        list_starts = np.zeros(lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=lists), out=list_starts[1:])
+
+        vectors = vectors[order]
+        if dtype == 'int8':
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            stored = {'vectors': np.round(vectors / scales[:, None]).astype(np.int8), 'scales': scales.astype(np.float32)}
+        else:
+            stored = {'vectors': vectors.astype(np.float16)}
+        text_lengths = np.array([len(texts[doc]) for doc in order], dtype=np.int64)
+        text_starts = np.concatenate([[0], np.cumsum(text_lengths)[:-1]]).astype(np.int64)
+        arrays = {
+            **stored,
+            'components': components.T.astype(np.float32).copy(),   # vocabulary x dimensions
+            'idf': idf,
+            'centroids': centroids.astype(np.float32),
+            'list_starts': list_starts,
+            **{name: np.array(values, dtype=np.uint32)[order] for name, values in metadata.items()},
+            'text_start': text_starts,
+            'text_length': text_lengths,
+            'text': np.frombuffer(b''.join(texts[doc] for doc in order), dtype=np.uint8)
+        }
+        header = {
+            'version': INDEX_VERSION,
+            'byteorder': sys.byteorder,
+            'built_at': time.time(),
+            'n_docs': n_docs,
+            'dimensions': int(components.shape[0]),
+            'dtype': dtype,
+            'companies': list(companies),
+            'sections': list(sections),
+            'vocabulary': vocabulary,
+            'sources': versions
+        }
+        cls._write(path, header, arrays)
+        logger.info(f"Built semantic index of {n_docs} passages ({components.shape[0]} dimensions, "
+                    f"{lists} lists) in {time.perf_counter() - start_time:.1f}s")
+        return cls(path)
+
+    @staticmethod
+    def _truncated_svd(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, columns: int,
+                       dimensions: int, oversample: int = 16, power_iterations: int = 3) -> np.ndarray:
+        """
+        Top right singular vectors of a sparse matrix by randomized SVD (Halko et al.)
+
+        Returns:
+            np.ndarray: dimensions x columns matrix with orthonormal rows
+        """
+        rng = np.random.default_rng(0)
+        transposed = _transpose(indptr, indices, data, columns)
+        width = min(dimensions + oversample, columns)
+        basis, _ = np.linalg.qr(_sparse_dot(indptr, indices, data,
+                                            rng.standard_normal((columns, width)).astype(np.float32)))
+        for _ in range(power_iterations):
+            column_basis, _ = np.linalg.qr(_sparse_dot(*transposed, basis))
+            basis, _ = np.linalg.qr(_sparse_dot(indptr, indices, data, column_basis))
+        projected = _sparse_dot(*transposed, basis).T     # basis^T X, width x columns
+        _, _, right = np.linalg.svd(projected, full_matrices=False)
+        return right[:dimensions]
+
+    @staticmethod
+    def _write(path: Path, header: Dict, arrays: Dict[str, np.ndarray]):
+        """Write header and arrays to a temporary file and swap it in atomically"""
+        layout, offset = {}, 0
+        for name, values in arrays.items():
+            layout[name] = [offset, values.dtype.str, list(values.shape)]
+            offset += -(-values.nbytes // 8) * 8
+
+        # The header holds absolute offsets, so grow the data start until the header fits before it
+        data_start = 16
+        while True:
+            absolute = {name: [data_start + entry[0], *entry[1:]] for name, entry in layout.items()}
+            header_bytes = json.dumps({**header, 'arrays': absolute}, separators=(',', ':')).encode('utf-8')
+            if 16 + len(header_bytes) <= data_start:
+                break
+            data_start = -(-(16 + len(header_bytes)) // 8) * 8
+        header_bytes += b' ' * (data_start - 16 - len(header_bytes))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC + len(header_bytes).to_bytes(8, 'little') + header_bytes)
+                for values in arrays.values():
+                    f.write(np.ascontiguousarray(values).tobytes())
+                    f.write(b'\0' * (-f.tell() % 8))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def is_stale(self) -> bool:
+        """True if a source file was added, removed or changed since the index was built"""
+        current = []
+        for source in iter_sources():
+            stat = source.path.stat()
+            current.append([str(source.path), stat.st_mtime_ns, stat.st_size])
+        return sorted(current) != sorted(self.header['sources'])
+
+    def embed(self, queries: Sequence[str]) -> np.ndarray:
+        """Unit-length vectors of query texts (rows of zeros for queries with no known terms)"""
+        components, idf = self._arrays['components'], self._arrays['idf']
+        result = np.zeros((len(queries), self.dimensions), dtype=np.float32)
+        for row, query in enumerate(queries):
+            counts = Counter(term for term in tokenize(query) if term in self._vocabulary)
+            if not counts:
+                continue
+            columns = np.array([self._vocabulary[term] for term in counts])
+            weights = np.array([1 + math.log(count) for count in counts.values()], dtype=np.float32) * idf[columns]
+            result[row] = weights @ components[columns]
+        norms = np.linalg.norm(result, axis=1, keepdims=True)
+        return result / np.where(norms > 0, norms, 1)
+
+    def search(self, query: str, company: Optional[str] = None, years: Optional[Iterable] = None,
+               forms: Optional[Iterable[str]] = None, k: int = 10, probes: int = DEFAULT_PROBES) -> List[SearchHit]:
+        """
+        Rank passages by cosine similarity to a query
+
+        Args:
+            query (str): Free-text query
+            company (str): Only this company (name, ticker or CIK)
+            years (Iterable): Only these filing years
+            forms (Iterable[str]): Only these forms ("10-K", "8-K", "10-Q")
+            k (int): Number of hits to return
+            probes (int): Inverted lists scored when the filters leave many passages
+
+        Returns:
+            List[SearchHit]: Best passages first
+        """
+        return self.search_batch([query], company=company, years=years, forms=forms, k=k, probes=probes)[0]
+
+    def search_batch(self, queries: Sequence[str], company: Optional[str] = None, years: Optional[Iterable] = None,
+                     forms: Optional[Iterable[str]] = None, k: int = 10,
+                     probes: int = DEFAULT_PROBES) -> List[List[SearchHit]]:
+        """
+        Rank passages for several queries with one pass over the candidate vectors
+
+        Filters that leave at most EXACT_SCAN_LIMIT passages (e.g. one company's 10-Ks) are
+        searched exhaustively. Otherwise the probes lists closest to each query are scored.
+
+        Returns:
+            List[List[SearchHit]]: Hits for each query, in query order
+        """
+        if not queries:
+            return []
+        query_vectors = self.embed(queries)
+        allowed = self._filter_mask(company, years, forms)
+
+        if allowed is not None and allowed.sum() <= EXACT_SCAN_LIMIT:
+            candidates = np.flatnonzero(allowed)
+        else:
+            centroid_scores = query_vectors @ self._arrays['centroids'].T
+            probes = min(probes, centroid_scores.shape[1])
+            nearest = np.unique(np.argpartition(-centroid_scores, probes - 1, axis=1)[:, :probes])
+            list_starts = self._arrays['list_starts']
+            candidates = np.concatenate([np.arange(list_starts[cluster], list_starts[cluster + 1])
+                                         for cluster in nearest])
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+        if not len(candidates):
+            return [[] for _ in queries]
+
+        vectors = self._arrays['vectors'][candidates].astype(np.float32)
+        if 'scales' in self._arrays:
+            vectors *= self._arrays['scales'][candidates, None]
+        scores = query_vectors @ vectors.T
+
+        results = []
+        count = min(k, len(candidates))
+        for row, query_scores in enumerate(scores):
+            if not query_vectors[row].any():
+                results.append([])
+                continue
+            top = np.argpartition(-query_scores, count - 1)[:count]
+            top = top[np.argsort(-query_scores[top])]
+            results.append([self._hit(int(candidates[position]), float(query_scores[position])) for position in top])
+        return results
+
+    def passage(self, doc_id: int) -> str:
+        """Text of one passage"""
+        start = int(self._arrays['text_start'][doc_id])
+        return self._arrays['text'][start:start + int(self._arrays['text_length'][doc_id])].tobytes().decode('utf-8')
+
+    def _filter_mask(self, company: Optional[str], years: Optional[Iterable],
+                     forms: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        """Boolean mask of the passages the filters allow; None when there are no filters"""
+        mask = None
+        if company is not None:
+            resolved = get_resolver().resolve(company)
+            key = resolved.key if resolved else company
+            if key not in self.companies:
+                return np.zeros(self.n_docs, dtype=bool)
+            mask = self._arrays['doc_company'] == self.companies.index(key)
+        if forms:
+            form_ids = [FORMS.index(name) for name in map(normalize_form, forms) if name]
+            form_mask = np.isin(self._arrays['doc_form'], form_ids)
+            mask = form_mask if mask is None else mask & form_mask
+        if years:
+            year_mask = np.isin(self._arrays['doc_year'], [int(year) for year in years])
+            mask = year_mask if mask is None else mask & year_mask
+        return mask
+
+    def _hit(self, doc_id: int, score: float) -> SearchHit:
+        year = int(self._arrays['doc_year'][doc_id])
+        return SearchHit(
+            score=round(score, 4),
+            company=self.companies[self._arrays['doc_company'][doc_id]],
+            form=FORMS[self._arrays['doc_form'][doc_id]],
+            year=str(year) if year else '',
+            period=PERIODS[self._arrays['doc_period'][doc_id]],
+            section=self.sections[self._arrays['doc_section'][doc_id]],
+            text=self.passage(doc_id),
+            source=self.header['sources'][self._arrays['doc_source'][doc_id]][0]
+        )
+
+
+_refresher = IndexRefresher('semantic index', SemanticIndex,
+                            lambda: SemanticIndex.build(dtype=os.getenv('SEMANTIC_INDEX_DTYPE', 'float16')),
+                            float(os.getenv('SEMANTIC_INDEX_REFRESH', STALE_CHECK_INTERVAL)))
+
+
+def get_semantic_index(wait: bool = False) -> SemanticIndex:
+    """
+    Return the process-wide semantic index
+
+    The index is built in the background when missing, and rebuilt there when the source
+    files change (checked every SEMANTIC_INDEX_REFRESH seconds); the current index keeps
+    serving until the new one replaces it. The build takes over a minute, so it is best
+    run ahead of time with "python semantic_index.py --rebuild".
+
+    Args:
+        wait (bool): Build or rebuild now if needed and wait for it (for the CLI)
+
+    Raises:
+        IndexUnavailable: If the index has not been built yet and wait is not set
+    """
+    return _refresher.get(wait=wait)
+
+
+def semantic_search(query: str, company: Optional[str] = None, years: Optional[Iterable] = None,
+                    forms: Optional[Iterable[str]] = None, k: int = 10) -> List[SearchHit]:
+    """Search the process-wide semantic index (see SemanticIndex.search)"""
+    return get_semantic_index().search(query, company=company, years=years, forms=forms, k=k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the semantic passage index')
+    parser.add_argument('query', nargs='?', help='Search query (omit to only build the index)')
+    parser.add_argument('--company', help='Company name, ticker or CIK')
+    parser.add_argument('--years', nargs='+', help='Filing years')
+    parser.add_argument('--forms', nargs='+', help='Forms: 10-K, 8-K, 10-Q')
+    parser.add_argument('-k', type=int, default=5, help='Number of hits')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index first')
+    parser.add_argument('--dimensions', type=int, default=DEFAULT_DIMENSIONS, help='SVD components (with --rebuild)')
+    parser.add_argument('--dtype', choices=['float16', 'int8'], default=os.getenv('SEMANTIC_INDEX_DTYPE', 'float16'),
+                        help='Stored vector type (with --rebuild)')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index = SemanticIndex.build(dimensions=args.dimensions, dtype=args.dtype) if args.rebuild else get_semantic_index(wait=True)
+    print(f"📦 {index.n_docs} passages, {index.dimensions} dimensions in {index.path} "
+          f"({time.perf_counter() - start_time:.1f}s)")
+    if not args.query:
+        return
+
+    start_time = time.perf_counter()
+    hits = index.search(args.query, company=args.company, years=args.years, forms=args.forms, k=args.k)
+    print(f"🔍 {len(hits)} hit(s) in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+    for rank, hit in enumerate(hits, 1):
+        period = f" {hit.period}" if hit.period else ''
+        print(f"\n{rank}. [{hit.score:.3f}] {hit.company} {hit.form} {hit.year}{period} - {hit.section}")
+        print(f"   {hit.text[:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Single-Flight Call Coalescing
+Concurrent calls with the same key share one execution and its result
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """An in-flight execution that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._counters = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn for key, or wait for the call already running for that key
+
+        Args:
+            key (Hashable): Identity of the computation
+            fn (Callable): Zero-argument function producing the result
+
+        Returns:
+            Tuple[Any, bool]: The result and whether it was shared from another caller's run
+
+        Raises:
+            Exception: Whatever fn raised, re-raised in every waiting caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                call.followers += 1
+                self._counters['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def stats(self) -> Dict:
+        """Return executed/coalesced counters and the number of calls in flight"""
+        with self._lock:
+            return {**self._counters, 'in_flight': len(self._calls)}
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Slice Summarizer
+Map step of map-reduce 10-K analysis: every (year, item) slice of a multi-year query is
+summarized in parallel on a bounded thread pool, with summaries cached on disk by slice
+content so later queries over the same years and items reuse them
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from context_packer import Sections, compress_text
+from filing_corpus import split_paragraphs
+from mock_gemini import active_backend
+from single_flight import SingleFlight
+from token_counter import count_tokens
+from tool_result import add_token_usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent / 'cache' / 'slice_summaries.db'
+MAP_REDUCE_MODES = ('auto', 'always', 'off')
+
+PROMPT_VERSION = 1          # part of the cache key; bump when SUMMARY_PROMPT changes
+MAX_SLICE_TOKENS = 30000    # longer items are summarized in pieces of at most this size
+FALLBACK_TOKENS = 1500      # excerpt used for a slice whose summary call failed
+
+SUMMARY_PROMPT = """You are summarizing one section of a 10-K filing so that it can later be compared with the same section from other years.
+
+Company: {company}
+Fiscal year: {year}
+Section: {section}{piece}
+
+Write a dense factual summary of at most about 500 words that keeps:
+- every figure, percentage and date, with what it measures
+- every named risk, product, segment, customer, market, regulation and legal matter
+- statements of change (new, increased, decreased, discontinued) as the filing makes them
+Use only the text below. Do not add commentary, comparisons or information from other years.
+
+SECTION TEXT:
+{text}
+"""
+
+
+class SummaryCache:
+    """Thread-safe SQLite cache of slice summaries keyed by a hash of the prompt inputs"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Open (and create if needed) the cache
+
+        Args:
+            db_path (str): SQLite file (default SLICE_SUMMARY_CACHE_PATH or cache/slice_summaries.db)
+        """
+        self.db_path = Path(db_path or os.getenv('SLICE_SUMMARY_CACHE_PATH') or DEFAULT_DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0}
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, company TEXT NOT NULL, year TEXT NOT NULL, item TEXT NOT NULL, "
+                "model TEXT NOT NULL, summary TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(model: str, company: str, year: str, item: str, piece: str, text: str) -> str:
+        """Cache key of one summary call: everything its prompt and answer depend on, backend included"""
+        digest = hashlib.sha256()
+        backend = active_backend()
+        # Mock summaries are keyed apart from the real model's (google keys are unchanged)
+        values = (str(PROMPT_VERSION), model, company, year, item, piece, text)
+        for value in values if backend == 'google' else (backend,) + values:
+            digest.update(value.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            self._counters['hits' if row else 'misses'] += 1
+        return row[0] if row else None
+
+    def put(self, key: str, company: str, year: str, item: str, model: str, summary: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, company, year, item, model, summary, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, company, year, item, model, summary, time.time())
+            )
+            self._counters['writes'] += 1
+
+    def stats(self) -> Dict:
+        """Return hit/miss/write counters and the number of stored summaries"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            return {**self._counters, 'entries': entries}
+
+
+_cache: Optional[SummaryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    """Return the process-wide summary cache, opening it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SummaryCache()
+    return _cache
+
+
+def map_reduce_mode() -> str:
+    """TENK_MAP_REDUCE: 'auto' (multi-year queries), 'always' or 'off'"""
+    mode = os.getenv('TENK_MAP_REDUCE', 'auto').lower()
+    return mode if mode in MAP_REDUCE_MODES else 'auto'
+
+
+@dataclass
+class _Piece:
+    year: str
+    part: str
+    item: str
+    label: str      # "" or " (part 2 of 3)"
+    text: str
+    key: str
+
+
+@dataclass
+class MapStats:
+    """What the map step did"""
+    slices: int = 0
+    pieces: int = 0
+    cached: int = 0
+    summarized: int = 0
+    coalesced: int = 0          # shared with an identical call already running
+    failed: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    workers: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), 'seconds': round(self.seconds, 2)}
+
+
+def split_slice(text: str, max_tokens: int = MAX_SLICE_TOKENS) -> List[str]:
+    """Split an oversized slice at paragraph boundaries into pieces of at most max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current, current_tokens = [], [], 0
+    for paragraph in split_paragraphs(text):
+        tokens = count_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+    if current:
+        pieces.append('\n\n'.join(current))
+    return pieces
+
+
+class SliceSummarizer:
+    """Summarizes the (year, item) slices of a query in parallel, reusing cached summaries"""
+
+    def __init__(self, model, workers: Optional[int] = None, cache: Optional[SummaryCache] = None):
+        """
+        Initialize the summarizer
+
+        Args:
+            model: Model wrapper for the summary calls (e.g. get_model_for('10k_summary'))
+            workers (int): Concurrent summary calls (default SLICE_WORKERS or 8)
+            cache (SummaryCache): Summary cache (default the process-wide one)
+        """
+        self.model = model
+        self.workers = int(workers or os.getenv('SLICE_WORKERS', '8'))
+        self.cache = cache or get_summary_cache()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='slice-summary')
+        self.flights = SingleFlight()
+
+    def applies(self, sections: Sections) -> bool:
+        """Whether a query's sections should go through map-reduce (see map_reduce_mode)"""
+        mode = map_reduce_mode()
+        return mode == 'always' or (mode == 'auto' and len(sections) > 1)
+
+    def summarize(self, sections: Sections, company: str, query: str = '',
+                  usage: Optional[Dict] = None) -> Tuple[Sections, MapStats]:
+        """
+        Replace every section's content with its summary
+
+        Cached summaries are used as they are; the rest are requested at most `workers` at a
+        time. Items longer than MAX_SLICE_TOKENS are summarized in pieces whose summaries are
+        joined in order. A slice whose call fails is represented by an extractive excerpt
+        (context_packer.compress_text) instead, so the reduce step still sees it.
+
+        Args:
+            sections (Sections): Year -> part -> item -> content from collect_sections
+            company (str): Company name for the prompts and the cache key
+            query (str): Query used to pick the excerpt of a failed slice
+            usage (Dict): Optional token usage totals to update
+
+        Returns:
+            Tuple[Sections, MapStats]: Summaries in the same shape, and what the map step did
+        """
+        start_time = time.perf_counter()
+        model_name = getattr(self.model, 'model_name', type(self.model).__name__)
+        stats = MapStats(workers=self.workers)
+
+        pieces: List[_Piece] = []
+        for year, parts in sections.items():
+            for part, items in parts.items():
+                for item, content in items.items():
+                    text = content if isinstance(content, str) else json.dumps(content, indent=2)
+                    stats.slices += 1
+                    stats.tokens_in += count_tokens(text)
+                    split = split_slice(text)
+                    for number, piece in enumerate(split, 1):
+                        label = f" (part {number} of {len(split)})" if len(split) > 1 else ''
+                        key = SummaryCache.make_key(model_name, company, year, item, label, piece)
+                        pieces.append(_Piece(year, part, item, label, piece, key))
+        stats.pieces = len(pieces)
+
+        results: Dict[int, str] = {}
+        futures = {}
+        for index, piece in enumerate(pieces):
+            cached = self.cache.get(piece.key)
+            if cached is not None:
+                results[index] = cached
+                stats.cached += 1
+            else:
+                # The copied context carries the caller's llm_client.call_deadline into the pool
+                futures[index] = self.executor.submit(contextvars.copy_context().run, self.flights.do, piece.key,
+                                                      lambda piece=piece: self._summarize(piece, company, model_name))
+
+        for index, future in futures.items():
+            piece = pieces[index]
+            try:
+                (summary, call_usage), shared = future.result()
+            except Exception as e:
+                logger.warning(f"Summary of {company} {piece.year} {piece.item}{piece.label} failed: {e}")
+                stats.failed += 1
+                results[index] = ("[Summary unavailable; key excerpts of the section]\n"
+                                  + compress_text(piece.text, query, FALLBACK_TOKENS))
+                continue
+            results[index] = summary
+            if shared:
+                stats.coalesced += 1
+            elif call_usage is None:
+                stats.cached += 1
+            else:
+                stats.summarized += 1
+                if usage is not None:
+                    for key, count in call_usage.items():
+                        usage[key] = usage.get(key, 0) + count
+
+        summaries: Sections = {}
+        for index, piece in enumerate(pieces):
+            item_summaries = summaries.setdefault(piece.year, {}).setdefault(piece.part, {})
+            previous = item_summaries.get(piece.item)
+            item_summaries[piece.item] = f"{previous}\n\n{results[index]}" if previous else results[index]
+        stats.tokens_out = sum(count_tokens(text) for text in results.values())
+        stats.seconds = time.perf_counter() - start_time
+        return summaries, stats
+
+    def _summarize(self, piece: _Piece, company: str, model_name: str) -> Tuple[str, Optional[Dict[str, int]]]:
+        """One summary call, cached before it is returned (usage is None if another call just cached it)"""
+        # A call for the same piece may have finished between the cache check and this flight
+        cached = self.cache.get(piece.key)
+        if cached is not None:
+            return cached, None
+        prompt = SUMMARY_PROMPT.format(company=company, year=piece.year, section=piece.item,
+                                       piece=piece.label, text=piece.text)
+        call_usage: Dict[str, int] = {}
+        response = self.model.generate_content(prompt)
+        add_token_usage(call_usage, response)
+        summary = (response.text or '').strip()
+        if not summary:
+            raise ValueError('empty summary')
+        self.cache.put(piece.key, company, piece.year, piece.item, model_name, summary)
+        return summary, call_usage
@@ -17,13 +17,25 @@ def test_api():
     print("=" * 60)
     
     try:
-        # Send request
-        response = requests.post(url, json={"query": test_query}, timeout=180)
+        # Queue the analysis job
+        response = requests.post(url, json={"query": test_query}, timeout=30)
         
         print(f"Status Code: {response.status_code}")
         
-        if response.status_code == 200:
-            data = response.json()
+        if response.status_code in (200, 202):
+            job = response.json()
+            print(f"Job ID: {job['job_id']} ({job['status']})")
+            
+            # Poll until the job finishes
+            deadline = time.time() + 180
+            while job['status'] in ('queued', 'running'):
+                if time.time() > deadline:
+                    raise requests.exceptions.Timeout()
+                time.sleep(2)
+                job = requests.get(f"http://localhost:5000{job['status_url']}", timeout=30).json()
+            
+            print(f"Job Status: {job['status']}")
+            data = job.get('result') or {}
             
             print("\n✅ API Response Structure:")
             print(f"  - Query: {data.get('query', 'N/A')}")
@@ -0,0 +1,6 @@
+"""Shared pytest setup: the modules live at the repository root"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,85 @@
+"""Tests for the analysis job queue"""
+
+import threading
+import time
+
+import pytest
+
+from analysis_jobs import AnalysisJobManager, QueueFullError
+
+
+def wait_finished(job, timeout=5):
+    for event in job.iter_events(heartbeat=timeout):
+        if event is None:
+            break
+    assert job.is_finished
+
+
+def test_identical_queries_coalesce_and_all_see_a_runner_exception():
+    release = threading.Event()
+
+    def runner(query, progress, deadline):
+        release.wait(5)
+        raise RuntimeError('tool crashed')
+
+    manager = AnalysisJobManager(runner, max_workers=1)
+    first = manager.submit('Apple risks', key='apple risks')
+    second = manager.submit('apple risks?', key='apple risks')
+    assert second is first
+    assert manager.stats()['coalesced'] == 1
+
+    release.set()
+    wait_finished(first)
+    assert first.status == 'failed'
+    assert first.error == 'tool crashed'
+    assert first.to_dict()['result'] is None
+
+    # The key is released, so the next identical query starts a new run
+    assert manager.submit('Apple risks', key='apple risks') is not first
+    manager.shutdown()
+
+
+def test_failure_callback_error_still_finishes_the_job():
+    def on_failure(job):
+        raise ValueError('callback broke')
+
+    manager = AnalysisJobManager(lambda query, progress, deadline: None, on_failure=on_failure)
+    job = manager.submit('Apple risks', key='apple risks')
+    wait_finished(job)
+
+    assert job.status == 'failed'
+    assert job.error == 'Analysis failed'
+    assert manager.in_flight == {}
+    manager.shutdown()
+
+
+def test_completed_job_publishes_progress_and_result():
+    def runner(query, progress, deadline):
+        progress('tool_started', {'tool': 'sec_tools'})
+        return {'answer': query.upper()}
+
+    completed = []
+    manager = AnalysisJobManager(runner, on_complete=completed.append)
+    job = manager.submit('apple')
+    wait_finished(job)
+
+    assert [event['event'] for event in job.events] == ['started', 'tool_started', 'completed']
+    assert job.result == {'answer': 'APPLE'}
+    assert completed == [job]
+    manager.shutdown()
+
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+    manager = AnalysisJobManager(lambda query, progress, deadline: release.wait(5) and {}, max_workers=1,
+                                 max_queue_depth=1)
+    manager.submit('running')
+    # Wait for the first job to leave the queue so only the second one counts as queued
+    while manager.stats()['jobs']['queued']:
+        time.sleep(0.01)
+    manager.submit('queued')
+
+    with pytest.raises(QueueFullError):
+        manager.submit('rejected')
+    release.set()
+    manager.shutdown(wait=True)
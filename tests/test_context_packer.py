@@ -0,0 +1,60 @@
+"""Tests for packing 10-K sections and tool reports into a token budget"""
+
+import copy
+
+from context_packer import OMITTED_MARKER, _bm25, pack_sections, pack_sources
+from token_counter import count_tokens
+
+FILLER = 'The company operates retail stores and online channels across several regions. '
+
+
+def make_sections():
+    return {'2024': {'Part I': {
+        'Item 1. Business': '\n\n'.join(FILLER * 8 for _ in range(6)),
+        'Item 1A. Risk Factors': '\n\n'.join([FILLER * 8] * 3 + [
+            'Supply chain disruption could delay shipments and raise component costs. ' * 6
+        ]),
+        'Item 5. Market': {'ticker': 'ACME', 'exchange': 'NYSE'}
+    }}}
+
+
+def test_sections_under_budget_are_returned_unchanged():
+    sections = make_sections()
+    packed, stats = pack_sections(sections, 'supply chain', budget=100000)
+
+    assert packed is sections
+    assert not stats.packed
+
+
+def test_packing_keeps_relevant_text_without_touching_the_input():
+    sections = make_sections()
+    original = copy.deepcopy(sections)
+    packed, stats = pack_sections(sections, 'supply chain disruption', budget=300)
+
+    assert sections == original
+    items = packed['2024']['Part I']
+    assert 'Supply chain disruption' in items['Item 1A. Risk Factors']
+    assert items['Item 1. Business'] == OMITTED_MARKER
+    assert items['Item 5. Market'] == {'ticker': 'ACME', 'exchange': 'NYSE'}
+    assert stats.packed
+    assert stats.tokens_after <= 300 < stats.tokens_before
+    assert stats.items_omitted == ['2024 Item 1. Business']
+
+
+def test_bm25_prefers_matching_and_rarer_terms():
+    texts = ['apple iphone sales', 'apple services revenue', 'microsoft azure cloud']
+    scores = _bm25(texts, 'apple cloud')
+
+    assert scores[2] > scores[0] == scores[1] > 0
+    assert _bm25(texts, 'the of and') == [0.0, 0.0, 0.0]
+
+
+def test_pack_sources_fits_the_budget_and_keeps_short_reports_whole():
+    short = 'Insider sales were small.'
+    long = ' '.join(f'Sentence {i} about supply chain risk and revenue of {i} million.' for i in range(200))
+    packed, report = pack_sources([short, long], 'supply chain risk', budget=500)
+
+    assert packed[0] == short
+    assert not report[0].compressed and report[1].compressed
+    assert count_tokens(packed[1]) == report[1].tokens_after <= report[1].budget
+    assert sum(allocation.budget for allocation in report) <= 500
@@ -0,0 +1,43 @@
+"""Tests for the Gemini response cache"""
+
+from types import SimpleNamespace
+
+from llm_cache import LLMCache
+
+
+def test_key_depends_on_model_prompt_and_config(tmp_path, monkeypatch):
+    monkeypatch.delenv('GEMINI_BACKEND', raising=False)
+    cache = LLMCache(directory=str(tmp_path), mode='readwrite')
+    key = cache.make_key('gemini-2.5-flash', 'prompt', {'temperature': 0})
+
+    assert key == cache.make_key('gemini-2.5-flash', 'prompt', {'temperature': 0})
+    assert key != cache.make_key('gemini-2.5-pro', 'prompt', {'temperature': 0})
+    assert key != cache.make_key('gemini-2.5-flash', 'other prompt', {'temperature': 0})
+    assert key != cache.make_key('gemini-2.5-flash', 'prompt', {'temperature': 1})
+
+
+def test_mock_backend_keys_are_kept_apart(tmp_path, monkeypatch):
+    cache = LLMCache(directory=str(tmp_path), mode='readwrite')
+    monkeypatch.setenv('GEMINI_BACKEND', 'google')
+    google_key = cache.make_key('gemini-2.5-flash', 'prompt')
+    monkeypatch.setenv('GEMINI_BACKEND', 'mock')
+    mock_key = cache.make_key('gemini-2.5-flash', 'prompt')
+
+    assert mock_key != google_key
+    monkeypatch.delenv('GEMINI_BACKEND')
+    assert cache.make_key('gemini-2.5-flash', 'prompt') == google_key
+
+
+def test_set_then_get_round_trips(tmp_path):
+    cache = LLMCache(directory=str(tmp_path), mode='readwrite')
+    key = cache.make_key('gemini-2.5-flash', 'prompt')
+    assert cache.get(key) is None
+
+    cache.set(key, 'gemini-2.5-flash', 'answer', SimpleNamespace(prompt_token_count=3, candidates_token_count=1,
+                                                                 total_token_count=4))
+    cached = cache.get(key)
+
+    assert cached.text == 'answer'
+    assert cached.usage_metadata.total_token_count == 4
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
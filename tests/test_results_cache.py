@@ -0,0 +1,33 @@
+"""Tests for the analysis results cache"""
+
+from results_cache import ResultsCache
+
+
+def test_alias_and_case_variants_share_a_key(monkeypatch):
+    monkeypatch.delenv('GEMINI_BACKEND', raising=False)
+    cache = ResultsCache()
+
+    assert cache.make_key("Apple's risk factors in 2023") == cache.make_key('apple inc risk factors in 2023')
+    assert cache.make_key('Apple risk factors 2023') != cache.make_key('Apple risk factors 2024')
+
+
+def test_mock_backend_results_are_kept_apart(monkeypatch):
+    cache = ResultsCache()
+    monkeypatch.setenv('GEMINI_BACKEND', 'google')
+    cache.set('Apple risk factors', {'answer': 'real'})
+
+    monkeypatch.setenv('GEMINI_BACKEND', 'mock')
+    assert cache.get('Apple risk factors') is None
+    cache.set('Apple risk factors', {'answer': 'mock'})
+    assert cache.get('Apple risk factors') == {'answer': 'mock'}
+
+    monkeypatch.setenv('GEMINI_BACKEND', 'google')
+    assert cache.get('Apple risk factors') == {'answer': 'real'}
+
+
+def test_disk_tier_survives_a_restart(tmp_path, monkeypatch):
+    monkeypatch.delenv('GEMINI_BACKEND', raising=False)
+    db_path = str(tmp_path / 'results.sqlite3')
+    ResultsCache(db_path=db_path).set('Microsoft segments', {'answer': 42})
+
+    assert ResultsCache(db_path=db_path).get('Microsoft segments') == {'answer': 42}
@@ -0,0 +1,114 @@
+"""Tests for the BM25 passage index and its background refresher"""
+
+import json
+import threading
+
+import pytest
+
+from filing_corpus import Source
+from index_refresher import IndexRefresher, IndexUnavailable
+from search_index import SearchIndex, tokenize
+
+
+def write_10k(path, sections):
+    path.write_text(json.dumps({'years_data': {
+        year: {'content': {'parts': [{'part_name': 'Part I', 'sections': [
+            {'category': item, 'content': text} for item, text in items.items()
+        ]}]}} for year, items in sections.items()
+    }}), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    apple = write_10k(tmp_path / 'apple.json', {
+        '2023': {'Item 1A. Risk Factors': 'Supply chain disruption in Asia could delay iPhone shipments.',
+                 'Item 1. Business': 'Apple designs phones, computers and wearables.'},
+        '2024': {'Item 1. Business': 'Apple sells services such as the App Store and iCloud.'}
+    })
+    microsoft = write_10k(tmp_path / 'microsoft.json', {
+        '2024': {'Item 1A. Risk Factors': 'Cloud outages and cybersecurity incidents could harm Azure.',
+                 'Item 5. Market': 'The share repurchase program returned cash to shareholders.'}
+    })
+    sources = [Source('Apple_Inc', '10-K', 'gemini_10k', apple),
+               Source('MICROSOFT_CORP', '10-K', 'gemini_10k', microsoft)]
+    return SearchIndex.build(str(tmp_path / 'index.bin'), sources)
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize('The Risks of Liabilities') == ['risk', 'liability']
+
+
+def test_best_passage_ranks_first(index):
+    hits = index.search('supply chain disruption', k=3)
+
+    assert hits[0].company == 'Apple_Inc'
+    assert 'Supply chain disruption' in hits[0].text
+    assert all(hit.score > 0 for hit in hits)
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+
+def test_rarer_terms_weigh_more(index):
+    # "cloud" appears in one passage, "apple" in two: the cloud passage must win
+    hits = index.search('apple cloud', k=5)
+
+    assert 'Cloud outages' in hits[0].text
+
+
+def test_filters_restrict_hits(index):
+    assert {hit.company for hit in index.search('risk', company='Microsoft')} == {'MICROSOFT_CORP'}
+    assert {hit.year for hit in index.search('apple', years=[2024])} == {'2024'}
+    assert index.search('apple', forms=['8-K']) == []
+    assert index.search('nonexistentterm') == []
+
+
+def test_reopened_file_gives_the_same_hits(index):
+    reopened = SearchIndex(str(index.path))
+
+    assert reopened.search('share repurchase') == index.search('share repurchase')
+
+
+class FakeIndex:
+    def __init__(self, stale=False):
+        self.stale = stale
+
+    def is_stale(self):
+        return self.stale
+
+
+def test_refresher_builds_in_the_background_and_serves_the_old_index():
+    release = threading.Event()
+    built = []
+
+    def missing():
+        raise OSError('no index file')
+
+    def build():
+        release.wait(5)
+        built.append(FakeIndex())
+        return built[-1]
+
+    refresher = IndexRefresher('test index', missing, build, check_interval=0.01)
+    with pytest.raises(IndexUnavailable):
+        refresher.get()
+    release.set()
+    refresher._worker.join(5)
+    first = refresher.get()
+    assert first is built[0]
+
+    # A stale index keeps being served until its replacement is ready
+    release.clear()
+    first.stale = True
+    refresher._checked_at = 0.0
+    assert refresher.get() is first
+    release.set()
+    refresher._worker.join(5)
+    assert refresher.get() is built[1]
+
+
+def test_refresher_wait_builds_on_the_calling_thread():
+    refresher = IndexRefresher('test index', FakeIndex, FakeIndex, check_interval=0)
+    index = refresher.get(wait=True)
+
+    assert isinstance(index, FakeIndex)
+    assert refresher._worker is None
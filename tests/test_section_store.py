@@ -0,0 +1,52 @@
+"""Tests for the 10-K section store"""
+
+import json
+import os
+
+from section_store import SectionStore
+
+
+def write_10k(path, risk_text):
+    path.write_text(json.dumps({
+        'company_name': 'Acme Corp',
+        'years_data': {
+            '2024': {'content': {'parts': [
+                {'part_name': 'Part I', 'sections': [
+                    {'category': 'Item 1. Business', 'content': 'Acme sells anvils.'},
+                    {'category': 'Item 1A. Risk Factors', 'content': risk_text}
+                ]},
+                {'part_name': 'Part II', 'sections': [
+                    {'category': 'Item 8. Financial Statements', 'content': {'revenue': 10}}
+                ]}
+            ]}}
+        }
+    }), encoding='utf-8')
+
+
+def test_sections_read_back_in_filing_order(tmp_path):
+    source = tmp_path / 'Acme_Corp_10k.json'
+    write_10k(source, 'Anvils may fall.')
+    store = SectionStore(str(tmp_path / 'sections.db'))
+    company = store.sync(source)
+
+    assert store.years(company) == ['2024']
+    assert store.parts(company, '2024') == ['Part I', 'Part II']
+    assert store.get_section(company, '2024', 'Part I', 'Item 1A. Risk Factors') == 'Anvils may fall.'
+    assert store.get_part(company, '2024', 'Part II') == {'Item 8. Financial Statements': {'revenue': 10}}
+    assert list(store.get_year(company, '2024')['Part I']) == ['Item 1. Business', 'Item 1A. Risk Factors']
+    assert store.get_section(company, '2024', 'Part I', 'Item 7. MD&A') is None
+
+
+def test_changed_file_is_reingested(tmp_path):
+    source = tmp_path / 'Acme_Corp_10k.json'
+    write_10k(source, 'Anvils may fall.')
+    store = SectionStore(str(tmp_path / 'sections.db'))
+    company = store.sync(source)
+
+    write_10k(source, 'Anvils may fall on roadrunners.')
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    store.sync(source)
+
+    assert store.get_section(company, '2024', 'Part I', 'Item 1A. Risk Factors') == 'Anvils may fall on roadrunners.'
+    assert store.count(company) == 3
@@ -0,0 +1,47 @@
+"""Tests for the LSI passage index"""
+
+import json
+
+import pytest
+
+from filing_corpus import Source
+from semantic_index import SemanticIndex
+
+TOPICS = {
+    'Item 1A. Risk Factors': 'Supply chain disruption and component shortages could delay product shipments.',
+    'Item 1. Business': 'The company designs smartphones, personal computers, tablets and wearables.',
+    'Item 7. Management Discussion': 'Net sales grew because services revenue and gross margin increased.',
+    'Item 5. Market': 'The board approved a share repurchase program and raised the quarterly dividend.',
+    'Item 9A. Controls': 'Management concluded that internal control over financial reporting was effective.'
+}
+
+
+@pytest.fixture(params=['float16', 'int8'])
+def index(request, tmp_path):
+    path = tmp_path / 'tenk.json'
+    path.write_text(json.dumps({'years_data': {
+        str(year): {'content': {'parts': [{'part_name': 'Part I', 'sections': [
+            {'category': item, 'content': text} for item, text in TOPICS.items()
+        ]}]}} for year in (2022, 2023, 2024)
+    }}), encoding='utf-8')
+    return SemanticIndex.build(str(tmp_path / 'semantic.bin'), [Source('Apple_Inc', '10-K', 'gemini_10k', path)],
+                               dimensions=4, dtype=request.param)
+
+
+def test_closest_passage_ranks_first(index):
+    hits = index.search('component shortages delaying shipments', k=3)
+
+    assert 'Supply chain disruption' in hits[0].text
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+
+def test_batch_matches_single_queries(index):
+    queries = ['share repurchase and dividend', 'internal control over financial reporting']
+    batch = index.search_batch(queries, k=2)
+
+    for query, hits in zip(queries, batch):
+        assert [hit.text for hit in hits] == [hit.text for hit in index.search(query, k=2)]
+
+
+def test_year_filter(index):
+    assert {hit.year for hit in index.search('services revenue', years=[2023], k=5)} == {'2023'}
@@ -0,0 +1,37 @@
+"""Tests for the slice summary cache"""
+
+from slice_summarizer import SummaryCache
+
+
+def test_put_then_get_round_trips(tmp_path):
+    cache = SummaryCache(str(tmp_path / 'summaries.db'))
+    key = SummaryCache.make_key('gemini-2.5-flash', 'Apple_Inc', '2024', 'Item 1A', 'whole', 'risk text')
+    assert cache.get(key) is None
+
+    cache.put(key, 'Apple_Inc', '2024', 'Item 1A', 'gemini-2.5-flash', 'summary')
+
+    assert cache.get(key) == 'summary'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'writes': 1, 'entries': 1}
+    assert SummaryCache(str(tmp_path / 'summaries.db')).get(key) == 'summary'
+
+
+def test_key_depends_on_every_input(monkeypatch):
+    monkeypatch.delenv('GEMINI_BACKEND', raising=False)
+    inputs = ('gemini-2.5-flash', 'Apple_Inc', '2024', 'Item 1A', 'whole', 'risk text')
+    key = SummaryCache.make_key(*inputs)
+
+    for position in range(len(inputs)):
+        changed = list(inputs)
+        changed[position] += 'x'
+        assert SummaryCache.make_key(*changed) != key
+    # Fields are delimited, so moving text between them changes the key
+    assert SummaryCache.make_key('gemini-2.5-flash', 'Apple_Inc', '2024', 'Item 1', 'Awhole', 'risk text') != key
+
+
+def test_mock_backend_keys_are_kept_apart(monkeypatch):
+    inputs = ('gemini-2.5-flash', 'Apple_Inc', '2024', 'Item 1A', 'whole', 'risk text')
+    monkeypatch.setenv('GEMINI_BACKEND', 'google')
+    google_key = SummaryCache.make_key(*inputs)
+    monkeypatch.setenv('GEMINI_BACKEND', 'mock')
+
+    assert SummaryCache.make_key(*inputs) != google_key
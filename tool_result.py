@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+SEC Analysis AI - Tool Results
+Typed result object returned by the analysis tools, plus the JSON-RPC
+interface used to call a tool in a separate process
+"""
+
+import contextlib
+import inspect
+import json
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class ToolResult:
+    """Outcome of one analysis tool run"""
+    tool: str
+    query: str
+    success: bool
+    content: str = ''
+    error: Optional[str] = None
+    metadata: Dict = field(default_factory=dict)          # parameters, enhanced query, source file, ...
+    timings: Dict[str, float] = field(default_factory=dict)  # seconds per stage plus "total"
+    token_usage: Dict[str, int] = field(default_factory=dict)
+    output_file: Optional[str] = None                     # only set when the tool saved a file
+
+    @property
+    def execution_time(self) -> float:
+        return self.timings.get('total', 0.0)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ToolResult':
+        known = {name: data[name] for name in cls.__dataclass_fields__ if name in data}
+        return cls(**known)
+
+    @classmethod
+    def failure(cls, tool: str, query: str, error: str, **kwargs) -> 'ToolResult':
+        return cls(tool=tool, query=query, success=False, error=error, **kwargs)
+
+
+def add_token_usage(usage: Optional[Dict[str, int]], response) -> None:
+    """
+    Accumulate a Gemini response's token counts into a usage dict
+
+    Args:
+        usage (Dict): Running totals to update in place (ignored if None)
+        response: Gemini response (or last streamed chunk) carrying usage_metadata
+    """
+    if usage is None:
+        return
+    metadata = getattr(response, 'usage_metadata', None)
+    if not metadata:
+        return
+    for key, attr in (('prompt_tokens', 'prompt_token_count'),
+                      ('output_tokens', 'candidates_token_count'),
+                      ('total_tokens', 'total_token_count')):
+        usage[key] = usage.get(key, 0) + (getattr(metadata, attr, 0) or 0)
+
+
+class InvalidParamsError(Exception):
+    """Raised when a JSON-RPC request's params do not match the handler"""
+
+
+def serve_json_rpc(tool_name: str, handler: Callable[..., ToolResult]) -> None:
+    """
+    Answer JSON-RPC 2.0 requests read line by line from stdin
+
+    The only method is "analyze", whose params are passed to handler as keyword
+    arguments. Anything the tool prints while working is sent to stderr so that
+    stdout carries nothing but one JSON response per request.
+
+    Args:
+        tool_name (str): Tool name reported in errors
+        handler (Callable): Function returning a ToolResult, e.g. SECFormsTools.analyze_query
+    """
+    stdout = sys.stdout
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('method') != 'analyze':
+                response = {'error': {'code': -32601, 'message': f"Method not found: {request.get('method')}"}}
+            else:
+                params = request.get('params', {})
+                try:
+                    inspect.signature(handler).bind(**params)
+                except TypeError as e:
+                    raise InvalidParamsError(f"Invalid params: {e}")
+                with contextlib.redirect_stdout(sys.stderr):
+                    result = handler(**params)
+                response = {'result': result.to_dict()}
+        except json.JSONDecodeError as e:
+            response = {'error': {'code': -32700, 'message': f"Parse error: {e}"}}
+        except InvalidParamsError as e:
+            response = {'error': {'code': -32602, 'message': str(e)}}
+        except Exception as e:
+            response = {'error': {'code': -32000, 'message': f"{tool_name} failed: {e}"}}
+
+        stdout.write(json.dumps({'jsonrpc': '2.0', 'id': request_id, **response}) + '\n')
+        stdout.flush()
+
+
+def call_json_rpc(cmd: List[str], params: Dict, timeout: Optional[float] = None,
+                  env: Optional[Dict] = None) -> ToolResult:
+    """
+    Run a tool in a subprocess and call its "analyze" method over JSON-RPC
+
+    Args:
+        cmd (List[str]): Command that starts the tool in --rpc mode
+        params (Dict): Parameters for the analyze call (must include "query")
+        timeout (float): Seconds to wait for the tool
+        env (Dict): Environment for the subprocess
+
+    Returns:
+        ToolResult: The tool's result
+
+    Raises:
+        RuntimeError: If the tool exits without a valid response or returns an RPC error
+    """
+    request = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'analyze', 'params': params})
+    completed = subprocess.run(cmd, input=request + '\n', capture_output=True, text=True,
+                               encoding='utf-8', errors='replace', timeout=timeout, env=env)
+
+    response = None
+    for line in reversed(completed.stdout.splitlines()):
+        try:
+            response = json.loads(line)
+            break
+        except json.JSONDecodeError:
+            continue
+
+    if response is None:
+        raise RuntimeError(f"No JSON-RPC response (exit code {completed.returncode}): {completed.stderr[-500:]}")
+    if 'error' in response:
+        raise RuntimeError(response['error'].get('message', 'Unknown JSON-RPC error'))
+    return ToolResult.from_dict(response['result'])